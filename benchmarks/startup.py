@@ -0,0 +1,130 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Cold-start latency of the pyoptdb subcommands. Every command runs in a fresh
+# interpreter inside a temporary workspace; the script fails if a command is
+# slower than --max-seconds or imports pyomo although it does not need it.
+#
+#   python benchmarks/startup.py --repeat 10 --max-seconds 0.3
+
+from argparse import ArgumentParser
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# runs the command line interface and reports the imported pyomo modules
+CHILD = """
+import json, sys
+from pyoptdb.cli import main
+sys.argv = ["pyoptdb"] + json.loads(sys.argv[1])
+try:
+    main()
+except SystemExit:
+    pass
+sys.stderr.write("\\nPYOMO " + str(sum(m.startswith("pyomo") for m in sys.modules)))
+"""
+
+MODEL = """
+import pyomo.environ as pyo
+
+def pyomo_create_model():
+    model = pyo.ConcreteModel("startup")
+    model.I = pyo.Set(initialize=[1, 2])
+    model.x = pyo.Var(model.I)
+    return model
+"""
+
+# (name, arguments, may import pyomo)
+COMMANDS = [
+    ("help", ["--help"], False),
+    ("config", ["config", "--list"], False),
+    ("migrate", ["migrate"], False),
+    ("ingest", ["ingest", "--once"], False),
+    (
+        "insert --submit",
+        ["insert", "-m", "model.py", "-d", "data.dat", "--submit", "sol.yml"],
+        False,
+    ),
+    ("insert --help", ["insert", "--help"], False),
+]
+
+
+def _run(args: list, cwd: pathlib.Path, env: dict) -> tuple:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(args)],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    seconds = time.perf_counter() - start
+
+    pyomo_modules = int(proc.stderr.rsplit("PYOMO ", 1)[-1])
+    return seconds, pyomo_modules
+
+
+def main():
+    parser = ArgumentParser(description="cold-start latency of pyoptdb")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="fail if the median start-up time of a command exceeds this",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = pathlib.Path(tmp)
+        env = dict(os.environ, HOME=str(cwd / "home"))
+
+        (cwd / "model.py").write_text(MODEL)
+        (cwd / "data.dat").write_text("")
+        (cwd / "sol.yml").write_text("")
+        _run(["init"], cwd, env)
+
+        print(f"{'command':<20} {'median':>8} {'min':>8}  pyomo")
+        for name, cmd_args, may_import_pyomo in COMMANDS:
+            runs = [_run(cmd_args, cwd, env) for _ in range(args.repeat)]
+            seconds = [s for s, _ in runs]
+            pyomo_modules = max(n for _, n in runs)
+
+            median = statistics.median(seconds)
+            print(
+                f"{name:<20} {median:>8.3f} {min(seconds):>8.3f}  {pyomo_modules}"
+            )
+
+            if pyomo_modules and not may_import_pyomo:
+                print(f"  {name} imports pyomo", file=sys.stderr)
+                failed = True
+            if args.max_seconds is not None and median > args.max_seconds:
+                print(
+                    f"  {name} takes {median:.3f} s > {args.max_seconds} s",
+                    file=sys.stderr,
+                )
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
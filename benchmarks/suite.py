@@ -0,0 +1,428 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Synthetic benchmark of the insert and query paths. For every combination of
+# --entries (indexed variable entries per solution), --solutions and
+# --storage a model, data file and solution files are generated, inserted into
+# a fresh database and queried. Results are written as JSON, e.g.
+#
+#   python benchmarks/suite.py --entries 1000 100000 --solutions 1 100 \
+#       --output results.json
+#
+# Phases run in a separate process each: wall time and peak RSS are those of
+# the pyoptdb process. `insert` builds the model, `reinsert` inserts the same
+# solution files again through the stored variable labels. With --changes a
+# parameter sweep is simulated: every solution differs from the first one in
+# that fraction of the values (use with --storage delta).
+
+from argparse import ArgumentParser
+import datetime
+import importlib.metadata
+import importlib.util
+import itertools
+import json
+import os
+import pathlib
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODEL = '''"""synthetic benchmark model"""
+import pyomo.environ as pyo
+
+
+def pyomo_create_model():
+    m = pyo.AbstractModel(name="bench")
+    m.I = pyo.Set()
+    m.T = pyo.Set()
+    m.c = pyo.Param(m.I, m.T)
+    m.x = pyo.Var(m.I, m.T)
+    m.z = pyo.Var()
+    m.obj = pyo.Objective(expr=lambda m: m.z)
+    return m
+'''
+
+SOL_FORMATS = ("yml", "json", "sol")
+
+
+def _shape(entries: int) -> tuple:
+    # x is indexed by I x T with |T| <= 10
+    t = min(entries, 10)
+    return -(-entries // t), t
+
+
+def _labels(entries: int):
+    n_i, n_t = _shape(entries)
+    for i, t in itertools.islice(
+        itertools.product(range(1, n_i + 1), range(1, n_t + 1)), entries
+    ):
+        yield i, t, f"x[{i},{t}]"
+    yield None, None, "z"
+
+
+def _write_model(directory: pathlib.Path, entries: int, rng: random.Random):
+    (directory / "model.py").write_text(MODEL)
+
+    n_i, n_t = _shape(entries)
+    with open(directory / "data.dat", "w") as f:
+        f.write("set I := " + " ".join(map(str, range(1, n_i + 1))) + ";\n")
+        f.write("set T := " + " ".join(map(str, range(1, n_t + 1))) + ";\n")
+        f.write("param c :=\n")
+        for i, t in itertools.product(range(1, n_i + 1), range(1, n_t + 1)):
+            f.write(f"{i} {t} {rng.random():.6f}\n")
+        f.write(";\n")
+
+
+def _write_yml(filename: pathlib.Path, labels: list, values: list, objective: float):
+    with open(filename, "w") as f:
+        f.write(
+            "Solver: \n- Status: ok\n  Message: synthetic\n"
+            "  Termination condition: optimal\n  Time: 0.0\n"
+            "Solution: \n- number of solutions: 1\n  number of solutions displayed: 1\n"
+            f"- Gap: 0.0\n  Status: optimal\n  Objective:\n    obj:\n      Value: {objective}\n"
+            "  Variable:\n"
+        )
+        for label, value in zip(labels, values):
+            f.write(f"    {label}:\n      Value: {value}\n")
+        f.write("  Constraint: No values\n")
+
+
+def _write_json(filename: pathlib.Path, labels: list, values: list, objective: float):
+    results = {
+        "Solver": [
+            {
+                "Status": "ok",
+                "Message": "synthetic",
+                "Termination condition": "optimal",
+                "Time": 0.0,
+            }
+        ],
+        "Solution": [
+            {"number of solutions": 1, "number of solutions displayed": 1},
+            {
+                "Gap": 0.0,
+                "Status": "optimal",
+                "Objective": {"obj": {"Value": objective}},
+                "Variable": {
+                    label: {"Value": value} for label, value in zip(labels, values)
+                },
+                "Constraint": "No values",
+            },
+        ],
+    }
+    with open(filename, "w") as f:
+        json.dump(results, f)
+
+
+def _write_sol(filename: pathlib.Path, labels: list, values: list, objective: float):
+    # AMPL .sol file, the .col file with the labels is written once and linked
+    with open(filename, "w") as f:
+        f.write("synthetic: Optimal Solution Found\n\nOptions\n3\n1\n1\n0\n")
+        f.write(f"0\n0\n{len(values)}\n{len(values)}\n")
+        for value in values:
+            f.write(f"{value!r}\n")
+        f.write("objno 0 0\n")
+
+
+def _write_solutions(
+    directory: pathlib.Path,
+    entries: int,
+    n_solutions: int,
+    sol_format: str,
+    rng: random.Random,
+    changes: float = 1.0,
+) -> list:
+    labels = [label for _, _, label in _labels(entries)]
+    write = {"yml": _write_yml, "json": _write_json, "sol": _write_sol}[sol_format]
+
+    col_file = None
+    if sol_format == "sol":
+        col_file = directory / "labels.col"
+        col_file.write_text("".join(label + "\n" for label in labels))
+
+    sol_files = []
+    first = [rng.random() for _ in labels]
+    for k in range(n_solutions):
+        filename = directory / f"sol{k:06d}.{sol_format}"
+        values = list(first)
+        if k > 0:
+            for j in rng.sample(range(len(labels)), round(changes * len(labels))):
+                values[j] = rng.random()
+        write(filename, labels, values, objective=sum(values))
+        if col_file is not None:
+            os.link(col_file, filename.with_suffix(".col"))
+        sol_files.append(filename)
+    return sol_files
+
+
+def _run_pyoptdb(args: list, cwd: pathlib.Path, env: dict) -> dict:
+    # -> wall time and peak RSS of the pyoptdb process
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "pyoptdb", *args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    stderr = proc.stderr.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"pyoptdb {args[0]} failed:\n{stderr.decode()}")
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {"seconds": seconds, "peak_rss_bytes": rusage.ru_maxrss * scale}
+
+
+def _directory_size(directory: pathlib.Path) -> int:
+    return sum(p.stat().st_size for p in directory.rglob("*") if p.is_file())
+
+
+def _time(fn, repeat: int) -> dict:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return {"min": min(seconds), "median": statistics.median(seconds)}
+
+
+def _instance(workdir: pathlib.Path):
+    # the model files of all runs are named model.py, so it is loaded by path
+    spec = importlib.util.spec_from_file_location(
+        f"bench_model_{workdir.name}", workdir / "model.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.pyomo_create_model().create_instance(str(workdir / "data.dat"))
+
+
+def _queries(dbfile: pathlib.Path, storage: str, repeat: int, workdir: pathlib.Path) -> dict:
+    from pyoptdb import query, warmstart
+
+    con = query.connect(dbfile)
+    timings = {}
+    try:
+        solution_ids = [s.solution_id for s in query.solutions(con, limit=100)]
+        data_set_id = query.solutions(con, limit=1)[0].data_set_id
+
+        timings["solutions"] = _time(lambda: query.solutions(con), repeat)
+        timings["var_matrix"] = _time(
+            lambda: query.var_matrix(con, "x", solution_ids), repeat
+        )
+        timings["param_vector"] = _time(
+            lambda: query.param_vector(con, "c", data_set_id), repeat
+        )
+
+        instance = _instance(workdir)
+        timings["warm_start"] = _time(
+            lambda: warmstart.load_solution(instance, con, solution_ids[0]), repeat
+        )
+        loader = warmstart.Loader(instance)
+        timings["warm_start_loader"] = _time(
+            lambda: loader.load_solution(con, solution_ids[0]), repeat
+        )
+
+        if storage == "rows":
+            (var_id,) = con.execute(
+                "SELECT var_id FROM variables WHERE var_name='x'"
+            ).fetchone()
+            (param_id,) = con.execute(
+                "SELECT param_id FROM parameters WHERE param_name='c'"
+            ).fetchone()
+
+            timings["sql_variable_data_solution"] = _time(
+                lambda: con.execute(
+                    "SELECT index_str, value FROM variable_data "
+                    "WHERE solution_id=? AND var_id=?",
+                    (solution_ids[0], var_id),
+                ).fetchall(),
+                repeat,
+            )
+            timings["sql_variable_data_aggregate"] = _time(
+                lambda: con.execute(
+                    "SELECT index_str, AVG(value), MIN(value), MAX(value) "
+                    "FROM variable_data WHERE var_id=? GROUP BY index_str",
+                    (var_id,),
+                ).fetchall(),
+                repeat,
+            )
+            timings["sql_parameter_data"] = _time(
+                lambda: con.execute(
+                    "SELECT index_str, value FROM parameter_data "
+                    "WHERE data_set_id=? AND param_id=?",
+                    (data_set_id, param_id),
+                ).fetchall(),
+                repeat,
+            )
+    finally:
+        con.close()
+    return timings
+
+
+def _benchmark(
+    workdir: pathlib.Path,
+    entries: int,
+    n_solutions: int,
+    storage: str,
+    sol_format: str,
+    jobs: int,
+    repeat: int,
+    seed: int,
+    changes: float = 1.0,
+) -> dict:
+    rng = random.Random(seed)
+    env = dict(os.environ, HOME=str(workdir / "home"))
+
+    start = time.perf_counter()
+    _write_model(workdir, entries, rng)
+    sol_files = _write_solutions(
+        workdir, entries, n_solutions, sol_format, rng, changes=changes
+    )
+    generate_seconds = time.perf_counter() - start
+
+    manifest = workdir / "manifest.txt"
+    manifest.write_text("".join(f"{f}\n" for f in sol_files))
+
+    result = {
+        "entries": entries,
+        "solutions": n_solutions,
+        "storage": storage,
+        "sol_format": sol_format,
+        "jobs": jobs,
+        "changes": changes,
+        "generate_seconds": generate_seconds,
+        "solution_files_bytes": sum(f.stat().st_size for f in sol_files),
+        "phases": {},
+    }
+
+    _run_pyoptdb(["config", "sqlite3.storage", storage], workdir, env)
+    result["phases"]["init"] = _run_pyoptdb(["init"], workdir, env)
+
+    insert = ["insert", "-m", "model.py", "-d", "data.dat", "--manifest", str(manifest)]
+    insert += ["--jobs", str(jobs)]
+
+    # one value per indexed variable entry and one for z
+    values = n_solutions * (entries + 1)
+    for phase, extra in (("insert", ["--rebuild"]), ("reinsert", [])):
+        stats = _run_pyoptdb(insert + extra, workdir, env)
+        stats["rows_per_second"] = values / stats["seconds"]
+        stats["solutions_per_second"] = n_solutions / stats["seconds"]
+        result["phases"][phase] = stats
+
+        if phase == "insert":
+            dbfile = workdir / ".pyoptdb" / "pyoptdb.sqlite3"
+            result["database_bytes"] = dbfile.stat().st_size
+            result["archive_bytes"] = _directory_size(workdir / ".pyoptdb" / ".files")
+
+    result["queries"] = _queries(dbfile, storage, repeat, workdir)
+    return result
+
+
+def _metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=pathlib.Path(__file__).parent,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+
+    return {
+        "pyoptdb": importlib.metadata.version("pyoptdb"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def main():
+    parser = ArgumentParser(description="synthetic insert and query benchmark")
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--solutions", type=int, nargs="+", default=[1, 10])
+    parser.add_argument(
+        "--storage", nargs="+", default=["rows"], choices=["rows", "columnar", "delta"]
+    )
+    parser.add_argument("--sol-format", default="yml", choices=SOL_FORMATS)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument(
+        "--changes",
+        type=float,
+        default=1.0,
+        help="fraction of the values in which a solution differs from the first one",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="repetitions of each query"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="keep the generated files and databases here instead of a temporary directory",
+    )
+    parser.add_argument("--output", default=None, help="JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    report = {"metadata": _metadata(), "results": []}
+
+    for entries, n_solutions, storage in itertools.product(
+        args.entries, args.solutions, args.storage
+    ):
+        name = f"e{entries}-s{n_solutions}-{storage}"
+        print(f"running {name}", file=sys.stderr)
+
+        with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+            workdir = pathlib.Path(tmp)
+            if args.workdir is not None:
+                workdir = pathlib.Path(args.workdir) / name
+                workdir.mkdir(parents=True, exist_ok=False)
+
+            report["results"].append(
+                _benchmark(
+                    workdir,
+                    entries,
+                    n_solutions,
+                    storage,
+                    args.sol_format,
+                    args.jobs,
+                    args.repeat,
+                    args.seed,
+                    changes=args.changes,
+                )
+            )
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
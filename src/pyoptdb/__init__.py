@@ -14,10 +14,10 @@
 """
 
 from enum import Enum
-import logging
 from pathlib import Path
 
-logging.basicConfig(level=logging.DEBUG, filename="pyoptdb.log")
+# logging is configured by the command line interface (pyoptdb.cli), library
+# users configure it themselves
 
 __app_name__ = "pyoptdb"
 __version__ = "0.1.0"
@@ -37,3 +37,13 @@ class Command(Enum):
     config = 1
     init = 2
     insert = 3
+    migrate = 4
+    ingest = 5
+    export = 6
+    backup = 7
+    shards = 8
+    watch = 9
+    summary = 10
+    prune = 11
+    merge = 12
+    serve = 13
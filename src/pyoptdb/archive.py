@@ -0,0 +1,182 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Content-addressed file archive: files are stored once under their checksum,
+# hashed and copied in chunks, and optionally compressed.
+
+import bz2
+import dataclasses
+import gzip
+import hashlib
+import logging
+import lzma
+import os
+import pathlib
+import shutil
+import sqlite3
+import stat
+
+from pyoptdb.instrument import count, phase
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+
+# bound on the remembered checksums of a long lived archive
+CHECKSUM_CACHE_SIZE = 4096
+
+_COMPRESSION = {
+    "none": ("", open),
+    "gzip": (".gz", gzip.open),
+    "bz2": (".bz2", bz2.open),
+    "lzma": (".xz", lzma.open),
+}
+
+
+def _new_hash(algorithm: str):
+    if algorithm.startswith("xxh"):
+        # optional, much faster than any of the hashlib algorithms
+        import xxhash
+
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+@dataclasses.dataclass
+class Archive:
+    directory: pathlib.Path
+    algorithm: str = "md5"
+    compression: str = "none"
+    hardlink: bool = False
+    # (path, mtime, size) -> checksum, so files used repeatedly are hashed once
+    _checksums: dict = dataclasses.field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        if self.compression not in _COMPRESSION:
+            raise ValueError(
+                f"unknown archive.compression {self.compression}, expected one of "
+                + ", ".join(_COMPRESSION)
+            )
+        _new_hash(self.algorithm)
+
+    @classmethod
+    def from_config(cls, config):
+        directory = config["archive"].get("directory", None)
+        if directory is None:
+            raise ValueError("No legal name for file_archive.directory")
+
+        return cls(
+            directory=pathlib.Path(directory),
+            algorithm=config["archive"].get("hash", "md5"),
+            compression=config["archive"].get("compression", "none"),
+            hardlink=config["archive"].getboolean("hardlink", False),
+        )
+
+    def checksum(self, filename: pathlib.Path) -> str:
+        stat = os.stat(filename)
+        key = (str(filename), stat.st_mtime_ns, stat.st_size)
+        if key not in self._checksums:
+            h = _new_hash(self.algorithm)
+            with phase("hash"), open(filename, "rb") as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    h.update(chunk)
+            if len(self._checksums) >= CHECKSUM_CACHE_SIZE:
+                # forget the oldest entry, dicts keep insertion order
+                del self._checksums[next(iter(self._checksums))]
+            self._checksums[key] = h.hexdigest()
+            count("bytes_hashed", stat.st_size)
+        return self._checksums[key]
+
+    def location(self, filename: pathlib.Path, checksum: str) -> pathlib.Path:
+        suffix, _ = _COMPRESSION[self.compression]
+        return self.directory / (checksum + filename.suffix + suffix)
+
+    def store(self, filename: pathlib.Path, checksum: str) -> pathlib.Path:
+        dst = self.location(filename, checksum)
+        if dst.exists():
+            logger.debug(f"{filename} is already archived as {dst}")
+            return dst
+
+        # write to a temporary name first so that an interrupted copy never
+        # shows up as an archived file
+        tmp = dst.with_name(dst.name + f".{os.getpid()}.tmp")
+        try:
+            if self.compression != "none":
+                _, opener = _COMPRESSION[self.compression]
+                with open(filename, "rb") as src, opener(tmp, "wb") as out:
+                    shutil.copyfileobj(src, out, CHUNK_SIZE)
+                count("bytes_copied", os.stat(filename).st_size)
+            elif self.hardlink and _same_device(filename, self.directory):
+                _link_read_only(filename, tmp)
+                count("files_linked")
+            else:
+                _copy(filename, tmp)
+                count("bytes_copied", os.stat(filename).st_size)
+            os.replace(tmp, dst)
+            count("files_archived")
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+        return dst
+
+
+def _same_device(a: pathlib.Path, b: pathlib.Path) -> bool:
+    return os.stat(a).st_dev == os.stat(b).st_dev
+
+
+def _link_read_only(src: pathlib.Path, dst: pathlib.Path):
+    # the link shares its inode with src, which then becomes read-only too:
+    # writing to src in place would change the archived content behind its
+    # checksum, editors that replace the file just break the link
+    os.link(src, dst)
+    mode = os.stat(dst).st_mode
+    os.chmod(dst, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _copy(src: pathlib.Path, dst: pathlib.Path):
+    # copy_file_range copies inside the kernel and lets copy-on-write file
+    # systems share the blocks; shutil falls back to sendfile or read/write
+    if hasattr(os, "copy_file_range") and _same_device(src, dst.parent):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), CHUNK_SIZE):
+                    pass
+            return
+        except OSError:
+            logger.debug("copy_file_range failed, falling back to shutil")
+    shutil.copyfile(src, dst)
+
+
+def open_archived(
+    location: pathlib.Path, compression: str = "none", mode: str = "rb", **kwargs
+):
+    """Open an archived file for streaming reads, decompressing on the fly"""
+    if compression is None:
+        compression = "none"
+    _, opener = _COMPRESSION[compression]
+    if compression != "none" and mode in ("r", "w", "a"):
+        mode += "t"
+    return opener(location, mode, **kwargs)
+
+
+def open_file(con: sqlite3.Connection, file_id: int, mode: str = "rb", **kwargs):
+    """Open the file with the given file_id from the archive"""
+    row = con.execute(
+        "SELECT file_location, compression FROM files WHERE file_id=?", (file_id,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"no file with file_id {file_id}")
+    return open_archived(pathlib.Path(row[0]), row[1], mode, **kwargs)
@@ -13,31 +13,349 @@
    limitations under the License.
 """
 
-# import logging
-
 from argparse import ArgumentParser, BooleanOptionalAction, Namespace
+import logging
+
 from pyoptdb import Command
-from pyoptdb.insert import _insert
-from pyoptdb.config import _config
-from pyoptdb.init import _init
 
-# logging.basicConfig(level=logging.DEBUG)
-# filename='pyoptdb.log', encoding='utf-8',
+# the subcommand modules are imported in main, so that e.g. `pyoptdb config`
+# does not pay for importing pyomo
 
 parser = ArgumentParser("pyoptdb")
+parser.add_argument(
+    "--log-level",
+    dest="LOG_LEVEL",
+    default="WARNING",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+    help="level of the messages logged (default: WARNING)",
+)
+parser.add_argument(
+    "--log-file",
+    dest="LOG_FILE",
+    default=None,
+    help="log to this file, only created once a message is logged (default: stderr)",
+)
 
 subparsers = parser.add_subparsers(dest="COMMAND", required=True)
 
 parser_insert = subparsers.add_parser("insert", help="generate insert query")
 parser_config = subparsers.add_parser("config", help="configure pyoptdb")
 parser_init = subparsers.add_parser("init", help="initialize a pyoptdb database")
+parser_migrate = subparsers.add_parser(
+    "migrate", help="upgrade a pyoptdb database to the current schema"
+)
+parser_ingest = subparsers.add_parser(
+    "ingest", help="insert solutions submitted with `insert --submit`"
+)
+parser_export = subparsers.add_parser(
+    "export", help="export solutions to columnar npy, npz, Arrow or Parquet files"
+)
+parser_backup = subparsers.add_parser(
+    "backup", help="back up the database, or its shards, to a directory"
+)
+parser_watch = subparsers.add_parser(
+    "watch", help="insert the solution files appearing in directories"
+)
+parser_summary = subparsers.add_parser(
+    "summary", help="show or rebuild the summary tables"
+)
+parser_prune = subparsers.add_parser(
+    "prune", help="delete solutions, archived files no longer used and free pages"
+)
+parser_merge = subparsers.add_parser(
+    "merge", help="merge other pyoptdb databases, e.g. one per compute node, into this one"
+)
+parser_serve = subparsers.add_parser(
+    "serve", help="answer read-only queries over HTTP or a Unix socket"
+)
+parser_shards = subparsers.add_parser(
+    "shards", help="list the shards of the database (sqlite3.shard)"
+)
 
 parser_insert.add_argument("-m", "--model-file", dest="MODEL", required=True)
-parser_insert.add_argument("SOL")
+parser_insert.add_argument(
+    "SOL",
+    nargs="*",
+    default=[],
+    help="solution files or glob patterns, e.g. 'runs/**/*.sol'",
+)
+parser_insert.add_argument(
+    "--manifest",
+    dest="MANIFEST",
+    default=None,
+    help="file listing one solution file or glob pattern per line",
+)
+parser_insert.add_argument(
+    "--batch-size",
+    dest="BATCH_SIZE",
+    type=int,
+    default=None,
+    help="number of solutions per transaction (default: insert.batch_size)",
+)
+parser_insert.add_argument(
+    "-j",
+    "--jobs",
+    dest="JOBS",
+    type=int,
+    default=None,
+    help="number of worker processes parsing solution files (default: insert.jobs)",
+)
 
 parser_insert.add_argument(
     "-d", "--dat-file", dest="DATA", required=False, default=None
 )
+parser_insert.add_argument(
+    "--rebuild",
+    dest="REBUILD",
+    default=False,
+    action="store_true",
+    help="always build the model, even if the model and data file are already stored",
+)
+parser_insert.add_argument(
+    "--submit",
+    dest="SUBMIT",
+    default=False,
+    action="store_true",
+    help="queue the solution files for `pyoptdb ingest` instead of inserting them",
+)
+parser_insert.add_argument(
+    "--profile",
+    dest="PROFILE",
+    default=False,
+    action="store_true",
+    help="print the time spent in each phase, row counts and SQLite statistics",
+)
+parser_insert.add_argument(
+    "--profile-json",
+    dest="PROFILE_JSON",
+    default=None,
+    help="write the profile to PROFILE_JSON",
+)
+parser_insert.add_argument(
+    "--sql-log",
+    dest="SQL_LOG",
+    default=None,
+    help="write the executed SQL statements to SQL_LOG",
+)
+
+parser_ingest.add_argument(
+    "--once",
+    dest="ONCE",
+    default=False,
+    action="store_true",
+    help="exit once the spool directory is empty instead of polling it",
+)
+
+parser_export.add_argument("DIRECTORY", help="output directory")
+parser_export.add_argument(
+    "-s",
+    "--solutions",
+    dest="SOLUTIONS",
+    type=int,
+    nargs="+",
+    default=None,
+    help="ids of the solutions to export (default: all matching the filters)",
+)
+parser_export.add_argument(
+    "--shard",
+    dest="SHARD",
+    default=None,
+    help="shard to export from, required if sqlite3.shard is set",
+)
+parser_export.add_argument("--model", dest="MODEL_NAME", default=None)
+parser_export.add_argument("--data-set", dest="DATA_SET", type=int, default=None)
+parser_export.add_argument("--status", dest="STATUS", default=None)
+parser_export.add_argument(
+    "--var",
+    dest="VARIABLES",
+    action="append",
+    default=None,
+    help="variable to export, may be repeated (default: all)",
+)
+parser_export.add_argument(
+    "--param",
+    dest="PARAMETERS",
+    action="append",
+    default=None,
+    help="parameter to export, may be repeated (default: all)",
+)
+parser_export.add_argument(
+    "--format",
+    dest="FORMAT",
+    default="npy",
+    choices=["npy", "npz", "arrow", "parquet"],
+    help="npy files can be opened with numpy.load(mmap_mode='r') (default: npy)",
+)
+
+parser_backup.add_argument("DIRECTORY", help="output directory")
+parser_backup.add_argument(
+    "--shard",
+    dest="SHARDS",
+    action="append",
+    default=None,
+    help="shard to back up, may be repeated (default: all)",
+)
+
+parser_watch.add_argument("-m", "--model-file", dest="MODEL", required=True)
+parser_watch.add_argument(
+    "-d", "--dat-file", dest="DATA", required=False, default=None
+)
+parser_watch.add_argument("DIRECTORIES", nargs="+", help="directories to watch")
+parser_watch.add_argument(
+    "--pattern",
+    dest="PATTERN",
+    default=None,
+    help="file name pattern of the solution files (default: watch.pattern)",
+)
+parser_watch.add_argument(
+    "--batch-size",
+    dest="BATCH_SIZE",
+    type=int,
+    default=None,
+    help="solutions per transaction (default: watch.batch_size)",
+)
+parser_watch.add_argument(
+    "--once",
+    dest="ONCE",
+    default=False,
+    action="store_true",
+    help="exit once the files present have been inserted",
+)
+
+parser_summary.add_argument(
+    "--rebuild",
+    dest="REBUILD",
+    default=False,
+    action="store_true",
+    help="recompute the summary tables from the stored solutions",
+)
+
+parser_prune.add_argument(
+    "--older-than",
+    dest="OLDER_THAN",
+    type=float,
+    default=None,
+    metavar="DAYS",
+    help="delete solutions inserted more than DAYS days ago",
+)
+parser_prune.add_argument(
+    "--status",
+    dest="STATUS",
+    action="append",
+    default=None,
+    help="delete solutions with this status ('unknown': none), may be repeated",
+)
+parser_prune.add_argument(
+    "--keep-best",
+    dest="KEEP_BEST",
+    type=int,
+    default=None,
+    metavar="N",
+    help="delete all but the N solutions with the best objective per data set",
+)
+parser_prune.add_argument(
+    "--rank-by",
+    dest="RANK_BY",
+    default="data_set",
+    choices=["data_set", "model"],
+    help="rank the objectives per data set or per model (default: data_set)",
+)
+parser_prune.add_argument(
+    "--maximize",
+    dest="MAXIMIZE",
+    default=False,
+    action="store_true",
+    help="higher objectives are better",
+)
+parser_prune.add_argument("--model", dest="MODEL_NAME", default=None)
+parser_prune.add_argument("--data-set", dest="DATA_SET", type=int, default=None)
+parser_prune.add_argument(
+    "--dry-run",
+    dest="DRY_RUN",
+    default=False,
+    action="store_true",
+    help="only print the number of solutions that would be deleted",
+)
+parser_prune.add_argument(
+    "--gc",
+    dest="GC",
+    default=True,
+    action=BooleanOptionalAction,
+    help="remove archived files no longer referenced (default: yes)",
+)
+parser_prune.add_argument(
+    "--vacuum",
+    dest="VACUUM",
+    default=True,
+    action=BooleanOptionalAction,
+    help="return free pages to the file system in short slices (default: yes)",
+)
+parser_prune.add_argument(
+    "--full-vacuum",
+    dest="FULL_VACUUM",
+    default=False,
+    action="store_true",
+    help="rewrite the database with auto_vacuum=incremental (exclusive lock)",
+)
+
+parser_merge.add_argument(
+    "SOURCE",
+    nargs="+",
+    help="database files, shard catalogs or glob patterns, e.g. 'nodes/*/pyoptdb.sqlite3'",
+)
+parser_merge.add_argument(
+    "--archive",
+    dest="ARCHIVE",
+    action="append",
+    default=[],
+    metavar="DIR",
+    help="directory to look for archived files of the sources in, may be repeated",
+)
+parser_merge.add_argument(
+    "--model",
+    dest="MODEL_NAME",
+    action="append",
+    default=None,
+    help="only merge this model, may be repeated",
+)
+parser_merge.add_argument(
+    "--shard",
+    dest="SHARD",
+    default=None,
+    metavar="KEY",
+    help="with sqlite3.shard = model: shard for the models of databases without "
+    "shards that are in no shard yet; shards are keyed by model file name, "
+    "which a database does not store",
+)
+
+parser_serve.add_argument(
+    "--host", dest="HOST", default=None, help="address to listen on (default: serve.host)"
+)
+parser_serve.add_argument(
+    "--port", dest="PORT", type=int, default=None, help="port to listen on (default: serve.port)"
+)
+parser_serve.add_argument(
+    "--socket",
+    dest="SOCKET",
+    default=None,
+    metavar="PATH",
+    help="listen on the Unix socket PATH instead (default: serve.socket)",
+)
+parser_serve.add_argument(
+    "--shard",
+    dest="SHARD",
+    default=None,
+    metavar="KEY",
+    help="serve the shard KEY, required with sqlite3.shard",
+)
+
+parser_shards.add_argument(
+    "--drop",
+    dest="DROP",
+    default=None,
+    metavar="KEY",
+    help="delete the shard KEY and remove it from the catalog",
+)
 
 parser_config.add_argument("INPUT", nargs="*", default=[])
 parser_config.add_argument(
@@ -57,18 +375,77 @@ def _parse_args() -> Namespace:
     if Command[args.COMMAND] == Command.config:
         if not args.LIST and len(args.INPUT) != 2:
             parser.error("Expected exactly two positional arguments")
+    elif Command[args.COMMAND] == Command.insert:
+        if not args.SOL and args.MANIFEST is None:
+            parser.error("Expected at least one SOL argument or --manifest")
 
     return args
 
 
+def _configure_logging(args: Namespace):
+    if args.LOG_FILE is None:
+        handler = logging.StreamHandler()
+    else:
+        handler = logging.FileHandler(args.LOG_FILE, delay=True)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logging.basicConfig(level=args.LOG_LEVEL, handlers=[handler])
+
+
 def main():
     args = _parse_args()
+    _configure_logging(args)
 
     cmd = Command[args.COMMAND]
 
     if cmd == Command.config:
+        from pyoptdb.config import _config
+
         _config(args)
     elif cmd == Command.insert:
+        from pyoptdb.insert import _insert
+
         _insert(args)
     elif cmd == Command.init:
+        from pyoptdb.init import _init
+
         _init()
+    elif cmd == Command.migrate:
+        from pyoptdb.migrate import _migrate
+
+        _migrate()
+    elif cmd == Command.ingest:
+        from pyoptdb.ingest import _ingest
+
+        _ingest(args)
+    elif cmd == Command.export:
+        from pyoptdb.export import _export
+
+        _export(args)
+    elif cmd == Command.backup:
+        from pyoptdb.shards import _backup
+
+        _backup(args)
+    elif cmd == Command.watch:
+        from pyoptdb.watch import _watch
+
+        _watch(args)
+    elif cmd == Command.summary:
+        from pyoptdb.summary import _summary
+
+        _summary(args)
+    elif cmd == Command.prune:
+        from pyoptdb.prune import _prune
+
+        _prune(args)
+    elif cmd == Command.merge:
+        from pyoptdb.merge import _merge
+
+        _merge(args)
+    elif cmd == Command.serve:
+        from pyoptdb.serve import _serve
+
+        _serve(args)
+    elif cmd == Command.shards:
+        from pyoptdb.shards import _shards
+
+        _shards(args)
@@ -28,9 +28,78 @@ logger = logging.getLogger(__name__)
 #     CONFIG_PATH = CONFIG_PATH_LOCAL
 
 
-def _get_config() -> configparser.ConfigParser:
+def _default_config() -> configparser.ConfigParser:
     config = configparser.ConfigParser()
 
+    config["sqlite3"] = {}
+    config["sqlite3"]["file"] = (CONFIG_PATH_LOCAL / "pyoptdb.sqlite3").as_posix()
+    config["sqlite3"]["schema"] = (PYOPTDB_DIR / "schema.sql").as_posix()
+    config["sqlite3"]["storage"] = "rows"
+    config["sqlite3"]["delta_tolerance"] = "0.0"
+    config["sqlite3"]["delta_max_changes"] = "0.5"
+    config["sqlite3"]["journal_mode"] = "delete"
+    config["sqlite3"]["synchronous"] = "full"
+    config["sqlite3"]["busy_timeout"] = "60000"
+    config["sqlite3"]["shard"] = "none"
+    config["sqlite3"]["shard_directory"] = (CONFIG_PATH_LOCAL / "shards").as_posix()
+
+    config["archive"] = {}
+    config["archive"]["directory"] = (CONFIG_PATH_LOCAL / ".files").as_posix()
+    config["archive"]["hash"] = "md5"
+    config["archive"]["compression"] = "none"
+    config["archive"]["hardlink"] = "no"
+
+    config["cache"] = {}
+    config["cache"]["directory"] = (CONFIG_PATH_LOCAL / ".cache").as_posix()
+    config["cache"]["max_size"] = "1024"
+
+    config["insert"] = {}
+    config["insert"]["chunk_size"] = "10000"
+    config["insert"]["batch_size"] = "100"
+    config["insert"]["jobs"] = "1"
+    config["insert"]["summary"] = "yes"
+
+    config["ingest"] = {}
+    config["ingest"]["spool"] = (CONFIG_PATH_LOCAL / ".spool").as_posix()
+    config["ingest"]["poll_interval"] = "1.0"
+    config["ingest"]["max_submissions"] = "1000"
+
+    config["watch"] = {}
+    config["watch"]["pattern"] = "*.sol"
+    config["watch"]["settle"] = "2.0"
+    config["watch"]["poll_interval"] = "1.0"
+    config["watch"]["batch_size"] = "100"
+    config["watch"]["max_latency"] = "10.0"
+    config["watch"]["max_pending"] = "10000"
+    config["watch"]["inotify"] = "yes"
+
+    config["record"] = {}
+    config["record"]["background"] = "no"
+    config["record"]["batch_size"] = "100"
+    config["record"]["max_latency"] = "5.0"
+    config["record"]["max_pending"] = "1000"
+
+    config["serve"] = {}
+    config["serve"]["host"] = "127.0.0.1"
+    config["serve"]["port"] = "8750"
+    config["serve"]["socket"] = ""
+    config["serve"]["pool_size"] = "4"
+    config["serve"]["cache_size"] = "256"
+    config["serve"]["mmap_size"] = "256"
+
+    config["prune"] = {}
+    config["prune"]["batch_size"] = "500"
+    config["prune"]["archive_grace"] = "3600"
+    config["prune"]["vacuum_slice"] = "0.05"
+    config["prune"]["vacuum_seconds"] = "0"
+
+    return config
+
+
+def _get_config() -> configparser.ConfigParser:
+    # options missing from older config files fall back to the defaults
+    config = _default_config()
+
     if os.path.exists((CONFIG_PATH_LOCAL / CONFIG_FILE)):
         logger.debug(f"reading {(CONFIG_PATH_LOCAL / CONFIG_FILE)}")
         config.read((CONFIG_PATH_LOCAL / CONFIG_FILE))
@@ -45,15 +114,6 @@ def _get_config() -> configparser.ConfigParser:
                 f"{CONFIG_PATH_GLOBAL / CONFIG_FILE} does not exist. Creating default."
             )
 
-            config["sqlite3"] = {}
-            config["sqlite3"]["file"] = (
-                CONFIG_PATH_LOCAL / "pyoptdb.sqlite3"
-            ).as_posix()
-            config["sqlite3"]["schema"] = (PYOPTDB_DIR / "schema.sql").as_posix()
-
-            config["archive"] = {}
-            config["archive"]["directory"] = (CONFIG_PATH_LOCAL / ".files").as_posix()
-
             if not CONFIG_PATH_GLOBAL.exists():
                 logger.debug(f"creating directory {CONFIG_PATH_GLOBAL}")
                 CONFIG_PATH_GLOBAL.mkdir(parents=True, exist_ok=False)
@@ -0,0 +1,72 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import itertools
+import pathlib
+import re
+import sqlite3
+
+from pyoptdb.instrument import count_rows
+
+# the table an INSERT writes to, temp tables are not counted
+_INSERT_TABLE = re.compile(r"INSERT (?:OR \w+ )?INTO (?!temp\.)(\w+)")
+
+JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+SYNCHRONOUS = ("off", "normal", "full", "extra")
+
+
+def _connect(dbfile: pathlib.Path, config, **kwargs) -> sqlite3.Connection:
+    # journal mode, busy timeout and synchronous from the sqlite3 section, see
+    # https://www.sqlite.org/wal.html for running concurrent writers
+    journal_mode = config["sqlite3"].get("journal_mode", "delete").lower()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(
+            f"unknown sqlite3.journal_mode {journal_mode}, expected one of "
+            + ", ".join(JOURNAL_MODES)
+        )
+
+    synchronous = config["sqlite3"].get("synchronous", "full").lower()
+    if synchronous not in SYNCHRONOUS:
+        raise ValueError(
+            f"unknown sqlite3.synchronous {synchronous}, expected one of "
+            + ", ".join(SYNCHRONOUS)
+        )
+
+    busy_timeout = config["sqlite3"].getint("busy_timeout", 60000)
+    if busy_timeout < 0:
+        raise ValueError("sqlite3.busy_timeout must not be negative")
+
+    con = sqlite3.connect(dbfile, timeout=busy_timeout / 1000, **kwargs)
+    # the journal mode is persistent, switching needs exclusive access and
+    # is only done if it differs
+    (current,) = con.execute("PRAGMA journal_mode").fetchone()
+    if current != journal_mode:
+        con.execute(f"PRAGMA journal_mode={journal_mode}")
+    con.execute(f"PRAGMA synchronous={synchronous}")
+    return con
+
+
+def _chunked(iterable, size: int):
+    it = iter(iterable)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def _executemany_chunked(cur: sqlite3.Cursor, sql: str, rows, chunk_size: int):
+    table = _INSERT_TABLE.match(sql)
+    for chunk in _chunked(rows, chunk_size):
+        cur.executemany(sql, chunk)
+        if table is not None:
+            count_rows(table[1], cur.rowcount)
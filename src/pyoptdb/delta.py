@@ -0,0 +1,126 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Delta storage (sqlite3.storage = delta): a solution is stored as the
+# variable_data rows whose value differs by more than delta_tolerance from its
+# base solution, solutions.base_solution_id refers to the base. The base is
+# the latest solution of the data set stored in full. A solution changing
+# more than delta_max_changes (a fraction) of the entries is stored in full
+# and becomes the base of the following ones. pyoptdb.query reconstructs the
+# full values transparently.
+
+import dataclasses
+import sqlite3
+
+from pyoptdb.db import _executemany_chunked
+from pyoptdb.instrument import count
+
+
+@dataclasses.dataclass
+class _Delta:
+    tolerance: float = 0.0
+    max_changes: float = 0.5
+    base_solution_id: int = None
+    # (var_id, index_id) -> value of the base solution
+    base_values: dict = None
+
+    @classmethod
+    def from_config(cls, config, cur: sqlite3.Cursor, data_set_id: int):
+        tolerance = config["sqlite3"].getfloat("delta_tolerance")
+        if tolerance < 0:
+            raise ValueError("sqlite3.delta_tolerance must not be negative")
+        max_changes = config["sqlite3"].getfloat("delta_max_changes")
+        if not 0 <= max_changes <= 1:
+            raise ValueError("sqlite3.delta_max_changes must be between 0 and 1")
+
+        delta = cls(tolerance, max_changes)
+        delta.base_solution_id = _find_base(cur, data_set_id)
+        if delta.base_solution_id is not None:
+            delta.base_values = _base_values(cur, delta.base_solution_id)
+        return delta
+
+
+def _find_base(cur: sqlite3.Cursor, data_set_id: int) -> int:
+    # the latest solution of the data set stored in full as rows
+    row = cur.execute(
+        "SELECT s.solution_id FROM solutions s "
+        "WHERE s.data_set_id=? AND s.base_solution_id IS NULL "
+        "AND EXISTS (SELECT 1 FROM variable_data d WHERE d.solution_id=s.solution_id) "
+        "ORDER BY s.solution_id DESC LIMIT 1",
+        (data_set_id,),
+    ).fetchone()
+    return None if row is None else row[0]
+
+
+def _base_values(cur: sqlite3.Cursor, solution_id: int) -> dict:
+    return {
+        (var_id, index_id): value
+        for var_id, index_id, value in cur.execute(
+            "SELECT var_id, index_id, value FROM variable_data WHERE solution_id=?",
+            (solution_id,),
+        )
+    }
+
+
+def _changed(value, base, tolerance: float) -> bool:
+    if value is None or base is None:
+        return value is not base
+    return abs(value - base) > tolerance
+
+
+def _insert_delta_rows(
+    cur: sqlite3.Cursor, solution_id: int, rows, delta: _Delta, chunk_size: int
+):
+    # rows: (var_id, index_str, index_id, value) of all entries of the solution
+    rows = list(rows)
+
+    if delta.base_values is not None:
+        changed = []
+        for row in rows:
+            key = (row[0], row[2])
+            if key not in delta.base_values:
+                # an entry the base does not have, it cannot be reconstructed
+                changed = None
+                break
+            if _changed(row[3], delta.base_values[key], delta.tolerance):
+                changed.append(row)
+
+        if changed is not None and len(changed) <= delta.max_changes * len(rows):
+            cur.execute(
+                "UPDATE solutions SET base_solution_id=? WHERE solution_id=?",
+                (delta.base_solution_id, solution_id),
+            )
+            _insert_rows(cur, solution_id, changed, chunk_size)
+            count("delta_rows", len(changed))
+            return
+
+    # stored in full, the base of the following solutions
+    _insert_rows(cur, solution_id, rows, chunk_size)
+    count("delta_bases")
+    delta.base_solution_id = solution_id
+    delta.base_values = {(var_id, index_id): value for var_id, _, index_id, value in rows}
+
+
+def _insert_rows(cur: sqlite3.Cursor, solution_id: int, rows: list, chunk_size: int):
+    _executemany_chunked(
+        cur,
+        "INSERT OR IGNORE INTO variable_data(solution_id,var_id,index_str,index_id,value) "
+        "VALUES (?,?,?,?,?)",
+        (
+            (solution_id, var_id, index_str, index_id, value)
+            for var_id, index_str, index_id, value in rows
+        ),
+        chunk_size,
+    )
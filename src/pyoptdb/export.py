@@ -0,0 +1,348 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Export of solutions to columnar files. For every variable the index labels
+# are written once (<var>.index.npy, <var>.index_ids.npy) and the values as a
+# Fortran-ordered (indices x solutions) float64 array (<var>.values.npy), so
+# the values of each solution are one contiguous column. The arrays are
+# filled one solution at a time through a memory map and open without a copy
+# with numpy.load(..., mmap_mode="r"). Parameters are exported the same way
+# with one column per data set. npz, Arrow and Parquet files are written from
+# the .npy files in chunks of rows; only the .npy files can be memory-mapped,
+# numpy.load reads the members of an npz archive into memory.
+
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import zipfile
+
+from pyoptdb.db import _chunked
+from pyoptdb.indices import _MAX_VARIABLES, _select_index_ids
+from pyoptdb.query import _numpy, _param_values, _var_values
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("npy", "npz", "arrow", "parquet")
+
+# rows per record batch / row group of Arrow and Parquet files
+ROW_CHUNK_SIZE = 65536
+
+MANIFEST = "manifest.json"
+
+
+def _solutions(con: sqlite3.Connection, solution_ids: list) -> list:
+    rows = []
+    for chunk in _chunked(solution_ids, _MAX_VARIABLES):
+        rows.extend(
+            con.execute(
+                "SELECT s.solution_id, s.data_set_id, ds.model_id, s.sol_status, "
+                "s.objective, s.gap, s.time_seconds FROM solutions s "
+                "JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+                f"WHERE s.solution_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+        )
+    by_id = {row[0]: row for row in rows}
+
+    missing = [solution_id for solution_id in solution_ids if solution_id not in by_id]
+    if missing:
+        raise KeyError(f"no solutions {missing}")
+    return [by_id[solution_id] for solution_id in solution_ids]
+
+
+def _components(con: sqlite3.Connection, table: str, column: str, model_id: int, names):
+    available = dict(
+        con.execute(
+            f"SELECT {column}_name, {column}_id FROM {table} WHERE model_id=? "
+            f"ORDER BY {column}_id",
+            (model_id,),
+        )
+    )
+    if names is None:
+        return available
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise KeyError(f"no {table} {unknown} in the model")
+    return {name: available[name] for name in names}
+
+
+def _write_columns(
+    directory: pathlib.Path, name: str, columns: list, read, con: sqlite3.Connection
+) -> dict:
+    # columns: the ids (solution or data set) of the columns, in order
+    # read(column_id) -> (index_strs, labels, values)
+    # -> the manifest entry, None if a column is not numeric
+    np = _numpy()
+
+    # first pass: the union of the index sets, in order of appearance. The
+    # index set only changes between data sets, so one solution per data set
+    # would do; reading every column keeps this independent of that.
+    positions = {}
+    last_index_strs = None
+    for column_id in columns:
+        index_strs, _, values = read(column_id)
+        if values.dtype.kind not in "biuf":
+            # non-numeric parameter, nothing has been written yet
+            return None
+        if index_strs != last_index_strs:
+            for index_str in index_strs:
+                positions.setdefault(index_str, len(positions))
+            last_index_strs = index_strs
+
+    index_strs = list(positions)
+    np.save(directory / f"{name}.index.npy", np.array(index_strs, dtype=str))
+
+    index_ids = _select_index_ids(con.cursor(), index_strs)
+    np.save(
+        directory / f"{name}.index_ids.npy",
+        np.array([index_ids.get(s, -1) for s in index_strs], dtype=np.int64),
+    )
+
+    # second pass: one column at a time
+    values_file = directory / f"{name}.values.npy"
+    array = np.lib.format.open_memmap(
+        values_file,
+        mode="w+",
+        dtype=np.float64,
+        shape=(len(index_strs), len(columns)),
+        fortran_order=True,
+    )
+    last_index_strs, cols = None, None
+    for j, column_id in enumerate(columns):
+        column_index_strs, _, values = read(column_id)
+        if column_index_strs != last_index_strs:
+            cols = np.fromiter(
+                (positions[s] for s in column_index_strs),
+                dtype=np.intp,
+                count=len(column_index_strs),
+            )
+            last_index_strs = column_index_strs
+        column = np.full(len(index_strs), np.nan)
+        column[cols] = values
+        array[:, j] = column
+    array.flush()
+    del array
+
+    return {
+        "index": f"{name}.index.npy",
+        "index_ids": f"{name}.index_ids.npy",
+        "values": values_file.name,
+        "shape": [len(index_strs), len(columns)],
+    }
+
+
+def _to_npz(directory: pathlib.Path, manifest: dict):
+    # stored, not compressed: np.load reads the members without inflating
+    files = [
+        entry[key]
+        for section in ("variables", "parameters")
+        for entry in manifest[section].values()
+        for key in ("index", "index_ids", "values")
+    ]
+    with zipfile.ZipFile(directory / "export.npz", "w", zipfile.ZIP_STORED) as z:
+        for filename in files:
+            z.write(directory / filename, arcname=filename)
+            os.unlink(directory / filename)
+    manifest["npz"] = "export.npz"
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("export to arrow or parquet requires pyarrow") from e
+    return pyarrow
+
+
+def _to_arrow(directory: pathlib.Path, manifest: dict, fmt: str):
+    pa = _pyarrow()
+    np = _numpy()
+
+    for section, prefix in (("variables", "s"), ("parameters", "d")):
+        column_ids = manifest["solution_ids" if section == "variables" else "data_set_ids"]
+        for name, entry in manifest[section].items():
+            index = np.load(directory / entry["index"], mmap_mode="r")
+            index_ids = np.load(directory / entry["index_ids"], mmap_mode="r")
+            values = np.load(directory / entry["values"], mmap_mode="r")
+
+            schema = pa.schema(
+                [("index", pa.string()), ("index_id", pa.int64())]
+                + [(f"{prefix}{column_id}", pa.float64()) for column_id in column_ids]
+            )
+            filename = f"{name}.{'arrow' if fmt == 'arrow' else 'parquet'}"
+            if fmt == "arrow":
+                writer = pa.ipc.new_file(str(directory / filename), schema)
+            else:
+                writer = pa.parquet.ParquetWriter(str(directory / filename), schema)
+
+            with writer:
+                for lo in range(0, max(len(index), 1), ROW_CHUNK_SIZE):
+                    hi = lo + ROW_CHUNK_SIZE
+                    writer.write_table(
+                        pa.Table.from_arrays(
+                            [pa.array(index[lo:hi]), pa.array(index_ids[lo:hi])]
+                            + [
+                                pa.array(values[lo:hi, j])
+                                for j in range(values.shape[1])
+                            ],
+                            schema=schema,
+                        )
+                    )
+
+            del index, index_ids, values
+            for key in ("index", "index_ids", "values"):
+                os.unlink(directory / entry[key])
+            manifest[section][name] = {"file": filename, "shape": entry["shape"]}
+
+
+def export(
+    con: sqlite3.Connection,
+    directory: pathlib.Path,
+    solution_ids: list,
+    variables: list = None,
+    parameters: list = None,
+    fmt: str = "npy",
+) -> dict:
+    """Export the given solutions of one model to `directory`
+
+    Writes the variables (default: all) of the solutions and the parameters
+    (default: all) of their data sets, plus a manifest.json describing the
+    files, and returns the manifest.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt}, expected one of " + ", ".join(FORMATS))
+    if fmt in ("arrow", "parquet"):
+        # fail before writing anything
+        _pyarrow()
+
+    solution_ids = list(solution_ids)
+    if not solution_ids:
+        raise ValueError("no solutions to export")
+
+    solutions = _solutions(con, solution_ids)
+    model_ids = {row[2] for row in solutions}
+    if len(model_ids) > 1:
+        raise ValueError(
+            "the solutions belong to more than one model, select one (--model)"
+        )
+    (model_id,) = model_ids
+
+    data_set_ids = list(dict.fromkeys(row[1] for row in solutions))
+
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    manifest = {
+        "format": fmt,
+        "solution_ids": solution_ids,
+        "data_set_ids": data_set_ids,
+        "solutions": [
+            dict(
+                zip(
+                    (
+                        "solution_id",
+                        "data_set_id",
+                        "model_id",
+                        "status",
+                        "objective",
+                        "gap",
+                        "time_seconds",
+                    ),
+                    row,
+                )
+            )
+            for row in solutions
+        ],
+        "variables": {},
+        "parameters": {},
+    }
+
+    for name, var_id in _components(con, "variables", "var", model_id, variables).items():
+        logger.debug(f"exporting variable {name}")
+        manifest["variables"][name] = _write_columns(
+            directory,
+            name,
+            solution_ids,
+            lambda solution_id: _var_values(con, var_id, solution_id),
+            con,
+        )
+
+    skipped = []
+    for name, param_id in _components(
+        con, "parameters", "param", model_id, parameters
+    ).items():
+        logger.debug(f"exporting parameter {name}")
+        entry = _write_columns(
+            directory,
+            name,
+            data_set_ids,
+            lambda data_set_id: _param_values(con, param_id, data_set_id),
+            con,
+        )
+        if entry is None:
+            skipped.append(name)
+        else:
+            manifest["parameters"][name] = entry
+    if skipped:
+        logger.warning("skipping non-numeric parameter(s) " + ", ".join(skipped))
+
+    if fmt == "npz":
+        _to_npz(directory, manifest)
+    elif fmt in ("arrow", "parquet"):
+        _to_arrow(directory, manifest, fmt)
+
+    with open(directory / MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _export(args):
+    from pyoptdb import query, shards
+
+    con = shards.connect(args.SHARD)
+    try:
+        if args.SOLUTIONS:
+            solution_ids = args.SOLUTIONS
+        else:
+            solution_ids = [
+                row.solution_id
+                for row in query.solutions(
+                    con,
+                    model_name=args.MODEL_NAME,
+                    data_set_id=args.DATA_SET,
+                    status=args.STATUS,
+                    order_by="solution_id",
+                )
+            ]
+
+        manifest = export(
+            con,
+            pathlib.Path(args.DIRECTORY),
+            solution_ids,
+            variables=args.VARIABLES,
+            parameters=args.PARAMETERS,
+            fmt=args.FORMAT,
+        )
+    finally:
+        con.close()
+
+    print(
+        f"exported {len(manifest['solution_ids'])} solution(s), "
+        f"{len(manifest['variables'])} variable(s) and "
+        f"{len(manifest['parameters'])} parameter(s) to {args.DIRECTORY}"
+    )
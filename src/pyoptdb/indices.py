@@ -0,0 +1,143 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Interned indices: every distinct index string is stored once in `indices`,
+# its components in `index_components` (one row per position, the value keeps
+# its type: INTEGER, REAL or TEXT). Rows of parameter_data, variable_data,
+# set_data and index_dict_entries refer to it by index_id, so filters on
+# single index positions run as indexed SQL.
+
+import array
+import ast
+import functools
+import sqlite3
+
+from pyoptdb.db import _chunked, _executemany_chunked
+
+# bound parameters per statement, well below SQLITE_MAX_VARIABLE_NUMBER
+_MAX_VARIABLES = 500
+
+
+@functools.lru_cache(maxsize=65536)
+def decode_index(index_str: str):
+    # inverse of str_repr_index; plain strings (e.g. the index a of a Param
+    # indexed by a single set) are not valid literals and returned as is
+    try:
+        return ast.literal_eval(index_str)
+    except (ValueError, SyntaxError):
+        return index_str
+
+
+def _components(index_str: str) -> tuple:
+    index = decode_index(index_str)
+    if index is None:
+        # scalar components
+        return ()
+    if isinstance(index, tuple):
+        return index
+    return (index,)
+
+
+def _select_index_ids(cur: sqlite3.Cursor, index_strs) -> dict:
+    ids = {}
+    for chunk in _chunked(index_strs, _MAX_VARIABLES):
+        ids.update(
+            cur.execute(
+                "SELECT index_str, index_id FROM indices WHERE index_str IN "
+                f"({','.join('?' * len(chunk))})",
+                chunk,
+            )
+        )
+    return ids
+
+
+def _insert_or_ignore_indices(cur: sqlite3.Cursor, index_strs, chunk_size: int) -> dict:
+    # -> index_str -> index_id for all of index_strs
+    index_strs = list(dict.fromkeys(index_strs))
+    ids = _select_index_ids(cur, index_strs)
+
+    new = [index_str for index_str in index_strs if index_str not in ids]
+    if not new:
+        return ids
+
+    _executemany_chunked(
+        cur,
+        "INSERT INTO indices(index_str,arity) VALUES (?,?)",
+        ((index_str, len(_components(index_str))) for index_str in new),
+        chunk_size,
+    )
+    new_ids = _select_index_ids(cur, new)
+    _insert_components(cur, new_ids.items(), chunk_size)
+
+    ids.update(new_ids)
+    return ids
+
+
+def _insert_components(cur: sqlite3.Cursor, index_ids, chunk_size: int):
+    # index_ids: (index_str, index_id) pairs
+    _executemany_chunked(
+        cur,
+        "INSERT OR IGNORE INTO index_components(index_id,position,value) "
+        "VALUES (?,?,?)",
+        (
+            (index_id, position, _component_value(value))
+            for index_str, index_id in index_ids
+            for position, value in enumerate(_components(index_str))
+        ),
+        chunk_size,
+    )
+
+
+def _component_value(value):
+    # sqlite3 stores int, float and str as INTEGER, REAL and TEXT
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        return value
+    return str(value)
+
+
+def _index_ids(cur: sqlite3.Cursor, index_strs, chunk_size: int) -> array.array:
+    # -> index_id of every entry of index_strs, in order; index_strs may be
+    # a generator, it is read chunk by chunk
+    index_ids = array.array("q")
+    for chunk in _chunked(index_strs, chunk_size):
+        ids = _insert_or_ignore_indices(cur, chunk, chunk_size)
+        index_ids.extend(ids[index_str] for index_str in chunk)
+    return index_ids
+
+
+def _index_filter(where: dict) -> tuple:
+    # -> (subquery selecting the matching index_id, parameters)
+    # where maps a position to a value or an inclusive (min, max) range,
+    # either end may be None
+    clauses, params = [], []
+    for position, condition in where.items():
+        if isinstance(condition, tuple):
+            lo, hi = condition
+            clause = "SELECT index_id FROM index_components WHERE position=?"
+            params.append(position)
+            if lo is not None:
+                clause += " AND value>=?"
+                params.append(lo)
+            if hi is not None:
+                clause += " AND value<=?"
+                params.append(hi)
+        else:
+            clause = "SELECT index_id FROM index_components WHERE position=? AND value=?"
+            params.extend((position, condition))
+        clauses.append(clause)
+
+    if not clauses:
+        raise ValueError("empty index filter")
+    return " INTERSECT ".join(clauses), params
@@ -0,0 +1,267 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Single-writer ingestion: producers (`pyoptdb insert --submit`) drop a JSON
+# submission into the spool directory, a single `pyoptdb ingest` process
+# inserts them. Submissions for the same model and data file are inserted
+# together and committed once, so the number of write transactions does not
+# grow with the number of producers. The name of every submission is
+# recorded in ingested_submissions in the same transaction, a submission
+# still in the spool directory after a crash is then only removed.
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import time
+import uuid
+
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+from pyoptdb.migrate import _check_schema_version
+from pyoptdb.shards import _route
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".json"
+FAILED_DIR = "failed"
+LOCK_FILE = ".lock"
+
+
+def _spool(config) -> pathlib.Path:
+    spool = config["ingest"].get("spool", None)
+    if spool is None:
+        raise ValueError("No legal name for ingest.spool")
+    return pathlib.Path(spool)
+
+
+def _submit(
+    config,
+    model_file: pathlib.Path,
+    datacmd_file: pathlib.Path,
+    sol_files: list,
+    rebuild: bool = False,
+) -> pathlib.Path:
+    spool = _spool(config)
+    spool.mkdir(parents=True, exist_ok=True)
+
+    submission = {
+        "model": pathlib.Path(model_file).resolve().as_posix(),
+        "data": None if datacmd_file is None else pathlib.Path(datacmd_file).resolve().as_posix(),
+        "solutions": [pathlib.Path(f).resolve().as_posix() for f in sol_files],
+        "rebuild": rebuild,
+    }
+
+    # the name orders submissions by time, the rename makes them visible to
+    # the ingest process only once they are complete
+    path = spool / f"{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex}{SUFFIX}"
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(submission, f)
+    os.replace(tmp, path)
+
+    logger.debug(f"submitted {len(sol_files)} solution file(s) as {path}")
+    print(f"submitted {len(sol_files)} solution file(s) to {spool}")
+    return path
+
+
+def _pending(spool: pathlib.Path, max_submissions: int) -> list:
+    return sorted(spool.glob("*" + SUFFIX))[:max_submissions]
+
+
+def _fail(path: pathlib.Path, error: Exception):
+    failed = path.parent / FAILED_DIR
+    failed.mkdir(exist_ok=True)
+    os.replace(path, failed / path.name)
+    with open(failed / (path.name + ".error"), "w") as f:
+        f.write(f"{type(error).__name__}: {error}\n")
+    logger.error(f"failed to ingest {path.name}: {error}")
+
+
+@contextlib.contextmanager
+def _exclusive_lock(path: pathlib.Path):
+    # held until the context exits, fails if another process holds it
+    with open(path, "w") as f:
+        try:
+            import fcntl
+        except ImportError:
+            # Windows
+            import msvcrt
+
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                raise BlockingIOError(f"{path} is locked") from None
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        yield
+
+
+def _ingested(con, submissions: list) -> set:
+    # names of the submissions already inserted into the database of con
+    names = [path.name for path, _ in submissions]
+    return {
+        name
+        for (name,) in con.execute(
+            "SELECT submission FROM ingested_submissions "
+            f"WHERE submission IN ({','.join('?' * len(names))})",
+            names,
+        )
+    }
+
+
+def _ingest_group(con, config, key, submissions: list) -> int:
+    # -> number of inserted solutions
+    from pyoptdb.insert import _insert_solutions
+
+    model_file, datacmd_file, rebuild = key
+    sol_files = [
+        pathlib.Path(f) for _, submission in submissions for f in submission["solutions"]
+    ]
+
+    def record(cur):
+        # in the transaction _insert_solutions commits, which only starts
+        # once the model has been built
+        cur.executemany(
+            "INSERT INTO ingested_submissions(submission,ingested_at) VALUES (?,?)",
+            (
+                (path.name, time.strftime("%Y-%m-%dT%H:%M:%S"))
+                for path, _ in submissions
+            ),
+        )
+
+    try:
+        n_solutions, n_rows, seconds = _insert_solutions(
+            con,
+            config,
+            pathlib.Path(model_file),
+            None if datacmd_file is None else pathlib.Path(datacmd_file),
+            sol_files,
+            rebuild=rebuild,
+            batch_size=len(sol_files),
+            record=record,
+        )
+    except BaseException:
+        con.rollback()
+        raise
+    for path, _ in submissions:
+        path.unlink()
+
+    print(
+        f"ingested {len(submissions)} submission(s), {n_solutions} solution(s), "
+        f"{n_rows} row(s) in {seconds:.3f} s"
+    )
+    return n_solutions
+
+
+def _ingest_once(connection, config, spool: pathlib.Path, max_submissions: int) -> int:
+    # -> number of processed submissions
+    # connection(model_file) -> the connection to insert model_file into
+    paths = _pending(spool, max_submissions)
+
+    groups = collections.defaultdict(list)
+    for path in paths:
+        try:
+            with open(path, "r") as f:
+                submission = json.load(f)
+            key = (submission["model"], submission["data"], submission["rebuild"])
+        except (OSError, ValueError, KeyError) as e:
+            _fail(path, e)
+            continue
+        groups[key].append((path, submission))
+
+    for key, submissions in groups.items():
+        try:
+            con = connection(key[0])
+            ingested = _ingested(con, submissions)
+        except Exception as e:
+            for path, _ in submissions:
+                _fail(path, e)
+            continue
+
+        if ingested:
+            # inserted before a crash, only the file was left
+            logger.warning(f"removing {len(ingested)} submission(s) ingested before")
+            for path, _ in submissions:
+                if path.name in ingested:
+                    path.unlink()
+            submissions = [s for s in submissions if s[0].name not in ingested]
+            if not submissions:
+                continue
+
+        try:
+            _ingest_group(con, config, key, submissions)
+        except Exception as e:
+            if len(submissions) == 1:
+                _fail(submissions[0][0], e)
+                continue
+            # the group was rolled back, retry one by one so that a single
+            # broken submission does not hold back the others
+            logger.warning(f"group commit failed ({e}), ingesting one by one")
+            for submission in submissions:
+                try:
+                    _ingest_group(con, config, key, [submission])
+                except Exception as e:
+                    _fail(submission[0], e)
+
+    return len(paths)
+
+
+def _ingest(args):
+    config = _get_config()
+
+    dbfile = pathlib.Path(config["sqlite3"].get("file", None))
+    if not dbfile.exists():
+        raise FileNotFoundError(f"{dbfile} does not exist, run `pyoptdb init`")
+
+    spool = _spool(config)
+    spool.mkdir(parents=True, exist_ok=True)
+
+    poll_interval = config["ingest"].getfloat("poll_interval")
+    max_submissions = config["ingest"].getint("max_submissions")
+    if max_submissions < 1:
+        raise ValueError("ingest.max_submissions must be a positive integer")
+
+    with contextlib.ExitStack() as stack:
+        # only one ingest process per spool directory
+        try:
+            stack.enter_context(_exclusive_lock(spool / LOCK_FILE))
+        except BlockingIOError:
+            raise RuntimeError(f"another `pyoptdb ingest` is running on {spool}")
+
+        # one connection per database, with sqlite3.shard per shard
+        connections = {}
+
+        def connection(model_file: str):
+            dbfile = _route(config, pathlib.Path(model_file))
+            if dbfile not in connections:
+                con = stack.enter_context(
+                    contextlib.closing(
+                        _connect(dbfile, config, isolation_level="IMMEDIATE")
+                    )
+                )
+                _check_schema_version(con)
+                connections[dbfile] = con
+            return connections[dbfile]
+
+        logger.info(f"ingesting submissions from {spool}")
+        while True:
+            n = _ingest_once(connection, config, spool, max_submissions)
+            if n == 0:
+                if args.ONCE:
+                    break
+                time.sleep(poll_interval)
@@ -1,3 +1,4 @@
+import contextlib
 import logging
 from pathlib import Path
 import sqlite3
@@ -7,6 +8,9 @@ logger = logging.getLogger(__name__)
 
 from pyoptdb import PYOPTDB_DIR
 from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+from pyoptdb.migrate import _upgrade
+from pyoptdb.shards import Sharding, _create_catalog, _sharding
 
 
 def _init():
@@ -38,10 +42,29 @@ def _init():
         logger.debug(f"creating directory {file_archive}")
         file_archive.mkdir(parents=True, exist_ok=False)
 
+    if _sharding(config) != Sharding.none:
+        # sqlite3.file is the catalog, the shards are created on first insert
+        _create_catalog(dbfile, config)
+        return
+
+    _create_database(dbfile, config)
+
+
+def _create_database(dbfile: Path, config):
+    sql_script = PYOPTDB_DIR / config["sqlite3"].get("schema", None)
+
     logger.debug(f"Creating new data base file {dbfile}...")
-    with sqlite3.connect(dbfile) as con:
-        cur = con.cursor()
+    # auto_vacuum only takes effect before the first table is created and is
+    # ignored once the journal mode is WAL, so the schema is created on a
+    # plain connection first; lets `pyoptdb prune` return free pages without
+    # rewriting the file
+    with contextlib.closing(sqlite3.connect(dbfile)) as con:
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
         with open(sql_script, "r") as f:
             sql = f.read()
             logger.debug(f"Executing {sql_script}...")
-            cur.executescript(sql)
+            con.executescript(sql)
+
+    with _connect(dbfile, config) as con:
+        _upgrade(con)
+    con.close()
@@ -1,348 +1,1072 @@
-"""Copyright 2024 Technical University Darmstadt
-
-   Licensed under the Apache License, Version 2.0 (the "License");
-   you may not use this file except in compliance with the License.
-   You may obtain a copy of the License at
-
-       http://www.apache.org/licenses/LICENSE-2.0
-
-   Unless required by applicable law or agreed to in writing, software
-   distributed under the License is distributed on an "AS IS" BASIS,
-   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-   See the License for the specific language governing permissions and
-   limitations under the License.
-"""
-
-import hashlib
-import importlib
-import io
-import pathlib
-import shutil
-import sys
-import sqlite3
-import uuid
-
-import pyomo.environ as pyo
-from pyomo.opt import SolverResults
-
-# from pyoptdb import CONFIG_PATH_LOCAL, CONFIG_PATH_GLOBAL
-from pyoptdb.config import _get_config
-
-# MODEL_UUID1 = uuid.uuid1()
-DATA_SET_UUID1 = uuid.uuid1()
-SOLUTION_UUID1 = uuid.uuid1()
-
-
-def _get_model(
-    model_file: pathlib.Path, datacmd_file: pathlib.Path = None
-) -> pyo.ConcreteModel:
-    sys.path.append(str(model_file.parent))
-
-    module = importlib.import_module(model_file.stem)
-    model = module.pyomo_create_model()
-
-    if isinstance(model, pyo.AbstractModel):
-        return model.create_instance(filename=datacmd_file.as_posix())
-    else:
-        return model
-
-
-def str_repr_index(idx):
-    # if isinstance(idx, tuple):
-    str_repr = str(idx).replace(
-        "'", "''"
-    )  # "(" + ",".join(f"''{i}''" for i in idx) + ")"
-    # else:
-    #     str_repr = f"\\'{idx}\\'"
-    return str_repr
-
-
-def _load_solution(model: pyo.ConcreteModel, sol_file: pathlib.Path):
-
-    results = SolverResults()
-    results.read(filename=sol_file)
-
-    # fix the solution object, otherwise results.solutions.load_from(...) won't work
-    results.solution(0)._cuid = False
-    results.solution.Constraint = {}
-
-    model.solutions.load_from(results)
-
-    # default_variable_value=0 doesn't work because smap_id = None,
-    # so we set them manually
-    for var in model.component_data_objects(pyo.Var):
-        if var.value is None:
-            var.value = 0
-
-
-def _insert_into_files(
-    ostream, filename: pathlib.Path, kind: str, _id: str, file_archive: str
-):
-
-    with open(filename, "r") as f:
-        lines = f.read()
-
-    checksum = hashlib.md5(lines.encode("utf-8"))
-    dst = file_archive / (checksum.hexdigest() + filename.suffix)
-
-    shutil.copyfile(filename, dst)
-
-    ostream.write(
-        "INSERT OR IGNORE INTO files(file_location,md5_checksum,file_kind,file_type) \n"
-        + "VALUES(\n\t'{}',\n\t'{}',\n\t'{}',\n\t'{}'\n);\n\n".format(
-            dst.as_posix(), checksum.hexdigest(), kind, "".join(filename.suffixes)
-        )
-    )
-
-    if kind == "model":
-        ostream.write(
-            "INSERT OR IGNORE INTO model_has_file(model_id,file_id)\n"
-            + "VALUES (\n\t(\n\t{}\n\t),\n\t(\n\t{}\n\t)\n);\n\n".format(
-                "SELECT model_id from models " f"WHERE model_name='{_id}'",
-                "SELECT file_id FROM files "
-                f"WHERE md5_checksum='{checksum.hexdigest()}'",
-            )
-        )
-    elif kind == "data":
-        ostream.write(
-            "INSERT OR IGNORE INTO data_set_has_file(data_set_id,file_id)\n"
-            + "VALUES (\n\t(\n\t{}\n\t),\n\t(\n\t{}\n\t)\n);\n\n".format(
-                "SELECT data_set_id from data_sets " f"WHERE data_set_uuid1='{_id}'",
-                "SELECT file_id FROM files "
-                f"WHERE md5_checksum='{checksum.hexdigest()}'",
-            )
-        )
-    elif kind == "sol":
-        ostream.write(
-            "INSERT OR IGNORE INTO solution_has_file(solution_id,file_id) \n"
-            + "VALUES (\n\t(\n\t{}\n\t),\n\t(\n\t{}\n\t)\n);\n\n".format(
-                "SELECT solution_id from solutions " f"WHERE solution_uuid1='{_id}'",
-                "SELECT file_id FROM files "
-                f"WHERE md5_checksum='{checksum.hexdigest()}'",
-            )
-        )
-    else:
-        raise ValueError(f"unknown `file_type` {kind}")
-
-
-def _insert_into_params(ostream, param: pyo.Param):
-    ostream.write(
-        "INSERT OR IGNORE INTO parameters(model_id,param_name,description) \n"
-        + "VALUES (\n\t(\n\tSELECT model_id FROM models\n\t\tWHERE\n\t\tmodel_name='{}'\n\t),\n\t'{}',\n\t'{}'\n);\n\n".format(
-            param.model().name.strip("\'").strip("\""), param.name, param.doc
-        )
-    )
-
-
-def _insert_into_sets(ostream, _set: pyo.Set):
-    ostream.write(
-        "INSERT OR IGNORE INTO sets(model_id,set_name,description) \n"
-        + "VALUES (\n\t(\n\tSELECT model_id FROM models\n\t\tWHERE\n\t\tmodel_name='{}'\n\t),\n\t'{}',\n\t'{}'\n);\n\n".format(
-            _set.model().name.strip("\'").strip("\""), _set.name, _set.doc
-        )
-    )
-
-
-def _insert_into_vars(ostream, var: pyo.Var):
-    ostream.write(
-        "INSERT OR IGNORE INTO variables(model_id,var_name,description) \n"
-        + "VALUES (\n\t(\n\tSELECT model_id FROM models\n\t\tWHERE\n\t\tmodel_name='{}'\n\t),\n\t'{}',\n\t'{}'\n);\n\n".format(
-            var.model().name.strip("\'").strip("\""), var.name, var.doc
-        )
-    )
-
-
-def _insert_or_ignore_model(
-    ostream,
-    model: pyo.ConcreteModel,
-    _class: str,
-    is_convex: bool,
-    filename: str,
-    file_archive: str,
-):
-    ostream.write(
-        "INSERT OR IGNORE INTO models(model_name,model_class,model_is_convex,description) \n"
-        + "VALUES(\n\t'{}',\n\t'{}',\n\t{},\n\t'{}'\n);\n\n".format(
-            model.name.strip("\'").strip("\""), _class, 1 if is_convex else 0, model.doc
-        )
-    )
-
-    for name in model.component_map(pyo.Param):
-        _insert_into_params(ostream, getattr(model, name))
-
-    for name in model.component_map(pyo.Set):
-        _insert_into_sets(ostream, getattr(model, name))
-
-    for name in model.component_map(pyo.Var):
-        _insert_into_vars(ostream, getattr(model, name))
-
-    _insert_into_files(
-        ostream, filename, "model", _id=model.name.strip("\'").strip("\""), file_archive=file_archive
-    )
-
-
-def _insert_or_ignore_data_set(
-    ostream, model: pyo.ConcreteModel, filename: str, file_archive: str
-):
-
-    ostream.write(
-        "INSERT OR IGNORE INTO data_sets(data_set_uuid1,model_id) \n"
-        + "VALUES(\n\t'{}',\n\t(\n\t\tSELECT model_id from models\n\t\tWHERE model_name='{}'\n\t)\n);\n\n".format(
-            DATA_SET_UUID1, model.name.strip("\'").strip("\"")
-        )
-    )
-
-    for name in model.component_map(pyo.Param):
-        param = getattr(model, name)
-
-        ostream.write(
-            "INSERT OR IGNORE INTO parameter_data(data_set_id,param_id,index_str,value)\nVALUES\n"
-            + ",\n".join(
-                "\t("
-                + "\n\t\t({}),\n\t\t({}),\n\t\t'{}',\n\t\t{}\n\t".format(
-                    f"SELECT data_set_id from data_sets WHERE data_set_uuid1='{DATA_SET_UUID1}'",
-                    f"SELECT param_id from parameters WHERE param_name='{param.name}'",
-                    str_repr_index(idx),
-                    pyo.value(param[idx]),
-                )
-                + ")"
-                for idx in param.keys()
-            )
-            + ";\n\n"
-        )
-
-    for name in model.component_map(pyo.Set):
-        _set = getattr(model, name)
-
-        if _set.is_indexed():
-            raise NotImplementedError("TODO indexed sets")
-        else:
-            ostream.write(
-                "INSERT OR IGNORE INTO set_data(data_set_id,set_id,index_str,value)\nVALUES\n"
-                + ",\n".join(
-                    "\t("
-                    + "\n\t\t({}),\n\t\t({}),\n\t\t'{}',\n\t\t'{}'\n\t".format(
-                        f"SELECT data_set_id from data_sets WHERE data_set_uuid1='{DATA_SET_UUID1}'",
-                        f"SELECT set_id from sets WHERE set_name='{_set.name}'",
-                        "None",
-                        str(_member).replace("'", "''"),
-                    )
-                    + ")"
-                    for _member in _set
-                )
-                + ";\n\n"
-            )
-
-    _insert_into_files(
-        ostream, filename, "data", _id=DATA_SET_UUID1, file_archive=file_archive
-    )
-
-
-def _insert_or_ignore_solution(
-    ostream, model: pyo.ConcreteModel, filename: str, file_archive: str
-):
-    # meta = model.solutions[0]._metadata  # data["Solution"][1]
-
-    results = SolverResults()
-    results.read(filename=filename)
-
-    data = results.json_repn()
-
-    ostream.write(
-        "INSERT OR IGNORE INTO solutions(data_set_id,solution_uuid1,sol_message,sol_status,objective,gap,time_seconds) \n"
-        + "VALUES(\n\t(\n\t\tSELECT data_set_id from data_sets\n\t\tWHERE data_set_uuid1='{}'\n\t),\n\t'{}',\n\t'{}',\n\t'{}',\n\t{},\n\t{},\n\t{}\n);\n\n".format(
-            DATA_SET_UUID1,
-            SOLUTION_UUID1,
-            data["Solver"][0]["Message"],
-            data["Solver"][0]["Termination condition"],
-            list(data["Solution"][1]["Objective"].values())[0]["Value"],
-            (
-                "NULL"
-                if data["Solution"][1]["Gap"] == "None"
-                else data["Solution"][1]["Gap"]
-            ),
-            data["Solver"][0]["Time"],
-        )
-    )
-
-    for name in model.component_map(pyo.Var):
-        var = getattr(model, name)
-
-        ostream.write(
-            "INSERT OR IGNORE INTO variable_data(solution_id,var_id,index_str,value)\nVALUES\n"
-            + ",\n".join(
-                "\t("
-                + "\n\t\t({}),\n\t\t({}),\n\t\t'{}',\n\t\t{}\n\t".format(
-                    f"SELECT solution_id from solutions WHERE solution_uuid1='{SOLUTION_UUID1}'",
-                    f"SELECT var_id from variables WHERE var_name='{var.name}'",
-                    str_repr_index(idx),
-                    pyo.value(var[idx]),
-                )
-                + ")"
-                for idx in var.keys()
-            )
-            + ";\n\n"
-        )
-
-    _insert_into_files(
-        ostream, filename, "sol", _id=SOLUTION_UUID1, file_archive=file_archive
-    )
-
-
-def _insert(args):
-
-    config = _get_config()
-
-    dbfile = pathlib.Path(config["sqlite3"].get("file", None))
-    if dbfile is None:
-        raise ValueError("No legal file name for sqlite3['file']")
-
-    file_archive = pathlib.Path(config["archive"].get("directory", None))
-    if file_archive is None:
-        raise ValueError("No legal name for file_archive.directory")
-
-    model = _get_model(
-        model_file=pathlib.Path(args.MODEL).resolve(),
-        datacmd_file=pathlib.Path(args.DATA).resolve(),
-    )
-
-    _load_solution(model, sol_file=pathlib.Path(args.SOL).resolve())
-
-    # param_set_id = uuid.uuid3(uuid.NAMESPACE_OID, "param_set")
-
-    with io.StringIO() as f:
-        _insert_or_ignore_model(
-            f,
-            model,
-            "nlp",
-            True,
-            pathlib.Path(args.MODEL).resolve(),
-            file_archive=file_archive,
-        )
-        _insert_or_ignore_data_set(
-            f, model, pathlib.Path(args.DATA).resolve(), file_archive=file_archive
-        )
-        _insert_or_ignore_solution(
-            f, model, pathlib.Path(args.SOL).resolve(), file_archive=file_archive
-        )
-
-        sql = f.getvalue()
-
-    with open("log.txt", "w") as f:
-        f.write(sql)
-
-    with sqlite3.connect(dbfile) as con:
-        cur = con.cursor()
-        cur.executescript(sql)
-
-
-#     if param.is_indexed():
-#         index = param.index_set()
-
-#         # individual index sets into index_sets
-#         if isinstance(index, pyomo.core.base.set.SetProduct):
-#             for s in index.subsets():  # index._sets
-#                 _insert_or_ignore_index(ostream, s)
-#                 ostream.write("INSERT OR IGNORE INTO multi_index ()")
-#         else:
-#             _insert_or_ignore_index(ostream, index)
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+import array
+import collections
+import contextlib
+import dataclasses
+import functools
+import glob
+import itertools
+import importlib
+import logging
+import operator
+import os
+import pathlib
+import sys
+import sqlite3
+import time
+from typing import TYPE_CHECKING
+import uuid
+
+# pyomo is imported where it is needed, it takes most of the start-up time
+# and is not needed at all if the model and data file are already stored
+if TYPE_CHECKING:
+    import pyomo.environ as pyo
+    from pyomo.opt import SolverResults
+
+# from pyoptdb import CONFIG_PATH_LOCAL, CONFIG_PATH_GLOBAL
+from pyoptdb.archive import Archive
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect, _executemany_chunked
+from pyoptdb.delta import _Delta, _insert_delta_rows
+from pyoptdb.indices import _index_ids
+from pyoptdb.instrument import _write_json, count, count_rows, phase, profiling
+from pyoptdb.migrate import _check_schema_version
+from pyoptdb.structure import (
+    ModelStructure,
+    StructureCache,
+    _extract_structure,
+    _index_strs,
+    _labels,
+    _param_values,
+    _set_members,
+)
+from pyoptdb.storage import Storage, _insert_or_ignore_index_dict, _storage, pack
+from pyoptdb.summary import _Summary
+from pyoptdb.shards import _route
+from pyoptdb.sol import (
+    SolutionFile,
+    _results_header,
+    is_ampl_sol,
+    read_ampl_sol,
+    read_solution,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class _ModelIds:
+    model_id: int
+    param_ids: dict = dataclasses.field(default_factory=dict)
+    set_ids: dict = dataclasses.field(default_factory=dict)
+    var_ids: dict = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class _ParsedSolution:
+    filename: pathlib.Path
+    message: str
+    status: str
+    objective: float
+    gap: float
+    time_seconds: float
+    # variable name -> array of the values in the order of var.keys()
+    values: dict
+    # generated on insert if None
+    solution_uuid1: str = None
+
+
+def _get_model(
+    model_file: pathlib.Path, datacmd_file: pathlib.Path = None
+) -> pyo.ConcreteModel:
+    import pyomo.environ as pyo
+
+    sys.path.append(str(model_file.parent))
+
+    module = importlib.import_module(model_file.stem)
+    model = module.pyomo_create_model()
+
+    if isinstance(model, pyo.AbstractModel):
+        return model.create_instance(
+            filename=None if datacmd_file is None else datacmd_file.as_posix()
+        )
+    else:
+        return model
+
+
+def _solution_files(patterns: list, manifest: pathlib.Path = None):
+    # SOL arguments and manifest lines are paths or glob patterns
+    patterns = list(patterns)
+
+    if manifest is not None:
+        with open(manifest, "r") as f:
+            patterns.extend(
+                line.strip()
+                for line in f
+                if line.strip() and not line.lstrip().startswith("#")
+            )
+
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                logger.warning(f"no files match {pattern}")
+            for match in matches:
+                yield pathlib.Path(match).resolve()
+        else:
+            yield pathlib.Path(pattern).resolve()
+
+
+def _read_results(sol_file: pathlib.Path) -> SolverResults:
+    from pyomo.opt import SolverResults
+
+    results = SolverResults()
+    results.read(filename=sol_file)
+    return results
+
+
+def _load_solution(model: pyo.ConcreteModel, results: SolverResults):
+    import pyomo.environ as pyo
+
+    # the instance is reused for many solutions, so forget the previous values
+    for var in model.component_data_objects(pyo.Var):
+        var.value = None
+
+    # fix the solution object, otherwise results.solutions.load_from(...) won't work
+    results.solution(0)._cuid = False
+    results.solution.Constraint = {}
+
+    model.solutions.load_from(results)
+
+    # default_variable_value=0 doesn't work because smap_id = None,
+    # so we set them manually
+    for var in model.component_data_objects(pyo.Var):
+        if var.value is None:
+            var.value = 0
+
+
+def _parse_solution(model: pyo.ConcreteModel, sol_file: pathlib.Path):
+    import pyomo.environ as pyo
+
+    if is_ampl_sol(sol_file):
+        with phase("read_results"):
+            solution = read_ampl_sol(sol_file)
+        return _ParsedSolution(
+            filename=sol_file,
+            message=solution.message,
+            status=solution.status,
+            objective=solution.objective,
+            gap=solution.gap,
+            time_seconds=solution.time_seconds,
+            values={
+                name: array.array(
+                    "d", (solution.values.get(v.name, 0) for v in var.values())
+                )
+                for name, var in model.component_map(pyo.Var).items()
+            },
+        )
+
+    with phase("read_results"):
+        results = _read_results(sol_file)
+    header = _results_header(results)
+
+    with phase("load_solution"):
+        _load_solution(model, results)
+
+    return _ParsedSolution(
+        filename=sol_file,
+        values={
+            name: array.array("d", (pyo.value(v) for v in var.values()))
+            for name, var in model.component_map(pyo.Var).items()
+        },
+        **header,
+    )
+
+
+# state of the worker processes for parallel parsing, see _parse_solutions
+_worker_model = None
+
+
+def _init_worker(model_file: pathlib.Path, datacmd_file: pathlib.Path):
+    global _worker_model
+    _worker_model = _get_model(model_file, datacmd_file)
+
+
+def _parse_worker(sol_file: pathlib.Path) -> _ParsedSolution:
+    return _parse_solution(_worker_model, sol_file)
+
+
+def _imap_ordered(fn, items, jobs: int, initializer=None, initargs=()):
+    # results are yielded in input order and at most 2*jobs of them are held
+    # in memory at any time
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=initializer, initargs=initargs
+    ) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _parse_solutions(
+    model: pyo.ConcreteModel,
+    sol_files: list,
+    jobs: int,
+    model_file: pathlib.Path,
+    datacmd_file: pathlib.Path,
+):
+    if jobs == 1:
+        for sol_file in sol_files:
+            yield _parse_solution(model, sol_file)
+        return
+
+    # every worker builds its own instance once
+    yield from _imap_ordered(
+        _parse_worker,
+        sol_files,
+        jobs,
+        initializer=_init_worker,
+        initargs=(model_file, datacmd_file),
+    )
+
+
+def _timed(iterable, name: str):
+    # times producing the items, e.g. parsing in this or waiting for the
+    # worker processes
+    it = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def _read_solutions(sol_files: list, jobs: int):
+    if jobs == 1:
+        yield from map(read_solution, sol_files)
+    else:
+        yield from _imap_ordered(read_solution, sol_files, jobs)
+
+
+_FILE_LINKS = {
+    "model": ("model_has_file", "model_id"),
+    "data": ("data_set_has_file", "data_set_id"),
+    "sol": ("solution_has_file", "solution_id"),
+}
+
+
+def _insert_into_files(
+    cur: sqlite3.Cursor,
+    filename: pathlib.Path,
+    kind: str,
+    _id: int,
+    file_archive: Archive,
+) -> int:
+
+    if kind not in _FILE_LINKS:
+        raise ValueError(f"unknown `file_type` {kind}")
+    if filename is None:
+        # recorded from a model in memory, see pyoptdb/recorder.py
+        return None
+
+    checksum = file_archive.checksum(filename)
+
+    row = cur.execute(
+        "SELECT file_id, file_location FROM files WHERE md5_checksum=?", (checksum,)
+    ).fetchone()
+
+    if row is not None and pathlib.Path(row[1]).exists():
+        # same content as an archived file, nothing to copy
+        count("files_deduplicated")
+        return _link_file(cur, kind, _id, row[0])
+
+    with phase("archive"):
+        dst = file_archive.store(filename, checksum)
+
+    if row is not None:
+        # the archived copy went missing
+        cur.execute(
+            "UPDATE files SET file_location=?, compression=? WHERE file_id=?",
+            (dst.as_posix(), file_archive.compression, row[0]),
+        )
+        return _link_file(cur, kind, _id, row[0])
+
+    cur.execute(
+        "INSERT OR IGNORE INTO files(file_location,md5_checksum,file_kind,file_type,checksum_algorithm,compression,file_size) "
+        "VALUES (?,?,?,?,?,?,?)",
+        (
+            dst.as_posix(),
+            checksum,
+            kind,
+            "".join(filename.suffixes),
+            file_archive.algorithm,
+            file_archive.compression,
+            os.stat(filename).st_size,
+        ),
+    )
+    count_rows("files", cur.rowcount)
+    (file_id,) = cur.execute(
+        "SELECT file_id FROM files WHERE md5_checksum=?", (checksum,)
+    ).fetchone()
+
+    return _link_file(cur, kind, _id, file_id)
+
+
+def _link_file(cur: sqlite3.Cursor, kind: str, _id: int, file_id: int) -> int:
+    table, column = _FILE_LINKS[kind]
+    cur.execute(
+        f"INSERT OR IGNORE INTO {table}({column},file_id) VALUES (?,?)",
+        (_id, file_id),
+    )
+    count_rows(table, cur.rowcount)
+
+    return file_id
+
+
+def _insert_into_params(cur: sqlite3.Cursor, model_id: int, param) -> int:
+    cur.execute(
+        "INSERT OR IGNORE INTO parameters(model_id,param_name,description) "
+        "VALUES (?,?,?)",
+        (model_id, param.name, param.doc),
+    )
+    count_rows("parameters", cur.rowcount)
+    (param_id,) = cur.execute(
+        "SELECT param_id FROM parameters WHERE model_id=? AND param_name=?",
+        (model_id, param.name),
+    ).fetchone()
+    return param_id
+
+
+def _insert_into_sets(cur: sqlite3.Cursor, model_id: int, _set) -> int:
+    cur.execute(
+        "INSERT OR IGNORE INTO sets(model_id,set_name,description) VALUES (?,?,?)",
+        (model_id, _set.name, _set.doc),
+    )
+    count_rows("sets", cur.rowcount)
+    (set_id,) = cur.execute(
+        "SELECT set_id FROM sets WHERE model_id=? AND set_name=?",
+        (model_id, _set.name),
+    ).fetchone()
+    return set_id
+
+
+def _insert_into_vars(cur: sqlite3.Cursor, model_id: int, var) -> int:
+    cur.execute(
+        "INSERT OR IGNORE INTO variables(model_id,var_name,description) "
+        "VALUES (?,?,?)",
+        (model_id, var.name, var.doc),
+    )
+    count_rows("variables", cur.rowcount)
+    (var_id,) = cur.execute(
+        "SELECT var_id FROM variables WHERE model_id=? AND var_name=?",
+        (model_id, var.name),
+    ).fetchone()
+    return var_id
+
+
+def _insert_or_ignore_model(
+    cur: sqlite3.Cursor,
+    structure: ModelStructure,
+    _class: str,
+    is_convex: bool,
+    filename: pathlib.Path,
+    file_archive: Archive,
+) -> _ModelIds:
+    cur.execute(
+        "INSERT OR IGNORE INTO models(model_name,model_class,model_is_convex,description) "
+        "VALUES (?,?,?,?)",
+        (structure.name, _class, 1 if is_convex else 0, structure.doc),
+    )
+    count_rows("models", cur.rowcount)
+    (model_id,) = cur.execute(
+        "SELECT model_id FROM models WHERE model_name=?", (structure.name,)
+    ).fetchone()
+
+    ids = _ModelIds(model_id)
+
+    for param in structure.params:
+        ids.param_ids[param.name] = _insert_into_params(cur, model_id, param)
+
+    for _set in structure.sets:
+        ids.set_ids[_set.name] = _insert_into_sets(cur, model_id, _set)
+
+    for var in structure.vars:
+        ids.var_ids[var.name] = _insert_into_vars(cur, model_id, var)
+
+    _insert_into_files(cur, filename, "model", _id=model_id, file_archive=file_archive)
+
+    return ids
+
+
+def _insert_or_ignore_data_set(
+    cur: sqlite3.Cursor,
+    structure: ModelStructure,
+    component,
+    ids: _ModelIds,
+    filename: pathlib.Path,
+    file_archive: Archive,
+    chunk_size: int,
+    storage: Storage = Storage.rows,
+) -> int:
+    # component(name) -> the component of the instance, e.g. model.component,
+    # or its copy (see structure._Copy)
+    data_checksum = structure.data_checksum
+
+    # a data set with the same values is reused, its rows are not rewritten
+    row = cur.execute(
+        "SELECT data_set_id FROM data_sets WHERE model_id=? AND data_checksum=?",
+        (ids.model_id, data_checksum),
+    ).fetchone()
+    if row is not None:
+        (data_set_id,) = row
+        logger.debug(f"data set {data_set_id} has the same values, reusing it")
+        if not cur.execute(
+            "SELECT EXISTS (SELECT 1 FROM variable_labels WHERE data_set_id=?)",
+            (data_set_id,),
+        ).fetchone()[0]:
+            _insert_variable_labels(
+                cur, structure, component, ids, data_set_id, chunk_size
+            )
+        _insert_into_files(
+            cur, filename, "data", _id=data_set_id, file_archive=file_archive
+        )
+        return data_set_id
+
+    cur.execute(
+        "INSERT INTO data_sets(data_set_uuid1,model_id,data_checksum) VALUES (?,?,?)",
+        (str(uuid.uuid1()), ids.model_id, data_checksum),
+    )
+    count_rows("data_sets", cur.rowcount)
+    data_set_id = cur.lastrowid
+
+    for param in structure.params:
+        param_id = ids.param_ids[param.name]
+        param = component(param.name)
+
+        if storage == Storage.columnar and _insert_or_ignore_param_array(
+            cur, param, param_id, data_set_id, chunk_size
+        ):
+            continue
+
+        _executemany_chunked(
+            cur,
+            "INSERT OR IGNORE INTO parameter_data(data_set_id,param_id,index_str,index_id,value) "
+            "VALUES (?,?,?,?,?)",
+            (
+                (data_set_id, param_id, index_str, index_id, value)
+                for index_str, index_id, value in zip(
+                    _index_strs(param),
+                    _index_ids(cur, _index_strs(param), chunk_size),
+                    _param_values(param),
+                )
+            ),
+            chunk_size,
+        )
+
+    for _set in structure.sets:
+        set_id = ids.set_ids[_set.name]
+        (index_id,) = _index_ids(cur, ["None"], chunk_size)
+
+        _executemany_chunked(
+            cur,
+            "INSERT OR IGNORE INTO set_data(data_set_id,set_id,index_str,index_id,value,member_id) "
+            "VALUES (?,?,?,?,?,?)",
+            (
+                (data_set_id, set_id, "None", index_id, _member, member_id)
+                for _member, member_id in zip(
+                    _set_members(component(_set.name)),
+                    _index_ids(cur, _set_members(component(_set.name)), chunk_size),
+                )
+            ),
+            chunk_size,
+        )
+
+    _insert_variable_labels(cur, structure, component, ids, data_set_id, chunk_size)
+
+    _insert_into_files(
+        cur, filename, "data", _id=data_set_id, file_archive=file_archive
+    )
+
+    return data_set_id
+
+
+def _insert_or_ignore_param_array(
+    cur: sqlite3.Cursor,
+    param,
+    param_id: int,
+    data_set_id: int,
+    chunk_size: int,
+) -> bool:
+    try:
+        value_array = pack(_param_values(param))
+    except TypeError:
+        # non-numeric parameters are stored as rows
+        return False
+
+    index_dict_id = _insert_or_ignore_index_dict(
+        cur, lambda: _index_strs(param), chunk_size
+    )
+    cur.execute(
+        "INSERT OR IGNORE INTO parameter_arrays(data_set_id,param_id,index_dict_id,value_array) "
+        "VALUES (?,?,?,?)",
+        (data_set_id, param_id, index_dict_id, value_array),
+    )
+    count_rows("parameter_arrays", cur.rowcount)
+    return True
+
+
+def _insert_variable_labels(
+    cur: sqlite3.Cursor,
+    structure: ModelStructure,
+    component,
+    ids: _ModelIds,
+    data_set_id: int,
+    chunk_size: int,
+):
+    # labels map the names used in solution files to the stored (var_id,
+    # index_str), the rowid order is the order of the variable_data rows
+    for var in structure.vars:
+        var_id = ids.var_ids[var.name]
+        var = component(var.name)
+
+        _executemany_chunked(
+            cur,
+            "INSERT OR IGNORE INTO variable_labels(data_set_id,var_id,index_str,index_id,label) "
+            "VALUES (?,?,?,?,?)",
+            (
+                (data_set_id, var_id, index_str, index_id, label)
+                for index_str, index_id, label in zip(
+                    _index_strs(var),
+                    _index_ids(cur, _index_strs(var), chunk_size),
+                    _labels(var),
+                )
+            ),
+            chunk_size,
+        )
+
+
+def _find_labelled_data_set(
+    cur: sqlite3.Cursor, model_checksum: str, data_checksum: str
+) -> int:
+    if data_checksum is None:
+        # a concrete model, its data set has no data file
+        data_file = (
+            "NOT EXISTS (SELECT 1 FROM data_set_has_file dsf "
+            "WHERE dsf.data_set_id=ds.data_set_id) "
+        )
+        params = (model_checksum,)
+    else:
+        data_file = (
+            "EXISTS (SELECT 1 FROM data_set_has_file dsf "
+            "JOIN files fd ON fd.file_id=dsf.file_id "
+            "WHERE dsf.data_set_id=ds.data_set_id AND fd.md5_checksum=?) "
+        )
+        params = (model_checksum, data_checksum)
+
+    row = cur.execute(
+        "SELECT ds.data_set_id FROM data_sets ds "
+        "JOIN model_has_file mf ON mf.model_id=ds.model_id "
+        "JOIN files fm ON fm.file_id=mf.file_id "
+        "WHERE fm.md5_checksum=? AND " + data_file +
+        "AND EXISTS (SELECT 1 FROM variable_labels l WHERE l.data_set_id=ds.data_set_id) "
+        "ORDER BY ds.data_set_id LIMIT 1",
+        params,
+    ).fetchone()
+    return None if row is None else row[0]
+
+
+def _insert_into_solutions(cur: sqlite3.Cursor, data_set_id: int, parsed) -> int:
+    solution_uuid1 = parsed.solution_uuid1 or str(uuid.uuid1())
+
+    cur.execute(
+        "INSERT OR IGNORE INTO solutions(data_set_id,solution_uuid1,sol_message,sol_status,objective,gap,time_seconds) "
+        "VALUES (?,?,?,?,?,?,?)",
+        (
+            data_set_id,
+            solution_uuid1,
+            parsed.message,
+            parsed.status,
+            parsed.objective,
+            parsed.gap,
+            parsed.time_seconds,
+        ),
+    )
+    count_rows("solutions", cur.rowcount)
+    (solution_id,) = cur.execute(
+        "SELECT solution_id FROM solutions WHERE solution_uuid1=?",
+        (solution_uuid1,),
+    ).fetchone()
+
+    return solution_id
+
+
+def _insert_or_ignore_solution(
+    cur: sqlite3.Cursor,
+    structure: ModelStructure,
+    component,
+    ids: _ModelIds,
+    data_set_id: int,
+    parsed: _ParsedSolution,
+    file_archive: Archive,
+    chunk_size: int,
+    storage: Storage = Storage.rows,
+    index_dict_ids: dict = None,
+    index_ids: dict = None,
+    delta: _Delta = None,
+    summary: _Summary = None,
+) -> int:
+    # component(name) -> the component of the instance, the index strings
+    # are streamed from it; only their ids are kept in index_ids
+    solution_id = _insert_into_solutions(cur, data_set_id, parsed)
+
+    if summary is not None or storage == Storage.delta:
+        for var in structure.vars:
+            var_id = ids.var_ids[var.name]
+            if var_id not in index_ids:
+                index_ids[var_id] = _index_ids(
+                    cur, _index_strs(component(var.name)), chunk_size
+                )
+
+    if summary is not None:
+        for var in structure.vars:
+            var_id = ids.var_ids[var.name]
+            summary.add_values(
+                data_set_id,
+                zip(itertools.repeat(var_id), index_ids[var_id], parsed.values[var.name]),
+            )
+
+    if storage == Storage.delta:
+        _insert_delta_rows(
+            cur,
+            solution_id,
+            (
+                (ids.var_ids[var.name], index_str, index_id, value)
+                for var in structure.vars
+                for index_str, index_id, value in zip(
+                    _index_strs(component(var.name)),
+                    index_ids[ids.var_ids[var.name]],
+                    parsed.values[var.name],
+                )
+            ),
+            delta,
+            chunk_size,
+        )
+        _insert_into_files(
+            cur, parsed.filename, "sol", _id=solution_id, file_archive=file_archive
+        )
+        return solution_id
+
+    for var in structure.vars:
+        var_id = ids.var_ids[var.name]
+        var = component(var.name)
+
+        if storage == Storage.columnar:
+            if var_id not in index_dict_ids:
+                index_dict_ids[var_id] = _insert_or_ignore_index_dict(
+                    cur, lambda: _index_strs(var), chunk_size
+                )
+            _insert_into_variable_arrays(
+                cur,
+                solution_id,
+                var_id,
+                index_dict_ids[var_id],
+                parsed.values[var.name],
+            )
+            continue
+
+        if var_id not in index_ids:
+            index_ids[var_id] = _index_ids(cur, _index_strs(var), chunk_size)
+
+        _executemany_chunked(
+            cur,
+            "INSERT OR IGNORE INTO variable_data(solution_id,var_id,index_str,index_id,value) "
+            "VALUES (?,?,?,?,?)",
+            (
+                (solution_id, var_id, index_str, index_id, value)
+                for index_str, index_id, value in zip(
+                    _index_strs(var), index_ids[var_id], parsed.values[var.name]
+                )
+            ),
+            chunk_size,
+        )
+
+    _insert_into_files(
+        cur, parsed.filename, "sol", _id=solution_id, file_archive=file_archive
+    )
+
+    return solution_id
+
+
+def _insert_into_variable_arrays(
+    cur: sqlite3.Cursor, solution_id: int, var_id: int, index_dict_id: int, values
+):
+    cur.execute(
+        "INSERT OR IGNORE INTO variable_arrays(solution_id,var_id,index_dict_id,value_array) "
+        "VALUES (?,?,?,?)",
+        (solution_id, var_id, index_dict_id, pack(values)),
+    )
+    count_rows("variable_arrays", cur.rowcount)
+
+
+def _insert_or_ignore_labelled_solution(
+    cur: sqlite3.Cursor,
+    data_set_id: int,
+    solution: SolutionFile,
+    file_archive: Archive,
+    chunk_size: int,
+    storage: Storage = Storage.rows,
+    index_dict_ids: dict = None,
+    delta: _Delta = None,
+    summary: _Summary = None,
+) -> int:
+    solution_id = _insert_into_solutions(cur, data_set_id, solution)
+
+    if summary is not None:
+        summary.add_labelled(cur, data_set_id, solution.values)
+
+    cur.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS solution_values("
+        "label TEXT PRIMARY KEY, value REAL)"
+    )
+    cur.execute("DELETE FROM temp.solution_values")
+    _executemany_chunked(
+        cur,
+        "INSERT OR REPLACE INTO temp.solution_values(label,value) VALUES (?,?)",
+        solution.values.items(),
+        chunk_size,
+    )
+
+    if storage == Storage.columnar:
+        rows = cur.connection.execute(
+            "SELECT l.var_id, l.index_str, COALESCE(v.value, 0) "
+            "FROM variable_labels l LEFT JOIN temp.solution_values v ON v.label=l.label "
+            "WHERE l.data_set_id=? ORDER BY l.rowid",
+            (data_set_id,),
+        )
+        # the labels of a variable are consecutive
+        for var_id, group in itertools.groupby(rows, key=operator.itemgetter(0)):
+            _, index_strs, values = zip(*group)
+            if var_id not in index_dict_ids:
+                index_dict_ids[var_id] = _insert_or_ignore_index_dict(
+                    cur, lambda: iter(index_strs), chunk_size
+                )
+            _insert_into_variable_arrays(
+                cur, solution_id, var_id, index_dict_ids[var_id], values
+            )
+    elif storage == Storage.delta:
+        rows = cur.connection.execute(
+            "SELECT l.var_id, l.index_str, l.index_id, COALESCE(v.value, 0) "
+            "FROM variable_labels l LEFT JOIN temp.solution_values v ON v.label=l.label "
+            "WHERE l.data_set_id=? ORDER BY l.rowid",
+            (data_set_id,),
+        )
+        _insert_delta_rows(cur, solution_id, rows, delta, chunk_size)
+    else:
+        cur.execute(
+            "INSERT OR IGNORE INTO variable_data(solution_id,var_id,index_str,index_id,value) "
+            "SELECT ?, l.var_id, l.index_str, l.index_id, COALESCE(v.value, 0) "
+            "FROM variable_labels l LEFT JOIN temp.solution_values v ON v.label=l.label "
+            "WHERE l.data_set_id=? ORDER BY l.rowid",
+            (solution_id, data_set_id),
+        )
+        count_rows("variable_data", cur.rowcount)
+
+    _insert_into_files(
+        cur, solution.filename, "sol", _id=solution_id, file_archive=file_archive
+    )
+
+    return solution_id
+
+
+def _insert(args):
+
+    config = _get_config()
+
+    sol_files = list(_solution_files(args.SOL, manifest=args.MANIFEST))
+    if not sol_files:
+        raise ValueError("no solution files to insert")
+
+    model_file = pathlib.Path(args.MODEL).resolve()
+    # -d is only needed for abstract models
+    datacmd_file = None if args.DATA is None else pathlib.Path(args.DATA).resolve()
+
+    if args.SUBMIT:
+        from pyoptdb.ingest import _submit
+
+        _submit(config, model_file, datacmd_file, sol_files, rebuild=args.REBUILD)
+        return
+
+    # param_set_id = uuid.uuid3(uuid.NAMESPACE_OID, "param_set")
+
+    # the configured database or, with sqlite3.shard, the shard of the model
+    dbfile = _route(config, model_file)
+
+    with contextlib.ExitStack() as stack:
+        # IMMEDIATE takes the write lock at the start of each transaction,
+        # concurrent writers then wait for the busy timeout instead of failing
+        con = stack.enter_context(
+            contextlib.closing(_connect(dbfile, config, isolation_level="IMMEDIATE"))
+        )
+        _check_schema_version(con)
+
+        if args.SQL_LOG is not None:
+            log = stack.enter_context(open(args.SQL_LOG, "w"))
+            con.set_trace_callback(lambda stmt: log.write(stmt + ";\n"))
+
+        with profiling(
+            con, enabled=args.PROFILE or args.PROFILE_JSON is not None
+        ) as profile:
+            n_solutions, n_rows, seconds = _insert_solutions(
+                con,
+                config,
+                model_file,
+                datacmd_file,
+                sol_files,
+                rebuild=args.REBUILD,
+                batch_size=args.BATCH_SIZE,
+                jobs=args.JOBS,
+            )
+
+    _report_throughput(n_solutions, n_rows, seconds)
+
+    if profile is not None:
+        if args.PROFILE:
+            print(profile.summary())
+        if args.PROFILE_JSON is not None:
+            _write_json(profile, args.PROFILE_JSON)
+
+
+def _insert_solutions(
+    con: sqlite3.Connection,
+    config,
+    model_file: pathlib.Path,
+    datacmd_file: pathlib.Path,
+    sol_files: list,
+    rebuild: bool = False,
+    batch_size: int = None,
+    jobs: int = None,
+    file_archive: Archive = None,
+    cache: StructureCache = None,
+    record=None,
+) -> tuple:
+    # -> (number of inserted solutions, number of changed rows, seconds spent
+    # on the solutions); solutions already stored are ignored
+    # long running callers pass their own archive and cache, so the model
+    # and data file are hashed once and not on every call. record(cur) runs
+    # first in the transaction of the first batch, after the model has been
+    # built, e.g. to record what is being inserted
+    if file_archive is None:
+        file_archive = Archive.from_config(config)
+    if cache is None:
+        cache = StructureCache.from_config(config)
+
+    chunk_size = config["insert"].getint("chunk_size")
+    if chunk_size < 1:
+        raise ValueError("insert.chunk_size must be a positive integer")
+
+    storage = _storage(config)
+
+    if batch_size is None:
+        batch_size = config["insert"].getint("batch_size")
+    if batch_size < 1:
+        raise ValueError("insert.batch_size must be a positive integer")
+
+    if jobs is None:
+        jobs = config["insert"].getint("jobs")
+    if jobs < 1:
+        raise ValueError("insert.jobs must be a positive integer")
+
+    # if the model and data file are already stored, the solution files
+    # are matched against the stored labels and the model is not built
+    model_checksum = file_archive.checksum(model_file)
+    data_checksum = None if datacmd_file is None else file_archive.checksum(datacmd_file)
+
+    data_set_id = None
+    if not rebuild:
+        with phase("find_data_set"):
+            data_set_id = _find_labelled_data_set(
+                con.cursor(),
+                model_checksum=model_checksum,
+                data_checksum=data_checksum,
+            )
+
+    # otherwise the structure of the model instance and a copy of its data
+    # are taken from the cache, the data set is inserted from the copy and
+    # the solution files are matched against its labels; the model is only
+    # built on a cache miss or with rebuild
+    model, structure, component = None, None, None
+    if data_set_id is None:
+        cached = None
+        if not rebuild:
+            with phase("structure_cache"):
+                cached = cache.get(model_checksum, data_checksum)
+        if cached is None:
+            with phase("get_model"):
+                model = _get_model(model_file=model_file, datacmd_file=datacmd_file)
+            with phase("extract_structure"):
+                structure = _extract_structure(model)
+            with phase("structure_cache"):
+                cache.put(model_checksum, data_checksum, structure, model)
+            component = model.component
+        else:
+            structure, component = cached.structure, cached.components.__getitem__
+    else:
+        logger.debug(f"reusing data set {data_set_id}, skipping model build")
+
+    # commits after every batch, the last (partial) batch is committed
+    # on success, a failing batch is rolled back
+    with con:
+        cur = con.cursor()
+
+        if record is not None:
+            record(cur)
+
+        if structure is not None:
+            with phase("insert_model"):
+                ids = _insert_or_ignore_model(
+                    cur,
+                    structure,
+                    "nlp",
+                    True,
+                    model_file,
+                    file_archive=file_archive,
+                )
+            with phase("insert_data_set"):
+                data_set_id = _insert_or_ignore_data_set(
+                    cur,
+                    structure,
+                    component,
+                    ids,
+                    datacmd_file,
+                    file_archive=file_archive,
+                    chunk_size=chunk_size,
+                    storage=storage,
+                )
+
+        start = time.perf_counter()
+        changes = con.total_changes
+        # solution ids are assigned in increasing order, the inserted ones
+        # are those past the largest id before
+        (last_solution_id,) = cur.execute(
+            "SELECT COALESCE(max(solution_id), 0) FROM solutions"
+        ).fetchone()
+
+        if model is not None:
+            parsed_solutions = _parse_solutions(
+                model,
+                sol_files,
+                jobs=min(jobs, len(sol_files)),
+                model_file=model_file,
+                datacmd_file=datacmd_file,
+            )
+            insert_solution = functools.partial(
+                _insert_or_ignore_solution,
+                cur,
+                structure,
+                model.component,
+                ids,
+                data_set_id,
+                # index ids of the variables, by var_id
+                index_ids={},
+            )
+        else:
+            parsed_solutions = _read_solutions(
+                sol_files, jobs=min(jobs, len(sol_files))
+            )
+            insert_solution = functools.partial(
+                _insert_or_ignore_labelled_solution, cur, data_set_id
+            )
+
+        # index dictionaries of the variables in this data set, by var_id
+        index_dict_ids = {}
+
+        # the base solution the solutions are stored against
+        delta = None
+        if storage == Storage.delta:
+            delta = _Delta.from_config(config, cur, data_set_id)
+
+        # added to the summary tables before every commit
+        summary = None
+        if config["insert"].getboolean("summary"):
+            summary = _Summary()
+            (model_id,) = cur.execute(
+                "SELECT model_id FROM data_sets WHERE data_set_id=?", (data_set_id,)
+            ).fetchone()
+
+        for n, parsed in enumerate(_timed(parsed_solutions, "parse"), start=1):
+            logger.debug(f"inserting {parsed.filename}")
+            with phase("insert_solution"):
+                solution_id = insert_solution(
+                    parsed,
+                    file_archive=file_archive,
+                    chunk_size=chunk_size,
+                    storage=storage,
+                    index_dict_ids=index_dict_ids,
+                    delta=delta,
+                    summary=summary,
+                )
+            count("solutions")
+            if summary is not None:
+                summary.add_solution(
+                    model_id, solution_id, parsed.status, parsed.objective
+                )
+            if n % batch_size == 0:
+                _commit(con, cur, summary, chunk_size)
+
+        _commit(con, cur, summary, chunk_size)
+
+    n_rows, seconds = con.total_changes - changes, time.perf_counter() - start
+    (n_solutions,) = con.execute(
+        "SELECT count(*) FROM solutions WHERE solution_id>?", (last_solution_id,)
+    ).fetchone()
+    return n_solutions, n_rows, seconds
+
+
+def _commit(con: sqlite3.Connection, cur: sqlite3.Cursor, summary, chunk_size: int):
+    if summary is not None:
+        with phase("summary"):
+            summary.flush(cur, chunk_size)
+    with phase("commit"):
+        con.commit()
+
+
+def _report_throughput(n_solutions: int, n_rows: int, seconds: float):
+    seconds = max(seconds, 1e-9)
+    print(
+        f"inserted {n_solutions} solution(s), {n_rows} row(s) in {seconds:.3f} s "
+        f"({n_solutions / seconds:.1f} solutions/s, {n_rows / seconds:.1f} rows/s)"
+    )
+
+
+#     if param.is_indexed():
+#         index = param.index_set()
+
+#         # individual index sets into index_sets
+#         if isinstance(index, pyomo.core.base.set.SetProduct):
+#             for s in index.subsets():  # index._sets
+#                 _insert_or_ignore_index(ostream, s)
+#                 ostream.write("INSERT OR IGNORE INTO multi_index ()")
+#         else:
+#             _insert_or_ignore_index(ostream, index)
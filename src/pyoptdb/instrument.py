@@ -0,0 +1,171 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Per-phase timing and counters of `insert`. Profiling is off unless
+# `--profile`/`--profile-json` is given or a hook is registered; `phase` and
+# `count` then only check a module global.
+#
+#   from pyoptdb import instrument
+#   instrument.add_hook(lambda metrics: send_to_monitoring(metrics))
+
+import contextlib
+import dataclasses
+import json
+import sqlite3
+import time
+
+# the profile of the running insert, None if profiling is off
+_profile = None
+_hooks = []
+
+
+@dataclasses.dataclass
+class Profile:
+    # phase -> [seconds, calls]
+    phases: dict = dataclasses.field(default_factory=dict)
+    counters: dict = dataclasses.field(default_factory=dict)
+    # table -> rows written (inserted, or updated by an UPSERT)
+    rows: dict = dataclasses.field(default_factory=dict)
+    sqlite: dict = dataclasses.field(default_factory=dict)
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "seconds": self.seconds,
+            "phases": {
+                name: {"seconds": seconds, "calls": calls}
+                for name, (seconds, calls) in self.phases.items()
+            },
+            "counters": dict(self.counters),
+            "rows": dict(self.rows),
+            "sqlite": dict(self.sqlite),
+        }
+
+    def summary(self) -> str:
+        lines = [f"{'phase':<24} {'seconds':>10} {'%':>6} {'calls':>8}"]
+        for name, (seconds, calls) in sorted(
+            self.phases.items(), key=lambda item: -item[1][0]
+        ):
+            share = 100 * seconds / self.seconds if self.seconds else 0.0
+            lines.append(f"{name:<24} {seconds:>10.3f} {share:>6.1f} {calls:>8}")
+        lines.append(f"{'total':<24} {self.seconds:>10.3f}")
+
+        for title, values in (
+            ("counter", self.counters),
+            ("rows", self.rows),
+            ("sqlite", self.sqlite),
+        ):
+            if values:
+                lines.append("")
+                lines.extend(f"{title} {name}: {value}" for name, value in values.items())
+        return "\n".join(lines)
+
+
+class _Phase:
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile: Profile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        entry = self.profile.phases.setdefault(self.name, [0.0, 0])
+        entry[0] += time.perf_counter() - self.start
+        entry[1] += 1
+
+
+_NULL_PHASE = contextlib.nullcontext()
+
+
+def phase(name: str):
+    """Time the enclosed block as (part of) phase `name`"""
+    if _profile is None:
+        return _NULL_PHASE
+    return _Phase(_profile, name)
+
+
+def count(name: str, n: int = 1):
+    """Add n to the counter `name`"""
+    if _profile is not None:
+        _profile.counters[name] = _profile.counters.get(name, 0) + n
+
+
+def count_rows(table: str, n: int):
+    """Add n to the rows written to table, e.g. a cursor's rowcount"""
+    if _profile is not None and n > 0:
+        _profile.rows[table] = _profile.rows.get(table, 0) + n
+
+
+def add_hook(hook):
+    """Call hook(metrics: dict) after every profiled insert"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def _sqlite_stats(con: sqlite3.Connection) -> dict:
+    stats = {
+        pragma: con.execute(f"PRAGMA {pragma}").fetchone()[0]
+        for pragma in (
+            "page_size",
+            "page_count",
+            "freelist_count",
+            "cache_size",
+            "journal_mode",
+        )
+    }
+    stats["total_changes"] = con.total_changes
+    return stats
+
+
+@contextlib.contextmanager
+def profiling(con: sqlite3.Connection, enabled: bool = False):
+    """Profile the enclosed insert if enabled or a hook is registered
+
+    Yields the Profile, or None if profiling is off.
+    """
+    global _profile
+
+    if not (enabled or _hooks) or _profile is not None:
+        yield None
+        return
+
+    profile = Profile()
+    page_count = con.execute("PRAGMA page_count").fetchone()[0]
+
+    _profile = profile
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.seconds = time.perf_counter() - start
+        _profile = None
+
+    profile.sqlite = _sqlite_stats(con)
+    profile.sqlite["pages_added"] = profile.sqlite["page_count"] - page_count
+
+    metrics = profile.as_dict()
+    for hook in _hooks:
+        hook(metrics)
+
+
+def _write_json(profile: Profile, filename: str):
+    with open(filename, "w") as f:
+        json.dump(profile.as_dict(), f, indent=2)
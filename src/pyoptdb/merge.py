@@ -0,0 +1,540 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# `pyoptdb merge`: combining databases written separately, e.g. one per
+# compute node, into the configured one.
+#
+# A source database is attached and merged in one transaction, table by table
+# with INSERT ... SELECT. Rows are matched by their natural keys (model names,
+# parameter, set and variable names per model, index strings, index
+# dictionary checksums, data set uuids or data checksums, solution uuids and
+# file checksums); rows not in the target yet are inserted and the source ids
+# are mapped to the target ids in temporary tables (src_id -> dst_id) that the
+# following statements join. Integer primary keys are assigned in increasing
+# order, so the rows inserted by a statement are those with ids past the
+# largest id before it. The data of data sets and solutions already in the
+# target is not copied again, merging a database twice adds nothing.
+#
+# Archived files new to the target are copied into archive.directory. The
+# solutions copied are added to the summary tables in the same transaction.
+
+import collections
+import contextlib
+import glob
+import logging
+import os
+import pathlib
+import sqlite3
+
+from pyoptdb.archive import Archive, _copy, _link_read_only, _same_device
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+from pyoptdb.migrate import SCHEMA_VERSION, _check_schema_version
+from pyoptdb.summary import _add_solutions
+
+logger = logging.getLogger(__name__)
+
+# temporary tables mapping the ids of the source to those of the target
+_MAPS = (
+    "models",
+    "parameters",
+    "sets",
+    "variables",
+    "indices",
+    "index_dicts",
+    "data_sets",
+    "solutions",
+    "files",
+)
+
+
+def _next_id(cur: sqlite3.Cursor, table: str, column: str) -> int:
+    # the smallest id a row inserted into table gets
+    (next_id,) = cur.execute(f"SELECT COALESCE(max({column}), 0) + 1 FROM main.{table}").fetchone()
+    return next_id
+
+
+def _create_maps(cur: sqlite3.Cursor):
+    for name in _MAPS:
+        cur.execute(f"DROP TABLE IF EXISTS temp.map_{name}")
+        cur.execute(
+            f"CREATE TEMP TABLE map_{name}(src_id INTEGER PRIMARY KEY, dst_id INTEGER NOT NULL)"
+        )
+
+
+def _merge_models(cur: sqlite3.Cursor, counts: collections.Counter, model_names: list):
+    where, params = "", ()
+    if model_names is not None:
+        where = f" WHERE s.model_name IN ({','.join('?' * len(model_names))})"
+        params = tuple(model_names)
+
+    cur.execute(
+        "INSERT OR IGNORE INTO main.models(model_name,model_class,model_is_convex,description) "
+        f"SELECT model_name, model_class, model_is_convex, description FROM src.models s{where} "
+        "ORDER BY model_id",
+        params,
+    )
+    counts["models"] += cur.rowcount
+    cur.execute(
+        "INSERT INTO temp.map_models SELECT s.model_id, d.model_id "
+        f"FROM src.models s JOIN main.models d USING(model_name){where}",
+        params,
+    )
+
+    for table, column in (("parameters", "param"), ("sets", "set"), ("variables", "var")):
+        cur.execute(
+            f"INSERT OR IGNORE INTO main.{table}(model_id,{column}_name,description) "
+            f"SELECT m.dst_id, s.{column}_name, s.description FROM src.{table} s "
+            f"JOIN temp.map_models m ON m.src_id=s.model_id ORDER BY s.{column}_id"
+        )
+        counts[table] += cur.rowcount
+        cur.execute(
+            f"INSERT INTO temp.map_{table} SELECT s.{column}_id, d.{column}_id "
+            f"FROM src.{table} s JOIN temp.map_models m ON m.src_id=s.model_id "
+            f"JOIN main.{table} d ON d.model_id=m.dst_id AND d.{column}_name=s.{column}_name"
+        )
+
+
+def _merge_indices(cur: sqlite3.Cursor, counts: collections.Counter):
+    first = _next_id(cur, "indices", "index_id")
+    cur.execute(
+        "INSERT OR IGNORE INTO main.indices(index_str,arity) "
+        "SELECT index_str, arity FROM src.indices ORDER BY index_id"
+    )
+    counts["indices"] += cur.rowcount
+    cur.execute(
+        "INSERT INTO temp.map_indices SELECT s.index_id, d.index_id "
+        "FROM src.indices s JOIN main.indices d USING(index_str)"
+    )
+    cur.execute(
+        "INSERT INTO main.index_components(index_id,position,value) "
+        "SELECT m.dst_id, c.position, c.value FROM temp.map_indices m "
+        "JOIN src.index_components c ON c.index_id=m.src_id WHERE m.dst_id>=?",
+        (first,),
+    )
+
+    first = _next_id(cur, "index_dicts", "index_dict_id")
+    cur.execute(
+        "INSERT OR IGNORE INTO main.index_dicts(checksum,length) "
+        "SELECT checksum, length FROM src.index_dicts ORDER BY index_dict_id"
+    )
+    cur.execute(
+        "INSERT INTO temp.map_index_dicts SELECT s.index_dict_id, d.index_dict_id "
+        "FROM src.index_dicts s JOIN main.index_dicts d USING(checksum)"
+    )
+    cur.execute(
+        "INSERT INTO main.index_dict_entries(index_dict_id,position,index_str,index_id) "
+        "SELECT m.dst_id, e.position, e.index_str, i.dst_id FROM temp.map_index_dicts m "
+        "JOIN src.index_dict_entries e ON e.index_dict_id=m.src_id "
+        "LEFT JOIN temp.map_indices i ON i.src_id=e.index_id WHERE m.dst_id>=?",
+        (first,),
+    )
+
+
+def _merge_data_sets(cur: sqlite3.Cursor, counts: collections.Counter):
+    # a data set with the data checksum of one in the target is that one,
+    # like in insert
+    first = _next_id(cur, "data_sets", "data_set_id")
+    cur.execute(
+        "INSERT OR IGNORE INTO main.data_sets(model_id,data_set_uuid1,data_checksum) "
+        "SELECT m.dst_id, s.data_set_uuid1, s.data_checksum FROM src.data_sets s "
+        "JOIN temp.map_models m ON m.src_id=s.model_id ORDER BY s.data_set_id"
+    )
+    counts["data_sets"] += cur.rowcount
+    cur.execute(
+        "INSERT INTO temp.map_data_sets "
+        "SELECT s.data_set_id, COALESCE(u.data_set_id, c.data_set_id) FROM src.data_sets s "
+        "JOIN temp.map_models m ON m.src_id=s.model_id "
+        "LEFT JOIN main.data_sets u ON u.data_set_uuid1=s.data_set_uuid1 "
+        "LEFT JOIN main.data_sets c ON c.model_id=m.dst_id AND c.data_checksum=s.data_checksum"
+    )
+
+    # the data of the new data sets
+    cur.execute(
+        "INSERT INTO main.parameter_data(data_set_id,param_id,index_str,value,index_id) "
+        "SELECT d.dst_id, p.dst_id, v.index_str, v.value, i.dst_id FROM temp.map_data_sets d "
+        "JOIN src.parameter_data v ON v.data_set_id=d.src_id "
+        "JOIN temp.map_parameters p ON p.src_id=v.param_id "
+        "LEFT JOIN temp.map_indices i ON i.src_id=v.index_id WHERE d.dst_id>=?",
+        (first,),
+    )
+    cur.execute(
+        "INSERT INTO main.parameter_arrays(data_set_id,param_id,index_dict_id,value_array) "
+        "SELECT d.dst_id, p.dst_id, x.dst_id, v.value_array FROM temp.map_data_sets d "
+        "JOIN src.parameter_arrays v ON v.data_set_id=d.src_id "
+        "JOIN temp.map_parameters p ON p.src_id=v.param_id "
+        "JOIN temp.map_index_dicts x ON x.src_id=v.index_dict_id WHERE d.dst_id>=?",
+        (first,),
+    )
+    cur.execute(
+        "INSERT INTO main.set_data(data_set_id,set_id,index_str,value,index_id,member_id) "
+        "SELECT d.dst_id, t.dst_id, v.index_str, v.value, i.dst_id, j.dst_id "
+        "FROM temp.map_data_sets d JOIN src.set_data v ON v.data_set_id=d.src_id "
+        "JOIN temp.map_sets t ON t.src_id=v.set_id "
+        "LEFT JOIN temp.map_indices i ON i.src_id=v.index_id "
+        "LEFT JOIN temp.map_indices j ON j.src_id=v.member_id WHERE d.dst_id>=?",
+        (first,),
+    )
+    # labels are written by the first insert of a solution file, the target
+    # may not have them for a data set it already has
+    cur.execute(
+        "INSERT OR IGNORE INTO main.variable_labels(data_set_id,var_id,index_str,label,index_id) "
+        "SELECT d.dst_id, x.dst_id, v.index_str, v.label, i.dst_id FROM temp.map_data_sets d "
+        "JOIN src.variable_labels v ON v.data_set_id=d.src_id "
+        "JOIN temp.map_variables x ON x.src_id=v.var_id "
+        "LEFT JOIN temp.map_indices i ON i.src_id=v.index_id "
+        "WHERE d.dst_id>=? OR NOT EXISTS "
+        "(SELECT 1 FROM main.variable_labels l WHERE l.data_set_id=d.dst_id)",
+        (first,),
+    )
+
+
+def _merge_solutions(cur: sqlite3.Cursor, counts: collections.Counter) -> int:
+    # returns the id of the first solution inserted
+    first = _next_id(cur, "solutions", "solution_id")
+    cur.execute(
+        "INSERT OR IGNORE INTO main.solutions"
+        "(data_set_id,solution_uuid1,sol_message,sol_status,objective,gap,time_seconds) "
+        "SELECT d.dst_id, s.solution_uuid1, s.sol_message, s.sol_status, s.objective, "
+        "s.gap, s.time_seconds FROM src.solutions s "
+        "JOIN temp.map_data_sets d ON d.src_id=s.data_set_id ORDER BY s.solution_id"
+    )
+    counts["solutions"] += cur.rowcount
+    cur.execute(
+        "INSERT INTO temp.map_solutions SELECT s.solution_id, t.solution_id "
+        "FROM src.solutions s JOIN temp.map_data_sets d ON d.src_id=s.data_set_id "
+        "JOIN main.solutions t USING(solution_uuid1)"
+    )
+    # delta-encoded solutions, see pyoptdb/delta.py
+    cur.execute(
+        "UPDATE main.solutions AS t SET base_solution_id=b.dst_id "
+        "FROM temp.map_solutions m JOIN src.solutions s ON s.solution_id=m.src_id "
+        "JOIN temp.map_solutions b ON b.src_id=s.base_solution_id "
+        "WHERE t.solution_id=m.dst_id AND m.dst_id>=?",
+        (first,),
+    )
+
+    cur.execute(
+        "INSERT INTO main.variable_data(solution_id,var_id,index_str,value,index_id) "
+        "SELECT m.dst_id, x.dst_id, v.index_str, v.value, i.dst_id FROM temp.map_solutions m "
+        "JOIN src.variable_data v ON v.solution_id=m.src_id "
+        "JOIN temp.map_variables x ON x.src_id=v.var_id "
+        "LEFT JOIN temp.map_indices i ON i.src_id=v.index_id WHERE m.dst_id>=?",
+        (first,),
+    )
+    counts["variable_data"] += cur.rowcount
+    cur.execute(
+        "INSERT INTO main.variable_arrays(solution_id,var_id,index_dict_id,value_array) "
+        "SELECT m.dst_id, x.dst_id, i.dst_id, v.value_array FROM temp.map_solutions m "
+        "JOIN src.variable_arrays v ON v.solution_id=m.src_id "
+        "JOIN temp.map_variables x ON x.src_id=v.var_id "
+        "JOIN temp.map_index_dicts i ON i.src_id=v.index_dict_id WHERE m.dst_id>=?",
+        (first,),
+    )
+    counts["variable_arrays"] += cur.rowcount
+    return first
+
+
+def _merge_files(cur: sqlite3.Cursor, counts: collections.Counter, first_solution: int) -> list:
+    # returns (source location, target location) of the files to copy
+    scope = (
+        "SELECT l.file_id FROM src.model_has_file l "
+        "JOIN temp.map_models m ON m.src_id=l.model_id UNION "
+        "SELECT l.file_id FROM src.data_set_has_file l "
+        "JOIN temp.map_data_sets m ON m.src_id=l.data_set_id UNION "
+        "SELECT l.file_id FROM src.solution_has_file l "
+        "JOIN temp.map_solutions m ON m.src_id=l.solution_id"
+    )
+    first = _next_id(cur, "files", "file_id")
+    cur.execute(
+        "INSERT OR IGNORE INTO main.files(file_location,md5_checksum,file_kind,file_type,"
+        "checksum_algorithm,compression,file_size) "
+        "SELECT pyoptdb_merge_location(file_location), md5_checksum, file_kind, file_type, "
+        f"checksum_algorithm, compression, file_size FROM src.files WHERE file_id IN ({scope}) "
+        "ORDER BY file_id"
+    )
+    counts["files"] += cur.rowcount
+    cur.execute(
+        "INSERT INTO temp.map_files SELECT s.file_id, d.file_id FROM src.files s "
+        f"JOIN main.files d USING(md5_checksum) WHERE s.file_id IN ({scope})"
+    )
+
+    for table, column, links in (
+        ("model_has_file", "model_id", "models"),
+        ("data_set_has_file", "data_set_id", "data_sets"),
+        ("solution_has_file", "solution_id", "solutions"),
+    ):
+        cur.execute(
+            f"INSERT OR IGNORE INTO main.{table}({column},file_id) "
+            f"SELECT m.dst_id, f.dst_id FROM src.{table} l "
+            f"JOIN temp.map_{links} m ON m.src_id=l.{column} "
+            "JOIN temp.map_files f ON f.src_id=l.file_id"
+            + (" WHERE m.dst_id>=?" if links == "solutions" else ""),
+            (first_solution,) if links == "solutions" else (),
+        )
+
+    return cur.execute(
+        "SELECT s.file_location, d.file_location FROM temp.map_files m "
+        "JOIN src.files s ON s.file_id=m.src_id JOIN main.files d ON d.file_id=m.dst_id "
+        "WHERE m.dst_id>=?",
+        (first,),
+    ).fetchall()
+
+
+def _locate(location: pathlib.Path, source: pathlib.Path) -> pathlib.Path:
+    # a path written into source, relative ones (the default) are relative to
+    # the working directory of the pyoptdb that wrote it, tried as a directory
+    # containing source; None if it does not exist
+    if location.is_absolute():
+        return location if location.exists() else None
+    return next(
+        (parent / location for parent in source.resolve().parents if (parent / location).exists()),
+        None,
+    )
+
+
+def _copy_files(
+    copies: list, source: pathlib.Path, archive: Archive, archive_dirs: list
+) -> tuple:
+    # returns the number of files copied and of files not found
+    n_copied, n_missing = 0, 0
+    for src_location, dst_location in copies:
+        dst = pathlib.Path(dst_location)
+        if dst.exists():
+            # e.g. a shared archive directory
+            continue
+
+        # where it was archived, or in one of the given directories
+        location = pathlib.Path(src_location)
+        src = _locate(location, source) or next(
+            (
+                path
+                for path in (pathlib.Path(directory) / location.name for directory in archive_dirs)
+                if path.exists()
+            ),
+            None,
+        )
+        if src is None:
+            logger.warning(f"archived file {src_location} of {source} not found")
+            n_missing += 1
+            continue
+
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + f".{os.getpid()}.tmp")
+        try:
+            if archive.hardlink and _same_device(src, dst.parent):
+                _link_read_only(src, tmp)
+            else:
+                _copy(src, tmp)
+            os.replace(tmp, dst)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        n_copied += 1
+
+    return n_copied, n_missing
+
+
+def _merge_source(
+    con: sqlite3.Connection,
+    source: pathlib.Path,
+    archive: Archive,
+    archive_dirs: list,
+    model_names: list,
+    summary: bool,
+    counts: collections.Counter,
+):
+    cur = con.cursor()
+    cur.execute("ATTACH DATABASE ? AS src", (source.as_posix(),))
+    try:
+        (version,) = cur.execute("PRAGMA src.user_version").fetchone()
+        if cur.execute(
+            "SELECT 1 FROM src.sqlite_master WHERE type='table' AND name='solutions'"
+        ).fetchone() is None:
+            raise ValueError(f"{source} is not a pyoptdb database")
+        if version != SCHEMA_VERSION:
+            raise RuntimeError(
+                f"{source} has schema version {version}, expected {SCHEMA_VERSION}, "
+                "run `pyoptdb migrate` on it (or upgrade pyoptdb)"
+            )
+
+        with con:
+            cur.execute("BEGIN IMMEDIATE")
+            _create_maps(cur)
+            _merge_models(cur, counts, model_names)
+            _merge_indices(cur, counts)
+            _merge_data_sets(cur, counts)
+            first_solution = _merge_solutions(cur, counts)
+            copies = _merge_files(cur, counts, first_solution)
+            cur.execute(
+                "INSERT OR IGNORE INTO main.ingested_files"
+                "(path,size,mtime_ns,status,error,ingested_at) "
+                "SELECT path, size, mtime_ns, status, error, ingested_at FROM src.ingested_files"
+            )
+            if summary:
+                _add_solutions(cur, first_solution)
+
+            # copied before the commit, so a committed row never refers to a
+            # file still being copied; files copied for a transaction rolled
+            # back are removed by `pyoptdb prune`
+            n_copied, n_missing = _copy_files(copies, source, archive, archive_dirs)
+            counts["files_copied"] += n_copied
+            counts["files_missing"] += n_missing
+    finally:
+        cur.execute("DETACH DATABASE src")
+
+    logger.info(f"merged {source}")
+
+
+def merge(
+    con: sqlite3.Connection,
+    sources: list,
+    archive: Archive = None,
+    archive_dirs: list = (),
+    model_names: list = None,
+    summary: bool = True,
+) -> collections.Counter:
+    """Merge the source database files into the database of con
+
+    Every source is merged in its own transaction. Archived files are looked
+    up where the source archived them, then in archive_dirs. model_names
+    restricts the models merged, summary=False leaves the summary tables
+    alone. Returns the number of rows inserted per table (and of files
+    copied and missing).
+    """
+    if archive is None:
+        archive = Archive.from_config(_get_config())
+    (target,) = [file for _, name, file in con.execute("PRAGMA database_list") if name == "main"]
+
+    counts = collections.Counter()
+    con.create_function(
+        "pyoptdb_merge_location",
+        1,
+        lambda location: (archive.directory / pathlib.PurePath(location).name).as_posix(),
+        deterministic=True,
+    )
+    for source in sources:
+        source = pathlib.Path(source)
+        if not source.exists():
+            raise FileNotFoundError(f"{source} does not exist")
+        if target and source.resolve() == pathlib.Path(target).resolve():
+            raise ValueError(f"cannot merge {source} into itself")
+        _merge_source(con, source, archive, archive_dirs, model_names, summary, counts)
+    return counts
+
+
+def _sources(patterns: list) -> list:
+    # (shard key, database file) of the sources, the shards of a catalog
+    # (see pyoptdb/shards.py) with their keys
+    sources = []
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern, recursive=True))
+        if not paths:
+            raise FileNotFoundError(f"{pattern} does not exist")
+        for path in map(pathlib.Path, paths):
+            with contextlib.closing(
+                sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+            ) as con:
+                tables = {name for (name,) in con.execute("SELECT name FROM sqlite_master")}
+                if "shards" not in tables or "solutions" in tables:
+                    sources.append((None, path))
+                    continue
+                for key, file in con.execute("SELECT shard_key, file FROM shards ORDER BY shard_id"):
+                    shard_file = _locate(pathlib.Path(file), path)
+                    if shard_file is None:
+                        raise FileNotFoundError(f"shard {key} of {path} ({file}) not found")
+                    sources.append((key, shard_file))
+    return sources
+
+
+def _model_names(source: pathlib.Path) -> list:
+    with contextlib.closing(
+        sqlite3.connect(f"{source.resolve().as_uri()}?mode=ro", uri=True)
+    ) as con:
+        return [name for (name,) in con.execute("SELECT model_name FROM models")]
+
+
+def _model_shards(config) -> dict:
+    # model name -> key of the shard of the target that already stores it
+    from pyoptdb.shards import shards
+
+    keys = {}
+    for key, dbfile in shards(config):
+        with contextlib.closing(
+            sqlite3.connect(f"{dbfile.resolve().as_uri()}?mode=ro", uri=True)
+        ) as con:
+            for (name,) in con.execute("SELECT model_name FROM models"):
+                keys.setdefault(name, key)
+    return keys
+
+
+def _merge(args):
+    from pyoptdb.shards import Sharding, _route_key, _shard_key, _sharding
+
+    config = _get_config()
+    archive = Archive.from_config(config)
+    sharding = _sharding(config)
+    model_shards = _model_shards(config) if sharding == Sharding.model else {}
+
+    # target database file -> model names (None: all) -> sources
+    targets = collections.defaultdict(lambda: collections.defaultdict(list))
+    for key, source in _sources(args.SOURCE):
+        if sharding == Sharding.none:
+            targets[_route_key(config, None)][None].append(source)
+        elif key is not None:
+            # a shard goes into the shard with the same key
+            targets[_route_key(config, key)][None].append(source)
+        elif sharding == Sharding.model:
+            # insert keys shards by the model file name, which a database
+            # does not store: a model goes into the shard that already has
+            # it, or the one given with --shard
+            for name in _model_names(source):
+                if args.MODEL_NAME is not None and name not in args.MODEL_NAME:
+                    continue
+                shard_key = model_shards.get(name, args.SHARD)
+                if shard_key is None:
+                    raise ValueError(
+                        f"model {name} of {source} is in no shard yet, pass the shard "
+                        "key with --shard (the name of its model file without suffix)"
+                    )
+                targets[_route_key(config, shard_key)][name].append(source)
+        else:
+            targets[_route_key(config, _shard_key(sharding, None))][None].append(source)
+
+    summary = config["insert"].getboolean("summary")
+    for dbfile, groups in targets.items():
+        with contextlib.closing(
+            _connect(dbfile, config, isolation_level="IMMEDIATE")
+        ) as con:
+            _check_schema_version(con)
+            counts = collections.Counter()
+            for name, sources in groups.items():
+                model_names = args.MODEL_NAME
+                if name is not None:
+                    if model_names is not None and name not in model_names:
+                        continue
+                    model_names = [name]
+                counts += merge(con, sources, archive, args.ARCHIVE, model_names, summary)
+
+        print(
+            f"merged into {dbfile}: {counts['models']} model(s), "
+            f"{counts['data_sets']} data set(s), {counts['solutions']} solution(s), "
+            f"{counts['files']} file(s)"
+        )
+        if counts["files_missing"]:
+            print(
+                f"{counts['files_missing']} archived file(s) not found, "
+                "pass the archive directories of the sources with --archive"
+            )
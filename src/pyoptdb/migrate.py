@@ -0,0 +1,112 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# The database schema is schema.sql (version 0) followed by the scripts in
+# migrations/, named <version>_<description>.sql. A migration that needs
+# Python has a <version>_<description>.py next to it, its upgrade(con) runs
+# after the script in the same transaction. The version of a database is kept
+# in PRAGMA user_version.
+
+import contextlib
+import importlib.util
+import logging
+import pathlib
+import sqlite3
+
+from pyoptdb import PYOPTDB_DIR
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = PYOPTDB_DIR / "migrations"
+
+
+def _migrations():
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        yield int(path.name.split("_")[0]), path
+
+
+SCHEMA_VERSION = max((version for version, _ in _migrations()), default=0)
+
+
+def _schema_version(con: sqlite3.Connection) -> int:
+    (version,) = con.execute("PRAGMA user_version").fetchone()
+    return version
+
+
+def _load_migration(path: pathlib.Path):
+    spec = importlib.util.spec_from_file_location(f"pyoptdb_migration_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _upgrade(con: sqlite3.Connection) -> int:
+    version = _schema_version(con)
+
+    for target, path in _migrations():
+        if target <= version:
+            continue
+
+        logger.debug(f"migrating from version {version} to {target} ({path.name})")
+        with open(path, "r") as f:
+            sql = f.read()
+
+        # each migration is applied as a whole or not at all
+        try:
+            con.executescript(f"BEGIN;\n{sql}")
+            if path.with_suffix(".py").exists():
+                _load_migration(path.with_suffix(".py")).upgrade(con)
+            con.execute(f"PRAGMA user_version = {target}")
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        version = target
+
+    return version
+
+
+def _check_schema_version(con: sqlite3.Connection):
+    version = _schema_version(con)
+
+    if version < SCHEMA_VERSION:
+        raise RuntimeError(
+            f"database schema version {version} is older than {SCHEMA_VERSION}, "
+            "run `pyoptdb migrate` to upgrade it"
+        )
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"database schema version {version} is newer than {SCHEMA_VERSION}, "
+            "upgrade pyoptdb"
+        )
+
+
+def _migrate():
+    config = _get_config()
+
+    # every shard is migrated on its own, see pyoptdb/shards.py
+    from pyoptdb.shards import shards
+
+    for _, dbfile in shards(config):
+        with contextlib.closing(_connect(dbfile, config)) as con:
+            version = _schema_version(con)
+            new_version = _upgrade(con)
+
+        if new_version == version:
+            print(f"{dbfile} is up to date (version {version})")
+        else:
+            print(f"migrated {dbfile} from version {version} to {new_version}")
@@ -0,0 +1,66 @@
+-- Labels of the variable indices per data set, used to read solution files
+-- without building the model.
+CREATE TABLE variable_labels(
+    data_set_id INTEGER NOT NULL,
+    var_id INTEGER NOT NULL,
+    index_str TEXT,
+    label TEXT NOT NULL,
+    FOREIGN KEY (data_set_id) REFERENCES data_sets(data_set_id),
+    FOREIGN KEY (var_id) REFERENCES variables(var_id),
+    UNIQUE (data_set_id,label)
+);
+
+
+-- Remove duplicates piled up by INSERT OR IGNORE without a constraint, the
+-- first row is kept.
+DELETE FROM parameter_data WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM parameter_data GROUP BY data_set_id,param_id,index_str
+);
+
+DELETE FROM set_data WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM set_data GROUP BY data_set_id,set_id,index_str,value
+);
+
+DELETE FROM variable_data WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM variable_data GROUP BY solution_id,var_id,index_str
+);
+
+DELETE FROM model_has_file WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM model_has_file GROUP BY model_id,file_id
+);
+
+DELETE FROM data_set_has_file WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM data_set_has_file GROUP BY data_set_id,file_id
+);
+
+DELETE FROM solution_has_file WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM solution_has_file GROUP BY solution_id,file_id
+);
+
+
+-- Uniqueness constraints, these also serve the lookups by
+-- (data_set_id,param_id), (solution_id,var_id) etc.
+CREATE UNIQUE INDEX parameter_data_key
+    ON parameter_data(data_set_id,param_id,index_str);
+
+CREATE UNIQUE INDEX set_data_key
+    ON set_data(data_set_id,set_id,index_str,value);
+
+CREATE UNIQUE INDEX variable_data_key
+    ON variable_data(solution_id,var_id,index_str);
+
+CREATE UNIQUE INDEX model_has_file_key ON model_has_file(model_id,file_id);
+CREATE UNIQUE INDEX data_set_has_file_key ON data_set_has_file(data_set_id,file_id);
+CREATE UNIQUE INDEX solution_has_file_key ON solution_has_file(solution_id,file_id);
+
+
+-- Secondary indexes
+CREATE INDEX data_sets_model ON data_sets(model_id);
+
+CREATE INDEX solutions_data_set ON solutions(data_set_id,objective);
+CREATE INDEX solutions_objective ON solutions(objective);
+CREATE INDEX solutions_status ON solutions(sol_status,objective);
+
+CREATE INDEX model_has_file_file ON model_has_file(file_id);
+CREATE INDEX data_set_has_file_file ON data_set_has_file(file_id);
+CREATE INDEX solution_has_file_file ON solution_has_file(file_id);
@@ -0,0 +1,43 @@
+-- Columnar storage (sqlite3.storage = columnar), see pyoptdb/storage.py.
+-- Index dictionaries hold the ordered index strings of an array once, they
+-- are identified by a checksum over their entries.
+CREATE TABLE index_dicts(
+    index_dict_id INTEGER PRIMARY KEY,
+    checksum TEXT NOT NULL UNIQUE,
+    length INTEGER NOT NULL
+);
+
+
+CREATE TABLE index_dict_entries(
+    index_dict_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    index_str TEXT,
+    PRIMARY KEY (index_dict_id,position),
+    FOREIGN KEY (index_dict_id) REFERENCES index_dicts(index_dict_id)
+) WITHOUT ROWID;
+
+
+-- value_array holds the values as little-endian float64 in the order of the
+-- index dictionary
+CREATE TABLE parameter_arrays(
+    data_set_id INTEGER NOT NULL,
+    param_id INTEGER NOT NULL,
+    index_dict_id INTEGER NOT NULL,
+    value_array BLOB NOT NULL,
+    PRIMARY KEY (data_set_id,param_id),
+    FOREIGN KEY (data_set_id) REFERENCES data_sets(data_set_id),
+    FOREIGN KEY (param_id) REFERENCES parameters(param_id),
+    FOREIGN KEY (index_dict_id) REFERENCES index_dicts(index_dict_id)
+);
+
+
+CREATE TABLE variable_arrays(
+    solution_id INTEGER NOT NULL,
+    var_id INTEGER NOT NULL,
+    index_dict_id INTEGER NOT NULL,
+    value_array BLOB NOT NULL,
+    PRIMARY KEY (solution_id,var_id),
+    FOREIGN KEY (solution_id) REFERENCES solutions(solution_id),
+    FOREIGN KEY (var_id) REFERENCES variables(var_id),
+    FOREIGN KEY (index_dict_id) REFERENCES index_dicts(index_dict_id)
+);
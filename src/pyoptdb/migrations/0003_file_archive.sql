@@ -0,0 +1,6 @@
+-- Archive settings used to store a file. md5_checksum holds the digest of
+-- checksum_algorithm (archive.hash), the column keeps its name for
+-- compatibility.
+ALTER TABLE files ADD COLUMN checksum_algorithm TEXT NOT NULL DEFAULT 'md5';
+ALTER TABLE files ADD COLUMN compression TEXT NOT NULL DEFAULT 'none';
+ALTER TABLE files ADD COLUMN file_size INTEGER;
@@ -0,0 +1,6 @@
+-- Content hash of the parameter and set values of a data set, so that a data
+-- set is stored once per model. Data sets inserted before remain NULL and are
+-- never matched.
+ALTER TABLE data_sets ADD COLUMN data_checksum TEXT;
+
+CREATE UNIQUE INDEX data_sets_checksum ON data_sets(model_id,data_checksum);
@@ -0,0 +1,69 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Components of the indices interned by 0005_indices.sql, parsing the index
+# strings needs Python. The helpers are copies of those in pyoptdb/indices.py
+# at this version, so the migration does not change with the package.
+
+import ast
+import itertools
+import sqlite3
+
+CHUNK_SIZE = 10000
+
+
+def _components(index_str: str) -> tuple:
+    try:
+        index = ast.literal_eval(index_str)
+    except (ValueError, SyntaxError):
+        index = index_str
+    if index is None:
+        return ()
+    if isinstance(index, tuple):
+        return index
+    return (index,)
+
+
+def _component_value(value):
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        return value
+    return str(value)
+
+
+def _insert_components(cur: sqlite3.Cursor, index_ids, chunk_size: int):
+    rows = iter(
+        (index_id, position, _component_value(value))
+        for index_str, index_id in index_ids
+        for position, value in enumerate(_components(index_str))
+    )
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        cur.executemany(
+            "INSERT OR IGNORE INTO index_components(index_id,position,value) "
+            "VALUES (?,?,?)",
+            chunk,
+        )
+
+
+def upgrade(con: sqlite3.Connection):
+    cur = con.cursor()
+    index_ids = con.execute(
+        "SELECT index_str, index_id FROM indices WHERE arity IS NULL"
+    ).fetchall()
+
+    _insert_components(cur, index_ids, CHUNK_SIZE)
+    cur.executemany(
+        "UPDATE indices SET arity=? WHERE index_id=?",
+        ((len(_components(index_str)), index_id) for index_str, index_id in index_ids),
+    )
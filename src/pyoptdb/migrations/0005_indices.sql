@@ -0,0 +1,61 @@
+-- Interned indices, see pyoptdb/indices.py. The components of the indices
+-- interned here are added by 0005_indices.py, arity is NULL until then.
+CREATE TABLE indices(
+    index_id INTEGER PRIMARY KEY,
+    index_str TEXT NOT NULL UNIQUE,
+    arity INTEGER
+);
+
+
+-- value has no type affinity, so that integers, reals and strings keep their
+-- type and compare as such
+CREATE TABLE index_components(
+    index_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    value,
+    PRIMARY KEY (index_id,position),
+    FOREIGN KEY (index_id) REFERENCES indices(index_id)
+) WITHOUT ROWID;
+
+CREATE INDEX index_components_value ON index_components(position,value);
+
+
+INSERT OR IGNORE INTO indices(index_str)
+    SELECT index_str FROM parameter_data
+    UNION SELECT index_str FROM variable_data
+    UNION SELECT index_str FROM variable_labels
+    UNION SELECT index_str FROM index_dict_entries
+    UNION SELECT index_str FROM set_data
+    UNION SELECT value FROM set_data;
+
+
+ALTER TABLE parameter_data ADD COLUMN index_id INTEGER REFERENCES indices(index_id);
+ALTER TABLE variable_data ADD COLUMN index_id INTEGER REFERENCES indices(index_id);
+ALTER TABLE variable_labels ADD COLUMN index_id INTEGER REFERENCES indices(index_id);
+ALTER TABLE index_dict_entries ADD COLUMN index_id INTEGER REFERENCES indices(index_id);
+-- set_data refers to the index of the set (index_str) and to its member
+ALTER TABLE set_data ADD COLUMN index_id INTEGER REFERENCES indices(index_id);
+ALTER TABLE set_data ADD COLUMN member_id INTEGER REFERENCES indices(index_id);
+
+UPDATE parameter_data SET index_id=(
+    SELECT index_id FROM indices i WHERE i.index_str=parameter_data.index_str
+);
+UPDATE variable_data SET index_id=(
+    SELECT index_id FROM indices i WHERE i.index_str=variable_data.index_str
+);
+UPDATE variable_labels SET index_id=(
+    SELECT index_id FROM indices i WHERE i.index_str=variable_labels.index_str
+);
+UPDATE index_dict_entries SET index_id=(
+    SELECT index_id FROM indices i WHERE i.index_str=index_dict_entries.index_str
+);
+UPDATE set_data SET
+    index_id=(SELECT index_id FROM indices i WHERE i.index_str=set_data.index_str),
+    member_id=(SELECT index_id FROM indices i WHERE i.index_str=set_data.value);
+
+
+-- variable_data is filtered by index_id after the lookup by
+-- (solution_id,var_id), another index on the largest table is not worth its
+-- cost on insert
+CREATE INDEX parameter_data_index ON parameter_data(param_id,index_id);
+CREATE INDEX set_data_member ON set_data(set_id,member_id);
@@ -0,0 +1,6 @@
+-- Delta-encoded solutions (sqlite3.storage = delta), see pyoptdb/delta.py.
+-- A solution with a base_solution_id only has the variable_data rows that
+-- differ from its base, the base is always stored in full.
+ALTER TABLE solutions ADD COLUMN base_solution_id INTEGER REFERENCES solutions(solution_id);
+
+CREATE INDEX solutions_base ON solutions(base_solution_id);
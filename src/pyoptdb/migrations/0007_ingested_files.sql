@@ -0,0 +1,13 @@
+-- Solution files seen by `pyoptdb watch`, see pyoptdb/watch.py. A file is
+-- identified by its path, size and modification time, so a file rewritten
+-- in place is ingested again. Rows with status 'ingested' are written in the
+-- transaction that inserts the solution.
+CREATE TABLE ingested_files(
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL CHECK(status IN ('ingested','failed')),
+    error TEXT,
+    ingested_at TEXT NOT NULL,
+    PRIMARY KEY (path,size,mtime_ns)
+);
@@ -0,0 +1,135 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Fills the summary tables created by 0008_summary_tables.sql from the
+# solutions stored so far. The queries are copies of those of
+# pyoptdb/summary.py at this version, so the migration does not change with
+# the package.
+
+import array
+import sqlite3
+import sys
+
+UNKNOWN_STATUS = "unknown"
+
+_UPSERT_VARIABLE_STATS = (
+    "INSERT INTO variable_stats(data_set_id,var_id,index_id,n,sum_value,min_value,max_value) "
+    "VALUES (?,?,?,?,?,?,?) "
+    "ON CONFLICT(data_set_id,var_id,index_id) DO UPDATE SET "
+    "n=n+excluded.n, sum_value=sum_value+excluded.sum_value, "
+    "min_value=min(min_value,excluded.min_value), "
+    "max_value=max(max_value,excluded.max_value)"
+)
+
+
+def upgrade(con: sqlite3.Connection):
+    cur = con.cursor()
+    _models(cur)
+    _variables(cur)
+
+
+def _models(cur: sqlite3.Cursor):
+    cur.execute(
+        "INSERT INTO status_counts(model_id,sol_status,n) "
+        "SELECT ds.model_id, COALESCE(s.sol_status, ?), count(*) "
+        "FROM solutions s JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+        "GROUP BY ds.model_id, COALESCE(s.sol_status, ?)",
+        (UNKNOWN_STATUS, UNKNOWN_STATUS),
+    )
+    cur.execute(
+        "INSERT INTO model_stats(model_id,n_solutions,min_objective,max_objective) "
+        "SELECT ds.model_id, count(*), min(s.objective), max(s.objective) "
+        "FROM solutions s JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+        "GROUP BY ds.model_id"
+    )
+    for column, order in (("min", "ASC"), ("max", "DESC")):
+        cur.execute(
+            f"UPDATE model_stats SET {column}_solution_id=("
+            "SELECT s.solution_id FROM solutions s "
+            "JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+            "WHERE ds.model_id=model_stats.model_id AND s.objective IS NOT NULL "
+            f"ORDER BY s.objective {order}, s.solution_id LIMIT 1)"
+        )
+
+
+def _variables(cur: sqlite3.Cursor):
+    # solutions stored as rows, delta-encoded ones take the value of their
+    # base where they store none
+    cur.execute(
+        "INSERT INTO variable_stats(data_set_id,var_id,index_id,n,sum_value,min_value,max_value) "
+        "SELECT data_set_id, var_id, index_id, count(value), sum(value), min(value), max(value) "
+        "FROM ("
+        "SELECT s.data_set_id, d.var_id, d.index_id, d.value FROM solutions s "
+        "JOIN variable_data d ON d.solution_id=s.solution_id "
+        "WHERE s.base_solution_id IS NULL "
+        "UNION ALL "
+        "SELECT s.data_set_id, b.var_id, b.index_id, COALESCE(d.value, b.value) "
+        "FROM solutions s "
+        "JOIN variable_data b ON b.solution_id=s.base_solution_id "
+        "LEFT JOIN variable_data d ON d.solution_id=s.solution_id "
+        "AND d.var_id=b.var_id AND d.index_str=b.index_str "
+        "WHERE s.base_solution_id IS NOT NULL"
+        ") WHERE value IS NOT NULL "
+        "GROUP BY data_set_id, var_id, index_id"
+    )
+
+    # columnar solutions, one data set at a time
+    index_ids = {}
+    stats = {}
+    last_data_set_id = None
+    for data_set_id, var_id, index_dict_id, value_array in cur.connection.execute(
+        "SELECT s.data_set_id, a.var_id, a.index_dict_id, a.value_array "
+        "FROM variable_arrays a JOIN solutions s ON s.solution_id=a.solution_id "
+        "ORDER BY s.data_set_id"
+    ):
+        if data_set_id != last_data_set_id:
+            _flush(cur, stats)
+            last_data_set_id = data_set_id
+        if index_dict_id not in index_ids:
+            index_ids[index_dict_id] = [
+                index_id
+                for (index_id,) in cur.connection.execute(
+                    "SELECT index_id FROM index_dict_entries WHERE index_dict_id=? "
+                    "ORDER BY position",
+                    (index_dict_id,),
+                )
+            ]
+        for index_id, value in zip(index_ids[index_dict_id], _unpack(value_array)):
+            key = (data_set_id, var_id, index_id)
+            entry = stats.get(key)
+            if entry is None:
+                stats[key] = [1, value, value, value]
+            else:
+                entry[0] += 1
+                entry[1] += value
+                entry[2] = min(entry[2], value)
+                entry[3] = max(entry[3], value)
+    _flush(cur, stats)
+
+
+def _unpack(blob: bytes) -> array.array:
+    # value arrays are little-endian float64
+    arr = array.array("d")
+    arr.frombytes(blob)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def _flush(cur: sqlite3.Cursor, stats: dict):
+    cur.executemany(
+        _UPSERT_VARIABLE_STATS, (key + tuple(entry) for key, entry in stats.items())
+    )
+    stats.clear()
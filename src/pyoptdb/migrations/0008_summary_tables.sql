@@ -0,0 +1,38 @@
+-- Summary tables maintained by insert, see pyoptdb/summary.py. They are
+-- filled from the stored solutions by 0008_summary_tables.py.
+
+-- statistics of every variable entry over the solutions of a data set
+CREATE TABLE variable_stats(
+    data_set_id INTEGER NOT NULL,
+    var_id INTEGER NOT NULL,
+    index_id INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    sum_value REAL NOT NULL,
+    min_value REAL,
+    max_value REAL,
+    PRIMARY KEY (data_set_id,var_id,index_id),
+    FOREIGN KEY (data_set_id) REFERENCES data_sets(data_set_id),
+    FOREIGN KEY (var_id) REFERENCES variables(var_id),
+    FOREIGN KEY (index_id) REFERENCES indices(index_id)
+) WITHOUT ROWID;
+
+
+CREATE TABLE model_stats(
+    model_id INTEGER PRIMARY KEY,
+    n_solutions INTEGER NOT NULL,
+    min_objective REAL,
+    min_solution_id INTEGER,
+    max_objective REAL,
+    max_solution_id INTEGER,
+    FOREIGN KEY (model_id) REFERENCES models(model_id)
+);
+
+
+-- solutions without a status are counted as 'unknown'
+CREATE TABLE status_counts(
+    model_id INTEGER NOT NULL,
+    sol_status TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (model_id,sol_status),
+    FOREIGN KEY (model_id) REFERENCES models(model_id)
+) WITHOUT ROWID;
@@ -0,0 +1,7 @@
+-- Submissions inserted by `pyoptdb ingest`, see pyoptdb/ingest.py. A row is
+-- written in the transaction that inserts the solutions of the submission,
+-- so a submission whose file outlived a crash is not inserted again.
+CREATE TABLE ingested_submissions(
+    submission TEXT PRIMARY KEY,
+    ingested_at TEXT NOT NULL
+);
@@ -0,0 +1,376 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# `pyoptdb prune`: retention, archive garbage collection and compaction.
+#
+# Solutions are selected by age (taken from their uuid1), status and
+# objective rank, the criteria given are combined. They are deleted with their
+# variable data and file links in transactions of prune.batch_size solutions,
+# newest first, so concurrent inserts only wait for one batch. A delta
+# solution that is kept while its base goes is stored in full first. The
+# summary tables of the affected data sets are recomputed at the end.
+#
+# Archived files no files row refers to anymore are removed, considering all
+# shards; files archived in the last prune.archive_grace seconds are left
+# alone as their row may not be committed yet. Free pages are returned to the
+# file system with PRAGMA incremental_vacuum in slices of about
+# prune.vacuum_slice seconds, each its own short write transaction.
+
+import contextlib
+import dataclasses
+import logging
+import os
+import pathlib
+import sqlite3
+import time
+import uuid
+
+from pyoptdb.config import _get_config
+from pyoptdb.db import _chunked, _connect
+from pyoptdb.migrate import _check_schema_version
+from pyoptdb.summary import UNKNOWN_STATUS, _rebuild
+
+logger = logging.getLogger(__name__)
+
+# 100 ns intervals between the uuid1 epoch (1582-10-15) and the unix epoch
+_UUID1_EPOCH = 0x01B21DD213814000
+
+RANK_GROUPS = ("data_set", "model")
+
+
+def _uuid1_time(value: str) -> float:
+    # unix time a uuid1 was generated, i.e. the solution was inserted
+    try:
+        return (uuid.UUID(value).time - _UUID1_EPOCH) / 1e7
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclasses.dataclass
+class Criteria:
+    """Solutions to prune, the criteria given are combined with AND"""
+
+    # inserted more than older_than days ago
+    older_than: float = None
+    # with one of these statuses, "unknown" matches solutions without one
+    status: list = None
+    # not among the keep_best best objectives of their data set (or model)
+    keep_best: int = None
+    rank_by: str = "data_set"
+    maximize: bool = False
+    # restrict to a model (name) or a data set
+    model_name: str = None
+    data_set_id: int = None
+
+    def __post_init__(self):
+        if self.keep_best is not None and self.keep_best < 0:
+            raise ValueError("keep_best must not be negative")
+        if self.rank_by not in RANK_GROUPS:
+            raise ValueError(
+                f"unknown rank_by {self.rank_by}, expected one of " + ", ".join(RANK_GROUPS)
+            )
+
+    def empty(self) -> bool:
+        return self.older_than is None and not self.status and self.keep_best is None
+
+
+def _select(con: sqlite3.Connection, criteria: Criteria) -> list:
+    # -> ids of the solutions to prune, newest first
+    if criteria.empty():
+        return []
+
+    con.create_function("pyoptdb_uuid1_time", 1, _uuid1_time, deterministic=True)
+
+    # the scope also limits the solutions ranked against each other
+    scope, scope_params = ["1"], []
+    if criteria.model_name is not None:
+        scope.append("m.model_name=?")
+        scope_params.append(criteria.model_name)
+    if criteria.data_set_id is not None:
+        scope.append("s.data_set_id=?")
+        scope_params.append(criteria.data_set_id)
+
+    conditions, params = [], []
+    if criteria.older_than is not None:
+        conditions.append("pyoptdb_uuid1_time(solution_uuid1) < ?")
+        params.append(time.time() - criteria.older_than * 86400)
+    if criteria.status:
+        conditions.append(f"status IN ({','.join('?' * len(criteria.status))})")
+        params.extend(criteria.status)
+    if criteria.keep_best is not None:
+        conditions.append("rank > ?")
+        params.append(criteria.keep_best)
+
+    # solutions without an objective rank last
+    partition = "s.data_set_id" if criteria.rank_by == "data_set" else "ds.model_id"
+    order = "DESC" if criteria.maximize else "ASC"
+    sql = (
+        "SELECT solution_id FROM ("
+        "SELECT s.solution_id, s.solution_uuid1, COALESCE(s.sol_status, ?) AS status, "
+        f"row_number() OVER (PARTITION BY {partition} "
+        f"ORDER BY s.objective IS NULL, s.objective {order}, s.solution_id) AS rank "
+        "FROM solutions s JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+        f"JOIN models m ON m.model_id=ds.model_id WHERE {' AND '.join(scope)}"
+        f") WHERE {' AND '.join(conditions)} ORDER BY solution_id DESC"
+    )
+    rows = con.execute(sql, (UNKNOWN_STATUS, *scope_params, *params))
+    return [solution_id for (solution_id,) in rows]
+
+
+def _delete_batch(cur: sqlite3.Cursor, solution_ids: list) -> set:
+    # -> ids of the data sets that lost solutions
+    cur.execute("DELETE FROM temp.pruned")
+    cur.executemany("INSERT INTO temp.pruned VALUES (?)", ((i,) for i in solution_ids))
+
+    # delta solutions that are kept while their base goes are stored in full,
+    # in the order of the base as _var_values reads rows in rowid order
+    cur.execute("DELETE FROM temp.materialized")
+    cur.execute(
+        "INSERT INTO temp.materialized "
+        "SELECT s.solution_id, b.var_id, b.index_str, b.index_id, "
+        "CASE WHEN d.rowid IS NULL THEN b.value ELSE d.value END "
+        "FROM solutions s JOIN variable_data b ON b.solution_id=s.base_solution_id "
+        "LEFT JOIN variable_data d ON d.solution_id=s.solution_id "
+        "AND d.var_id=b.var_id AND d.index_str=b.index_str "
+        "WHERE s.base_solution_id IN (SELECT solution_id FROM temp.pruned) "
+        "AND s.solution_id NOT IN (SELECT solution_id FROM temp.pruned) "
+        "ORDER BY s.solution_id, b.rowid"
+    )
+    if cur.rowcount > 0:
+        cur.execute(
+            "DELETE FROM variable_data WHERE solution_id IN "
+            "(SELECT solution_id FROM temp.materialized)"
+        )
+        cur.execute(
+            "INSERT INTO variable_data(solution_id,var_id,index_str,index_id,value) "
+            "SELECT solution_id, var_id, index_str, index_id, value "
+            "FROM temp.materialized ORDER BY rowid"
+        )
+        cur.execute(
+            "UPDATE solutions SET base_solution_id=NULL WHERE base_solution_id IN "
+            "(SELECT solution_id FROM temp.pruned)"
+        )
+
+    data_set_ids = {
+        data_set_id
+        for (data_set_id,) in cur.execute(
+            "SELECT DISTINCT data_set_id FROM solutions WHERE solution_id IN "
+            "(SELECT solution_id FROM temp.pruned)"
+        )
+    }
+    for table in ("variable_data", "variable_arrays", "solution_has_file", "solutions"):
+        cur.execute(
+            f"DELETE FROM {table} WHERE solution_id IN "
+            "(SELECT solution_id FROM temp.pruned)"
+        )
+    return data_set_ids
+
+
+def _delete_unreferenced_files(cur: sqlite3.Cursor) -> int:
+    cur.execute(
+        "DELETE FROM files WHERE "
+        "NOT EXISTS (SELECT 1 FROM solution_has_file l WHERE l.file_id=files.file_id) "
+        "AND NOT EXISTS (SELECT 1 FROM data_set_has_file l WHERE l.file_id=files.file_id) "
+        "AND NOT EXISTS (SELECT 1 FROM model_has_file l WHERE l.file_id=files.file_id)"
+    )
+    return cur.rowcount
+
+
+def prune(con: sqlite3.Connection, criteria: Criteria, batch_size: int = 500) -> int:
+    """Delete the solutions matching criteria, returns their number
+
+    con should be opened with isolation_level="IMMEDIATE".
+    """
+    if batch_size < 1:
+        raise ValueError("prune.batch_size must be a positive integer")
+
+    solution_ids = _select(con, criteria)
+    if not solution_ids:
+        return 0
+
+    cur = con.cursor()
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS pruned(solution_id INTEGER PRIMARY KEY)")
+    cur.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS materialized("
+        "solution_id INTEGER, var_id INTEGER, index_str TEXT, index_id INTEGER, value REAL)"
+    )
+
+    # newest first: delta solutions are deleted before their base
+    data_set_ids = set()
+    for batch in _chunked(solution_ids, batch_size):
+        with con:
+            data_set_ids.update(_delete_batch(cur, batch))
+        logger.info(f"deleted {len(batch)} solution(s)")
+
+    with con:
+        n_files = _delete_unreferenced_files(cur)
+        _rebuild(cur, sorted(data_set_ids))
+    logger.info(f"deleted {n_files} unreferenced file(s)")
+    return len(solution_ids)
+
+
+def _archived(location: str) -> pathlib.Path:
+    return pathlib.Path(location).resolve()
+
+
+def collect_archive(config=None, grace: float = None) -> tuple:
+    """Remove archived files no files row of any shard refers to
+
+    Returns the number of files removed and their size in bytes.
+    """
+    from pyoptdb.shards import shards
+
+    if config is None:
+        config = _get_config()
+    if grace is None:
+        grace = config["prune"].getfloat("archive_grace")
+
+    directory = pathlib.Path(config["archive"].get("directory"))
+    if not directory.is_dir():
+        return 0, 0
+
+    def referenced() -> set:
+        locations = set()
+        for _, dbfile in shards(config):
+            with contextlib.closing(_connect(dbfile, config)) as con:
+                locations.update(
+                    _archived(location)
+                    for (location,) in con.execute(
+                        "SELECT file_location FROM files WHERE file_location IS NOT NULL"
+                    )
+                )
+        return locations
+
+    in_use = referenced()
+    cutoff = time.time() - grace
+    candidates = []
+    for entry in os.scandir(directory):
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        st = entry.stat(follow_symlinks=False)
+        # ctime also changes when a file is hardlinked or renamed into place
+        if max(st.st_mtime, st.st_ctime) >= cutoff:
+            continue
+        path = _archived(entry.path)
+        if path not in in_use:
+            candidates.append((path, st.st_size))
+
+    if candidates:
+        # a concurrent insert may have started to use one of them meanwhile
+        in_use = referenced()
+
+    n_files, n_bytes = 0, 0
+    for path, size in candidates:
+        if path in in_use:
+            continue
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+            n_files += 1
+            n_bytes += size
+    return n_files, n_bytes
+
+
+def vacuum(con: sqlite3.Connection, seconds: float = None, slice_seconds: float = 0.05) -> int:
+    """Return free pages to the file system in short slices
+
+    Each slice is a write transaction of about slice_seconds. Stops after
+    seconds (None: once there are no free pages). Returns the number of pages
+    freed, 0 unless the database uses auto_vacuum=incremental.
+    """
+    (auto_vacuum,) = con.execute("PRAGMA auto_vacuum").fetchone()
+    if auto_vacuum != 2:
+        return 0
+
+    (initial,) = con.execute("PRAGMA freelist_count").fetchone()
+    start = time.perf_counter()
+    pages, free = 64, initial
+    while free > 0:
+        if seconds is not None and time.perf_counter() - start >= seconds:
+            break
+
+        t = time.perf_counter()
+        # every step of the pragma frees one page, executescript runs it to
+        # completion (in its own transaction)
+        con.executescript(f"PRAGMA incremental_vacuum({min(pages, free)})")
+        elapsed = time.perf_counter() - t
+        (free,) = con.execute("PRAGMA freelist_count").fetchone()
+
+        # adapt the slice to take about slice_seconds
+        if elapsed < slice_seconds / 2:
+            pages *= 2
+        elif elapsed > slice_seconds and pages > 1:
+            pages //= 2
+        # let waiting writers in
+        time.sleep(min(elapsed, slice_seconds))
+
+    if free < initial:
+        con.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return initial - free
+
+
+def _enable_incremental_vacuum(con: sqlite3.Connection):
+    # rewrites the whole file under an exclusive lock
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    con.execute("VACUUM")
+
+
+def _prune(args):
+    from pyoptdb.shards import shards
+
+    config = _get_config()
+    criteria = Criteria(
+        older_than=args.OLDER_THAN,
+        status=args.STATUS,
+        keep_best=args.KEEP_BEST,
+        rank_by=args.RANK_BY,
+        maximize=args.MAXIMIZE,
+        model_name=args.MODEL_NAME,
+        data_set_id=args.DATA_SET,
+    )
+    batch_size = config["prune"].getint("batch_size")
+
+    for key, dbfile in shards(config):
+        prefix = f"{key}: " if key is not None else ""
+        with contextlib.closing(
+            _connect(dbfile, config, isolation_level="IMMEDIATE")
+        ) as con:
+            _check_schema_version(con)
+
+            if args.DRY_RUN:
+                print(f"{prefix}would delete {len(_select(con, criteria))} solution(s)")
+                continue
+
+            n = prune(con, criteria, batch_size)
+            if n:
+                print(f"{prefix}deleted {n} solution(s)")
+
+            if args.FULL_VACUUM:
+                _enable_incremental_vacuum(con)
+                print(f"{prefix}vacuumed {dbfile}, auto_vacuum is incremental")
+            elif args.VACUUM:
+                (auto_vacuum,) = con.execute("PRAGMA auto_vacuum").fetchone()
+                if auto_vacuum != 2:
+                    print(
+                        f"{prefix}{dbfile} does not use incremental vacuum, "
+                        "run `pyoptdb prune --full-vacuum` once to enable it"
+                    )
+                    continue
+                seconds = config["prune"].getfloat("vacuum_seconds") or None
+                pages = vacuum(con, seconds, config["prune"].getfloat("vacuum_slice"))
+                print(f"{prefix}freed {pages} page(s)")
+
+    if args.GC and not args.DRY_RUN:
+        n_files, n_bytes = collect_archive(config)
+        print(f"removed {n_files} archived file(s), {n_bytes} bytes")
@@ -0,0 +1,473 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Read API for solution and parameter data. Values are returned as NumPy
+# arrays together with the decoded index labels, independent of the storage
+# mode (rows, columnar or delta) they were inserted with.
+
+import collections
+import pathlib
+import sqlite3
+import threading
+
+from pyoptdb.config import _get_config
+from pyoptdb.indices import _index_filter, decode_index
+from pyoptdb.storage import _index_dict, unpack
+
+FETCH_SIZE = 50000
+
+# decoded index dictionaries, keyed by (database, index_dict_id)
+INDEX_CACHE_SIZE = 128
+_index_cache = collections.OrderedDict()
+# pyoptdb serve queries from several threads
+_index_cache_lock = threading.Lock()
+
+SolutionRow = collections.namedtuple(
+    "SolutionRow",
+    [
+        "solution_id",
+        "solution_uuid1",
+        "data_set_id",
+        "model_name",
+        "sol_message",
+        "sol_status",
+        "objective",
+        "gap",
+        "time_seconds",
+    ],
+)
+
+ModelStats = collections.namedtuple(
+    "ModelStats",
+    [
+        "model_name",
+        "n_solutions",
+        "min_objective",
+        "min_solution_id",
+        "max_objective",
+        "max_solution_id",
+    ],
+)
+
+_SOLUTION_ORDER = {
+    "objective": "s.objective",
+    "gap": "s.gap",
+    "time_seconds": "s.time_seconds",
+    "solution_id": "s.solution_id",
+}
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError("pyoptdb.query requires numpy") from e
+    return np
+
+
+def connect(dbfile: pathlib.Path = None, readonly: bool = True) -> sqlite3.Connection:
+    if dbfile is None:
+        config = _get_config()
+        if config["sqlite3"].get("shard", "none") != "none":
+            raise ValueError(
+                "the database is sharded, use pyoptdb.shards.connect(key) "
+                "or pyoptdb.shards.fan_out"
+            )
+        dbfile = pathlib.Path(config["sqlite3"].get("file", None))
+    if readonly:
+        return sqlite3.connect(f"{pathlib.Path(dbfile).resolve().as_uri()}?mode=ro", uri=True)
+    return sqlite3.connect(dbfile)
+
+
+def _database(con: sqlite3.Connection) -> str:
+    for _, name, filename in con.execute("PRAGMA database_list"):
+        if name == "main":
+            return filename
+
+
+def _cached_index_dict(con: sqlite3.Connection, index_dict_id: int) -> tuple:
+    key = (_database(con), index_dict_id)
+    with _index_cache_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+    index_strs = tuple(_index_dict(con.cursor(), index_dict_id))
+    entry = (index_strs, tuple(map(decode_index, index_strs)))
+
+    with _index_cache_lock:
+        _index_cache[key] = entry
+        if len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return entry
+
+
+def _fetch_rows(cur: sqlite3.Cursor):
+    while rows := cur.fetchmany(FETCH_SIZE):
+        yield from rows
+
+
+def _var_id(con: sqlite3.Connection, var_name: str, solution_id: int) -> int:
+    row = con.execute(
+        "SELECT v.var_id FROM variables v "
+        "JOIN data_sets ds ON ds.model_id=v.model_id "
+        "JOIN solutions s ON s.data_set_id=ds.data_set_id "
+        "WHERE v.var_name=? AND s.solution_id=?",
+        (var_name, solution_id),
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"no variable {var_name} for solution {solution_id}")
+    return row[0]
+
+
+def _param_id(con: sqlite3.Connection, param_name: str, data_set_id: int) -> int:
+    row = con.execute(
+        "SELECT p.param_id FROM parameters p "
+        "JOIN data_sets ds ON ds.model_id=p.model_id "
+        "WHERE p.param_name=? AND ds.data_set_id=?",
+        (param_name, data_set_id),
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"no parameter {param_name} for data set {data_set_id}")
+    return row[0]
+
+
+def _filter_array(con: sqlite3.Connection, index_dict_id: int, values, where: dict):
+    # the entries of an index dictionary matching where
+    np = _numpy()
+
+    index_strs, labels = _cached_index_dict(con, index_dict_id)
+    if where is None:
+        return index_strs, labels, values
+
+    subquery, params = _index_filter(where)
+    positions = [
+        position
+        for (position,) in con.execute(
+            "SELECT position FROM index_dict_entries "
+            f"WHERE index_dict_id=? AND index_id IN ({subquery}) ORDER BY position",
+            (index_dict_id, *params),
+        )
+    ]
+    return (
+        tuple(index_strs[i] for i in positions),
+        tuple(labels[i] for i in positions),
+        np.asarray(values)[positions],
+    )
+
+
+def _where_sql(where: dict) -> tuple:
+    if where is None:
+        return "", []
+    subquery, params = _index_filter(where)
+    return f" AND index_id IN ({subquery})", params
+
+
+def _var_values(
+    con: sqlite3.Connection, var_id: int, solution_id: int, where: dict = None
+):
+    # -> (index_strs, decoded labels or None, values)
+    np = _numpy()
+
+    row = con.execute(
+        "SELECT index_dict_id, value_array FROM variable_arrays "
+        "WHERE solution_id=? AND var_id=?",
+        (solution_id, var_id),
+    ).fetchone()
+    if row is not None:
+        return _filter_array(con, row[0], unpack(row[1]), where)
+
+    row = con.execute(
+        "SELECT base_solution_id FROM solutions WHERE solution_id=?", (solution_id,)
+    ).fetchone()
+    if row is not None and row[0] is not None:
+        return _delta_values(con, var_id, solution_id, row[0], where)
+
+    where_sql, params = _where_sql(where)
+    cur = con.execute(
+        "SELECT index_str, value FROM variable_data "
+        f"WHERE solution_id=? AND var_id=?{where_sql} ORDER BY rowid",
+        (solution_id, var_id, *params),
+    )
+    rows = list(_fetch_rows(cur))
+    index_strs = tuple(index_str for index_str, _ in rows)
+    values = np.fromiter((value for _, value in rows), dtype=float, count=len(rows))
+    return index_strs, None, values
+
+
+def _delta_values(
+    con: sqlite3.Connection,
+    var_id: int,
+    solution_id: int,
+    base_solution_id: int,
+    where: dict = None,
+):
+    # the values of the base solution with the stored changes applied
+    np = _numpy()
+
+    index_strs, labels, values = _var_values(con, var_id, base_solution_id, where)
+    values = np.array(values, dtype=float)
+    positions = {index_str: i for i, index_str in enumerate(index_strs)}
+
+    where_sql, params = _where_sql(where)
+    cur = con.execute(
+        "SELECT index_str, value FROM variable_data "
+        f"WHERE solution_id=? AND var_id=?{where_sql}",
+        (solution_id, var_id, *params),
+    )
+    for index_str, value in _fetch_rows(cur):
+        values[positions[index_str]] = value
+    return index_strs, labels, values
+
+
+def _param_values(
+    con: sqlite3.Connection, param_id: int, data_set_id: int, where: dict = None
+):
+    np = _numpy()
+
+    row = con.execute(
+        "SELECT index_dict_id, value_array FROM parameter_arrays "
+        "WHERE data_set_id=? AND param_id=?",
+        (data_set_id, param_id),
+    ).fetchone()
+    if row is not None:
+        return _filter_array(con, row[0], unpack(row[1]), where)
+
+    where_sql, params = _where_sql(where)
+    cur = con.execute(
+        "SELECT index_str, value FROM parameter_data "
+        f"WHERE data_set_id=? AND param_id=?{where_sql} ORDER BY rowid",
+        (data_set_id, param_id, *params),
+    )
+    rows = list(_fetch_rows(cur))
+    index_strs = tuple(index_str for index_str, _ in rows)
+    try:
+        values = np.array([value for _, value in rows], dtype=float)
+    except ValueError:
+        # non-numeric parameter
+        values = np.array([value for _, value in rows], dtype=object)
+    return index_strs, None, values
+
+
+def var_matrix(
+    con: sqlite3.Connection, var_name: str, solution_ids: list, where: dict = None
+):
+    """Values of a variable for several solutions as a dense matrix
+
+    Returns the (solutions x indices) matrix and the list of index labels
+    of its columns. Indices missing in a solution are NaN. `where` restricts
+    the indices by position, see `index_ids`.
+    """
+    matrix, index_strs = _var_matrix(con, var_name, solution_ids, where)
+    return matrix, [decode_index(s) for s in index_strs]
+
+
+def _var_matrix(con: sqlite3.Connection, var_name: str, solution_ids: list, where: dict):
+    # the matrix and the index strings of its columns
+    np = _numpy()
+
+    solution_ids = list(solution_ids)
+    if not solution_ids:
+        raise ValueError("no solutions given")
+
+    var_id = _var_id(con, var_name, solution_ids[0])
+
+    columns = {}  # index_str -> column
+    matrix = None
+    last_index_strs, last_cols = None, None
+
+    for i, solution_id in enumerate(solution_ids):
+        index_strs, _, values = _var_values(con, var_id, solution_id, where)
+
+        # solutions of the same data set share the index set, so the column
+        # mapping is only computed when the index set changes
+        if index_strs is not last_index_strs and index_strs != last_index_strs:
+            last_cols = np.fromiter(
+                (columns.setdefault(s, len(columns)) for s in index_strs),
+                dtype=np.intp,
+                count=len(index_strs),
+            )
+            last_index_strs = index_strs
+
+        if matrix is None:
+            matrix = np.full((len(solution_ids), len(columns)), np.nan)
+        elif len(columns) > matrix.shape[1]:
+            matrix = np.pad(
+                matrix,
+                ((0, 0), (0, len(columns) - matrix.shape[1])),
+                constant_values=np.nan,
+            )
+
+        matrix[i, last_cols] = values
+
+    return matrix, list(columns)
+
+
+def param_vector(
+    con: sqlite3.Connection, param_name: str, data_set_id: int, where: dict = None
+):
+    """Values of a parameter in a data set and their index labels"""
+    param_id = _param_id(con, param_name, data_set_id)
+    index_strs, labels, values = _param_values(con, param_id, data_set_id, where)
+    if labels is None:
+        labels = tuple(map(decode_index, index_strs))
+    return values, list(labels)
+
+
+def index_ids(con: sqlite3.Connection, where: dict) -> list:
+    """Ids of the indices matching all conditions of where
+
+    where maps a position (0 for the first index component) to a value, or to
+    an inclusive (min, max) range where either end may be None, e.g.
+    {1: "plant3"} or {0: (100, 200)}. Integers, reals and strings compare by
+    type: a numeric range never matches a string component.
+    """
+    subquery, params = _index_filter(where)
+    return [index_id for (index_id,) in con.execute(subquery, params)]
+
+
+def index_tuples(con: sqlite3.Connection, index_ids: list) -> list:
+    """Index tuples of the given index ids, built from their components"""
+    components = collections.defaultdict(list)
+    for chunk_start in range(0, len(index_ids), 500):
+        chunk = index_ids[chunk_start : chunk_start + 500]
+        for index_id, value in con.execute(
+            "SELECT index_id, value FROM index_components WHERE index_id IN "
+            f"({','.join('?' * len(chunk))}) ORDER BY index_id, position",
+            chunk,
+        ):
+            components[index_id].append(value)
+    return [tuple(components[index_id]) for index_id in index_ids]
+
+
+def solutions(
+    con: sqlite3.Connection,
+    model_name: str = None,
+    data_set_id: int = None,
+    status: str = None,
+    objective_min: float = None,
+    objective_max: float = None,
+    gap_max: float = None,
+    order_by: str = "objective",
+    limit: int = None,
+    frame: bool = False,
+):
+    """Solutions matching all of the given filters
+
+    Returns a list of SolutionRow or, with frame=True, a pandas DataFrame.
+    """
+    if order_by not in _SOLUTION_ORDER:
+        raise ValueError(f"cannot order by {order_by}")
+
+    where, params = [], []
+    for clause, value in (
+        ("m.model_name=?", model_name),
+        ("s.data_set_id=?", data_set_id),
+        ("s.sol_status=?", status),
+        ("s.objective>=?", objective_min),
+        ("s.objective<=?", objective_max),
+        ("s.gap<=?", gap_max),
+    ):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+
+    sql = (
+        "SELECT s.solution_id, s.solution_uuid1, s.data_set_id, m.model_name, "
+        "s.sol_message, s.sol_status, s.objective, s.gap, s.time_seconds "
+        "FROM solutions s "
+        "JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+        "JOIN models m ON m.model_id=ds.model_id"
+        + ("" if not where else " WHERE " + " AND ".join(where))
+        + f" ORDER BY {_SOLUTION_ORDER[order_by]}, s.solution_id"
+        + ("" if limit is None else " LIMIT ?")
+    )
+    if limit is not None:
+        params.append(limit)
+
+    rows = [SolutionRow(*row) for row in _fetch_rows(con.execute(sql, params))]
+
+    if frame:
+        import pandas as pd
+
+        return pd.DataFrame.from_records(rows, columns=SolutionRow._fields)
+    return rows
+
+
+def variable_stats(con: sqlite3.Connection, var_name: str, data_set_id: int) -> tuple:
+    """Statistics of a variable over all solutions of a data set
+
+    Read from the summary table maintained by insert. Returns a dict with the
+    arrays "n", "mean", "min" and "max" and the list of index labels.
+    """
+    stats, index_strs = _variable_stats(con, var_name, data_set_id)
+    return stats, [decode_index(s) for s in index_strs]
+
+
+def _variable_stats(con: sqlite3.Connection, var_name: str, data_set_id: int) -> tuple:
+    # the statistics and the index strings
+    np = _numpy()
+
+    row = con.execute(
+        "SELECT v.var_id FROM variables v "
+        "JOIN data_sets ds ON ds.model_id=v.model_id "
+        "WHERE v.var_name=? AND ds.data_set_id=?",
+        (var_name, data_set_id),
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"no variable {var_name} for data set {data_set_id}")
+
+    rows = con.execute(
+        "SELECT i.index_str, st.n, st.sum_value, st.min_value, st.max_value "
+        "FROM variable_stats st JOIN indices i ON i.index_id=st.index_id "
+        "WHERE st.data_set_id=? AND st.var_id=?",
+        (data_set_id, row[0]),
+    ).fetchall()
+
+    index_strs = [r[0] for r in rows]
+    n = np.array([r[1] for r in rows], dtype=np.int64)
+    stats = {
+        "n": n,
+        "mean": np.array([r[2] for r in rows], dtype=float) / np.maximum(n, 1),
+        "min": np.array([r[3] for r in rows], dtype=float),
+        "max": np.array([r[4] for r in rows], dtype=float),
+    }
+    return stats, index_strs
+
+
+def model_stats(con: sqlite3.Connection) -> list:
+    """Number of solutions and the lowest and highest objective of every model"""
+    return [
+        ModelStats(*row)
+        for row in con.execute(
+            "SELECT m.model_name, st.n_solutions, st.min_objective, st.min_solution_id, "
+            "st.max_objective, st.max_solution_id "
+            "FROM model_stats st JOIN models m ON m.model_id=st.model_id "
+            "ORDER BY m.model_name"
+        )
+    ]
+
+
+def status_counts(con: sqlite3.Connection, model_name: str = None) -> dict:
+    """Number of solutions by status, of one or all models"""
+    sql = (
+        "SELECT c.sol_status, sum(c.n) FROM status_counts c "
+        "JOIN models m ON m.model_id=c.model_id"
+    )
+    params = []
+    if model_name is not None:
+        sql += " WHERE m.model_name=?"
+        params.append(model_name)
+    return dict(con.execute(sql + " GROUP BY c.sol_status", params))
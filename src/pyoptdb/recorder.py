@@ -0,0 +1,405 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Recording solutions of models solved in the same process, without writing
+# and parsing solution files:
+#
+#   from pyoptdb.recorder import Recorder
+#
+#   with Recorder(model_file="model.py", background=True) as recorder:
+#       for scenario in scenarios:
+#           ...
+#           results = opt.solve(instance)
+#           recorder.record(instance, results)
+#
+# The structure of an instance (the names of its components, the data set
+# checksum) is extracted on its first record, or the first after
+# data_changed=True, together with a copy of its parameter and set values and
+# variable labels; the data set is written from that copy, as the instance
+# may change before a queued solution is written. record() copies the
+# variable values and queues them; the queued solutions are
+# written in one transaction once record.batch_size of them are pending or
+# the oldest has waited record.max_latency seconds, so the write lock is only
+# held while they are written. With record.background = yes a thread writes
+# them and record() only blocks when record.max_pending solutions are queued.
+
+import array
+import collections
+import dataclasses
+import logging
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+
+from pyoptdb.archive import Archive
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+from pyoptdb.delta import _Delta
+from pyoptdb.insert import (
+    _commit,
+    _insert_or_ignore_data_set,
+    _insert_or_ignore_model,
+    _insert_or_ignore_solution,
+    _ModelIds,
+    _ParsedSolution,
+)
+from pyoptdb.migrate import _check_schema_version
+from pyoptdb.shards import _route
+from pyoptdb.sol import _defined
+from pyoptdb.storage import Storage, _storage
+from pyoptdb.structure import ModelStructure, _extract_structure, _snapshot
+from pyoptdb.summary import _Summary
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class _Target:
+    # a model instance with its data, registered in its database on the
+    # first write
+    structure: ModelStructure
+    # the Var components of the instance, by name, the values are read from
+    variables: dict
+    # the copy of the data written, see _snapshot
+    components: dict
+    model_file: pathlib.Path = None
+    data_file: pathlib.Path = None
+    dbfile: pathlib.Path = None
+    ids: _ModelIds = None
+    data_set_id: int = None
+    # index ids and index dictionaries of the variables, by var_id
+    index_ids: dict = dataclasses.field(default_factory=dict)
+    index_dict_ids: dict = dataclasses.field(default_factory=dict)
+    delta: _Delta = None
+
+    def reset(self):
+        # after a rollback nothing registered in the transaction exists
+        self.ids, self.data_set_id, self.delta = None, None, None
+        self.index_ids.clear()
+        self.index_dict_ids.clear()
+
+
+def _header(model, results) -> dict:
+    import pyomo.environ as pyo
+
+    header = dict(message=None, status=None, objective=None, gap=None, time_seconds=None)
+
+    objective = next(model.component_data_objects(pyo.Objective, active=True), None)
+    if objective is not None:
+        header["objective"] = pyo.value(objective, exception=False)
+
+    if results is not None:
+        message = _defined(results.solver.message)
+        status = _defined(results.solver.termination_condition)
+        header["message"] = None if message is None else str(message)
+        header["status"] = None if status is None else str(status)
+        header["time_seconds"] = _defined(results.solver.time)
+        # empty once the solution has been loaded into the model
+        if len(results.solution) > 0:
+            header["gap"] = _defined(results.solution(0).gap)
+    return header
+
+
+class _Writer:
+    # writes batches of queued solutions, owns the connections and is only
+    # used by one thread
+
+    def __init__(self, config):
+        self.config = config
+        self.archive = Archive.from_config(config)
+        self.storage = _storage(config)
+        self.chunk_size = config["insert"].getint("chunk_size")
+        if self.chunk_size < 1:
+            raise ValueError("insert.chunk_size must be a positive integer")
+        self.summary = config["insert"].getboolean("summary")
+        # database file -> connection
+        self.connections = {}
+
+    def connection(self, dbfile: pathlib.Path) -> sqlite3.Connection:
+        if dbfile not in self.connections:
+            con = _connect(dbfile, self.config, isolation_level="IMMEDIATE")
+            _check_schema_version(con)
+            self.connections[dbfile] = con
+        return self.connections[dbfile]
+
+    def write(self, batch: list):
+        # batch: (target, parsed) pairs
+        by_dbfile = collections.defaultdict(list)
+        for target, parsed in batch:
+            if target.dbfile is None:
+                # the shard of the model file, or of the model name without
+                # one; with sqlite3.shard = month the shard of the first write
+                target.dbfile = _route(
+                    self.config, target.model_file or pathlib.Path(target.structure.name)
+                )
+            by_dbfile[target.dbfile].append((target, parsed))
+
+        for dbfile, entries in by_dbfile.items():
+            con = self.connection(dbfile)
+            try:
+                self._write(con, entries)
+            except BaseException:
+                con.rollback()
+                for target, _ in entries:
+                    target.reset()
+                raise
+
+    def _write(self, con: sqlite3.Connection, entries: list):
+        cur = con.cursor()
+        summary = _Summary() if self.summary else None
+
+        for target, parsed in entries:
+            if target.ids is None:
+                self._register(cur, target)
+
+            solution_id = _insert_or_ignore_solution(
+                cur,
+                target.structure,
+                target.components.__getitem__,
+                target.ids,
+                target.data_set_id,
+                parsed,
+                file_archive=self.archive,
+                chunk_size=self.chunk_size,
+                storage=self.storage,
+                index_dict_ids=target.index_dict_ids,
+                index_ids=target.index_ids,
+                delta=target.delta,
+                summary=summary,
+            )
+            if summary is not None:
+                summary.add_solution(
+                    target.ids.model_id, solution_id, parsed.status, parsed.objective
+                )
+
+        _commit(con, cur, summary, self.chunk_size)
+        logger.debug(f"recorded {len(entries)} solution(s)")
+
+    def _register(self, cur: sqlite3.Cursor, target: _Target):
+        target.ids = _insert_or_ignore_model(
+            cur, target.structure, "nlp", True, target.model_file, file_archive=self.archive
+        )
+        target.data_set_id = _insert_or_ignore_data_set(
+            cur,
+            target.structure,
+            target.components.__getitem__,
+            target.ids,
+            target.data_file,
+            file_archive=self.archive,
+            chunk_size=self.chunk_size,
+            storage=self.storage,
+        )
+        if self.storage == Storage.delta:
+            target.delta = _Delta.from_config(self.config, cur, target.data_set_id)
+
+    def close(self):
+        for con in self.connections.values():
+            con.close()
+        self.connections.clear()
+
+
+class Recorder:
+    """Records the solutions of model instances solved in this process
+
+    model_file and data_file, if given, are archived and linked like those
+    of `pyoptdb insert`. background, batch_size, max_latency and max_pending
+    default to the record section of the configuration. Use as a context
+    manager or call close(), which writes the solutions still queued.
+    """
+
+    def __init__(
+        self,
+        model_file: pathlib.Path = None,
+        data_file: pathlib.Path = None,
+        config=None,
+        background: bool = None,
+        batch_size: int = None,
+        max_latency: float = None,
+        max_pending: int = None,
+    ):
+        if config is None:
+            config = _get_config()
+        section = config["record"]
+
+        self.model_file = None if model_file is None else pathlib.Path(model_file).resolve()
+        self.data_file = None if data_file is None else pathlib.Path(data_file).resolve()
+        self.background = (
+            section.getboolean("background") if background is None else background
+        )
+        self.batch_size = batch_size or section.getint("batch_size")
+        self.max_latency = section.getfloat("max_latency") if max_latency is None else max_latency
+        self.max_pending = max_pending or section.getint("max_pending")
+        if self.batch_size < 1:
+            raise ValueError("record.batch_size must be a positive integer")
+        if self.max_pending < self.batch_size:
+            raise ValueError("record.max_pending must be at least record.batch_size")
+
+        self._writer = _Writer(config)
+        # model instance -> _Target
+        self._targets = weakref.WeakKeyDictionary()
+        # (target, parsed) pairs not written yet, and the monotonic time the
+        # oldest was queued
+        self._pending = []
+        self._oldest = None
+        self._error = None
+        self._closed = False
+
+        if self.background:
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._thread = threading.Thread(
+                target=self._run, name="pyoptdb-recorder", daemon=True
+            )
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _target(self, model, data_changed: bool) -> _Target:
+        import pyomo.environ as pyo
+
+        target = self._targets.get(model)
+        if target is None or data_changed:
+            structure = _extract_structure(model)
+            target = _Target(
+                structure=structure,
+                variables=dict(model.component_map(pyo.Var)),
+                components=_snapshot(model),
+                model_file=self.model_file,
+                data_file=self.data_file,
+            )
+            self._targets[model] = target
+        return target
+
+    def record(self, model, results=None, data_changed: bool = False) -> str:
+        """Queue the current variable values of model as a solution
+
+        Status, message and time are taken from results (SolverResults), the
+        objective from the active objective of the model. Variables without
+        a value are recorded as 0, like variables missing from a solution
+        file. Pass data_changed=True after changing the parameters or sets of
+        model. Returns the solution_uuid1 of the solution.
+        """
+        self._check()
+
+        target = self._target(model, data_changed)
+        parsed = _ParsedSolution(
+            filename=None,
+            values={
+                var.name: array.array(
+                    "d",
+                    (
+                        0 if v.value is None else v.value
+                        for v in target.variables[var.name].values()
+                    ),
+                )
+                for var in target.structure.vars
+            },
+            solution_uuid1=str(uuid.uuid1()),
+            **_header(model, results),
+        )
+
+        if self.background:
+            # blocks while max_pending solutions are queued
+            self._queue.put((target, parsed))
+        else:
+            self._pending.append((target, parsed))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._due():
+                self._write()
+        return parsed.solution_uuid1
+
+    def _due(self) -> bool:
+        return len(self._pending) >= self.batch_size or (
+            self._oldest is not None
+            and time.monotonic() - self._oldest >= self.max_latency
+        )
+
+    def _write(self):
+        batch, self._pending, self._oldest = self._pending, [], None
+        if batch:
+            self._writer.write(batch)
+
+    def _run(self):
+        # the writer thread: batches are written once full or due, a
+        # threading.Event in the queue asks to write everything queued before
+        # it, None stops the thread
+        while True:
+            timeout = None
+            if self._oldest is not None:
+                timeout = max(self.max_latency - (time.monotonic() - self._oldest), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+
+            if isinstance(item, tuple) and item:
+                self._pending.append(item)
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                if not self._due():
+                    continue
+            try:
+                self._write()
+            except Exception as e:
+                logger.exception("recording solutions failed")
+                self._error = e
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                self._writer.close()
+                return
+
+    def _check(self):
+        if self._closed:
+            raise RuntimeError("the recorder is closed")
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("recording solutions failed") from error
+
+    def flush(self):
+        """Write all queued solutions now"""
+        self._check()
+        if self.background:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+            self._check()
+        else:
+            self._write()
+
+    def close(self):
+        """Write all queued solutions and close the database connections"""
+        if self._closed:
+            return
+        try:
+            if self.background:
+                self._queue.put(None)
+                self._thread.join()
+            else:
+                self._write()
+                self._writer.close()
+        finally:
+            self._closed = True
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("recording solutions failed") from error
@@ -0,0 +1,583 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# `pyoptdb serve`: a local read-only query service, so that short-lived
+# scripts share warm connections and cached results instead of each opening
+# the database with a cold page cache:
+#
+#   pyoptdb serve                              # http://127.0.0.1:8750
+#   pyoptdb serve --socket /tmp/pyoptdb.sock
+#
+#   from pyoptdb.serve import Client
+#
+#   client = Client()                          # or Client(socket_path=...)
+#   best = client.solutions(status="optimal", limit=10)
+#   x, labels = client.var_matrix("x", [s.solution_id for s in best])
+#
+# GET /solutions and /models answer JSON; /var, /param and /variable_stats
+# answer NumPy .npz archives with the arrays ("values", or "n", "mean", "min"
+# and "max") and "index", the index strings. Requests are answered on a pool
+# of serve.pool_size read-only connections with memory-mapped I/O, each in
+# one read transaction. Responses are kept in an LRU cache of
+# serve.cache_size MiB. Every request first checks PRAGMA data_version on a
+# separate connection: after a commit of another process the responses that
+# depend on which solutions exist (listings, statistics) are dropped, and all
+# responses if solutions were deleted.
+
+import collections
+import contextlib
+import http.client
+import http.server
+import io
+import json
+import logging
+import pathlib
+import queue
+import socket
+import socketserver
+import sqlite3
+import threading
+import urllib.parse
+
+from pyoptdb import query
+from pyoptdb.config import _get_config
+from pyoptdb.indices import decode_index
+
+logger = logging.getLogger(__name__)
+
+CONTENT_JSON = "application/json"
+CONTENT_NPZ = "application/x-npz"
+
+_REQUIRED = object()
+
+
+def _open(dbfile: pathlib.Path, mmap_size: int) -> sqlite3.Connection:
+    con = sqlite3.connect(
+        f"{pathlib.Path(dbfile).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+    )
+    con.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    return con
+
+
+class _Pool:
+    def __init__(self, dbfile: pathlib.Path, size: int, mmap_size: int):
+        if size < 1:
+            raise ValueError("serve.pool_size must be a positive integer")
+        self._connections = queue.Queue()
+        for _ in range(size):
+            self._connections.put(_open(dbfile, mmap_size))
+
+    @contextlib.contextmanager
+    def connection(self):
+        # blocks while all connections are in use
+        con = self._connections.get()
+        try:
+            yield con
+        finally:
+            self._connections.put(con)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+class _Cache:
+    # LRU of responses, bounded by the total size of their bodies
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # key -> (volatile, content_type, body)
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # incremented whenever entries are dropped, a response computed
+        # before is not stored
+        self.generation = 0
+        self.hits, self.misses = 0, 0
+
+    def get(self, key) -> tuple:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, volatile: bool, content_type: str, body: bytes, generation: int):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation or key in self._entries:
+                return
+            self._entries[key] = (volatile, content_type, body)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def invalidate(self, volatile_only: bool):
+        with self._lock:
+            self.generation += 1
+            for key, (volatile, _, body) in list(self._entries.items()):
+                if volatile or not volatile_only:
+                    del self._entries[key]
+                    self._bytes -= len(body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                generation=self.generation,
+            )
+
+
+class _Watcher:
+    # invalidates the cache after commits of other connections
+
+    def __init__(self, dbfile: pathlib.Path, cache: _Cache):
+        self.cache = cache
+        self._con = _open(dbfile, 0)
+        self._lock = threading.Lock()
+        (self._version,) = self._con.execute("PRAGMA data_version").fetchone()
+        self._solutions = self._state()
+
+    def _state(self) -> tuple:
+        # number of solutions, the largest solution id and its uuid
+        n, max_id = self._con.execute(
+            "SELECT count(*), COALESCE(max(solution_id), 0) FROM solutions"
+        ).fetchone()
+        row = self._con.execute(
+            "SELECT solution_uuid1 FROM solutions WHERE solution_id=?", (max_id,)
+        ).fetchone()
+        return n, max_id, None if row is None else row[0]
+
+    def check(self):
+        with self._lock:
+            (version,) = self._con.execute("PRAGMA data_version").fetchone()
+            if version == self._version:
+                return
+            self._version = version
+
+            n, max_id, uuid = self._solutions
+            (still_there,) = self._con.execute(
+                "SELECT count(*) FROM solutions WHERE solution_id=? AND solution_uuid1=?",
+                (max_id, uuid),
+            ).fetchone()
+            (added,) = self._con.execute(
+                "SELECT count(*) FROM solutions WHERE solution_id>?", (max_id,)
+            ).fetchone()
+            self._solutions = self._state()
+
+            # new solutions get ids past the largest one, unless it was
+            # deleted; nothing was deleted if they make up the difference
+            inserted_only = (still_there or uuid is None) and self._solutions[0] - n == added
+            self.cache.invalidate(volatile_only=inserted_only)
+            logger.debug(f"database changed, dropped {'volatile' if inserted_only else 'all'} responses")
+
+    def close(self):
+        self._con.close()
+
+
+def _arg(params: dict, name: str, type=str, default=_REQUIRED):
+    values = params.get(name)
+    if not values:
+        if default is _REQUIRED:
+            raise ValueError(f"missing parameter {name}")
+        return default
+    try:
+        return type(values[-1])
+    except ValueError:
+        raise ValueError(f"invalid value {values[-1]!r} for parameter {name}") from None
+
+
+def _ids(params: dict, name: str) -> list:
+    # repeated or comma separated
+    try:
+        ids = [int(i) for value in params.get(name, ()) for i in value.split(",") if i]
+    except ValueError:
+        raise ValueError(f"invalid value for parameter {name}") from None
+    if not ids:
+        raise ValueError(f"missing parameter {name}")
+    return ids
+
+
+def _where(params: dict) -> dict:
+    # {"1": "plant3", "0": [100, 200]} -> {1: "plant3", 0: (100, 200)}
+    where = _arg(params, "where", json.loads, None)
+    if where is None:
+        return None
+    try:
+        return {int(k): tuple(v) if isinstance(v, list) else v for k, v in where.items()}
+    except (AttributeError, ValueError):
+        raise ValueError("where must map index positions to a value or a [min, max] range")
+
+
+def _json(data) -> tuple:
+    return CONTENT_JSON, json.dumps(data).encode()
+
+
+def _npz(index_strs, **arrays) -> tuple:
+    np = query._numpy()
+
+    for name, values in arrays.items():
+        if values.dtype == object:
+            # non-numeric parameters
+            arrays[name] = values.astype(str)
+    buffer = io.BytesIO()
+    np.savez(buffer, index=np.array(index_strs, dtype=str), **arrays)
+    return CONTENT_NPZ, buffer.getvalue()
+
+
+def _get_solutions(con: sqlite3.Connection, params: dict) -> tuple:
+    rows = query.solutions(
+        con,
+        model_name=_arg(params, "model", default=None),
+        data_set_id=_arg(params, "data_set", int, None),
+        status=_arg(params, "status", default=None),
+        objective_min=_arg(params, "objective_min", float, None),
+        objective_max=_arg(params, "objective_max", float, None),
+        gap_max=_arg(params, "gap_max", float, None),
+        order_by=_arg(params, "order_by", default="objective"),
+        limit=_arg(params, "limit", int, None),
+    )
+    return _json([row._asdict() for row in rows])
+
+
+def _get_models(con: sqlite3.Connection, params: dict) -> tuple:
+    return _json(
+        [
+            dict(stats._asdict(), status_counts=query.status_counts(con, stats.model_name))
+            for stats in query.model_stats(con)
+        ]
+    )
+
+
+def _get_var(con: sqlite3.Connection, params: dict) -> tuple:
+    matrix, index_strs = query._var_matrix(
+        con, _arg(params, "name"), _ids(params, "solution"), _where(params)
+    )
+    return _npz(index_strs, values=matrix)
+
+
+def _get_param(con: sqlite3.Connection, params: dict) -> tuple:
+    data_set_id = _arg(params, "data_set", int)
+    param_id = query._param_id(con, _arg(params, "name"), data_set_id)
+    index_strs, _, values = query._param_values(con, param_id, data_set_id, _where(params))
+    return _npz(index_strs, values=values)
+
+
+def _get_variable_stats(con: sqlite3.Connection, params: dict) -> tuple:
+    stats, index_strs = query._variable_stats(
+        con, _arg(params, "name"), _arg(params, "data_set", int)
+    )
+    return _npz(index_strs, **stats)
+
+
+# path -> (handler, volatile: depends on which solutions exist)
+_ROUTES = {
+    "/solutions": (_get_solutions, True),
+    "/models": (_get_models, True),
+    "/var": (_get_var, False),
+    "/param": (_get_param, False),
+    "/variable_stats": (_get_variable_stats, True),
+}
+
+
+class Service:
+    """Answers the requests of `pyoptdb serve` on a database file
+
+    pool_size read-only connections with mmap_size bytes of memory-mapped
+    I/O each, responses are cached up to cache_size bytes.
+    """
+
+    def __init__(
+        self,
+        dbfile: pathlib.Path,
+        pool_size: int = 4,
+        cache_size: int = 256 * 2**20,
+        mmap_size: int = 256 * 2**20,
+    ):
+        dbfile = pathlib.Path(dbfile)
+        if not dbfile.exists():
+            raise FileNotFoundError(f"{dbfile} does not exist, run `pyoptdb init`")
+        self.dbfile = dbfile
+        self._pool = _Pool(dbfile, pool_size, mmap_size)
+        self._cache = _Cache(cache_size)
+        self._watcher = _Watcher(dbfile, self._cache)
+
+    @classmethod
+    def from_config(cls, dbfile: pathlib.Path = None, config=None):
+        if config is None:
+            config = _get_config()
+        if dbfile is None:
+            if config["sqlite3"].get("shard", "none") != "none":
+                raise ValueError("the database is sharded, serve one shard with --shard KEY")
+            dbfile = pathlib.Path(config["sqlite3"].get("file"))
+        section = config["serve"]
+        return cls(
+            dbfile,
+            pool_size=section.getint("pool_size"),
+            cache_size=section.getint("cache_size") * 2**20,
+            mmap_size=section.getint("mmap_size") * 2**20,
+        )
+
+    def get(self, path: str, params: dict) -> tuple:
+        """(content type, body) of the response to GET path?params
+
+        params maps names to lists of values, as urllib.parse.parse_qs. Raises
+        KeyError for unknown paths and data, ValueError for invalid
+        parameters.
+        """
+        if path == "/status":
+            return _json(dict(database=self.dbfile.as_posix(), cache=self._cache.stats()))
+        if path not in _ROUTES:
+            raise KeyError(f"unknown path {path}, expected one of " + ", ".join(_ROUTES))
+        handler, volatile = _ROUTES[path]
+
+        self._watcher.check()
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry[1:]
+
+        generation = self._cache.generation
+        with self._pool.connection() as con:
+            # one snapshot for all queries of the request
+            con.execute("BEGIN")
+            try:
+                content_type, body = handler(con, params)
+            finally:
+                con.rollback()
+        self._cache.put(key, volatile, content_type, body, generation)
+        return content_type, body
+
+    def close(self):
+        self._pool.close()
+        self._watcher.close()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # keeps connections open for further requests of a client
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        status = 200
+        try:
+            content_type, body = self.server.service.get(url.path, urllib.parse.parse_qs(url.query))
+        except KeyError as e:
+            status, (content_type, body) = 404, _json(dict(error=str(e.args[0])))
+        except ValueError as e:
+            status, (content_type, body) = 400, _json(dict(error=str(e)))
+        except Exception as e:
+            logger.exception(f"GET {self.path} failed")
+            status, (content_type, body) = 500, _json(dict(error=str(e)))
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # the client address of a Unix socket is empty
+        logger.debug(format % args)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+    service: Service, host: str = "127.0.0.1", port: int = 8750, socket_path: str = None
+):
+    """HTTP server for service on host:port or on the Unix socket socket_path
+
+    Run it with serve_forever().
+    """
+    if socket_path:
+        socket_path = pathlib.Path(socket_path)
+        if socket_path.is_socket():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                if probe.connect_ex(socket_path.as_posix()) == 0:
+                    raise OSError(f"{socket_path} is in use by another server")
+            # left over from a server that was killed
+            socket_path.unlink()
+        server = _UnixServer(socket_path.as_posix(), _Handler)
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    server.service = service
+    return server
+
+
+def _serve(args):
+    config = _get_config()
+    dbfile = None
+    if args.SHARD is not None:
+        from pyoptdb.shards import _select, shards
+
+        ((_, dbfile),) = _select(shards(config), [args.SHARD])
+
+    section = config["serve"]
+    socket_path = args.SOCKET if args.SOCKET is not None else section.get("socket")
+    host = args.HOST or section.get("host")
+    port = args.PORT or section.getint("port")
+
+    service = Service.from_config(dbfile, config)
+    server = make_server(service, host, port, socket_path)
+    where = socket_path if socket_path else f"http://{host}:{server.server_address[1]}"
+    print(f"serving {service.dbfile} on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path:
+            pathlib.Path(socket_path).unlink(missing_ok=True)
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class Client:
+    """Client of `pyoptdb serve` with the functions of pyoptdb.query
+
+    Connects to url, or to the Unix socket socket_path. The connection is
+    kept open between requests.
+    """
+
+    def __init__(self, url: str = "http://127.0.0.1:8750", socket_path: str = None, timeout: float = 60.0):
+        if socket_path:
+            self._connection = _UnixConnection(socket_path, timeout)
+        else:
+            parts = urllib.parse.urlsplit(url)
+            self._connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def _get(self, path: str, **params) -> bytes:
+        url = path + "?" + urllib.parse.urlencode(
+            {name: value for name, value in params.items() if value is not None}, doseq=True
+        )
+        for attempt in range(2):
+            try:
+                self._connection.request("GET", url)
+                response = self._connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the server closed the kept connection, retry once on a new one
+                self._connection.close()
+                if attempt:
+                    raise
+
+        if response.status == 200:
+            return body
+        error = json.loads(body)["error"]
+        if response.status == 404:
+            raise KeyError(error)
+        if response.status == 400:
+            raise ValueError(error)
+        raise RuntimeError(f"pyoptdb serve: {error}")
+
+    def _arrays(self, path: str, **params) -> dict:
+        np = query._numpy()
+        with np.load(io.BytesIO(self._get(path, **params))) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    def solutions(
+        self,
+        model_name: str = None,
+        data_set_id: int = None,
+        status: str = None,
+        objective_min: float = None,
+        objective_max: float = None,
+        gap_max: float = None,
+        order_by: str = "objective",
+        limit: int = None,
+    ) -> list:
+        rows = json.loads(
+            self._get(
+                "/solutions",
+                model=model_name,
+                data_set=data_set_id,
+                status=status,
+                objective_min=objective_min,
+                objective_max=objective_max,
+                gap_max=gap_max,
+                order_by=order_by,
+                limit=limit,
+            )
+        )
+        return [query.SolutionRow(**row) for row in rows]
+
+    def model_stats(self) -> list:
+        return [
+            query.ModelStats(**{field: model[field] for field in query.ModelStats._fields})
+            for model in json.loads(self._get("/models"))
+        ]
+
+    def status_counts(self, model_name: str = None) -> dict:
+        counts = collections.Counter()
+        for model in json.loads(self._get("/models")):
+            if model_name is None or model["model_name"] == model_name:
+                counts.update(model["status_counts"])
+        return dict(counts)
+
+    def var_matrix(self, var_name: str, solution_ids: list, where: dict = None) -> tuple:
+        arrays = self._arrays(
+            "/var",
+            name=var_name,
+            solution=",".join(map(str, solution_ids)),
+            where=None if where is None else json.dumps(where),
+        )
+        return arrays["values"], [decode_index(s) for s in arrays["index"].tolist()]
+
+    def param_vector(self, param_name: str, data_set_id: int, where: dict = None) -> tuple:
+        arrays = self._arrays(
+            "/param",
+            name=param_name,
+            data_set=data_set_id,
+            where=None if where is None else json.dumps(where),
+        )
+        return arrays["values"], [decode_index(s) for s in arrays["index"].tolist()]
+
+    def variable_stats(self, var_name: str, data_set_id: int) -> tuple:
+        arrays = self._arrays("/variable_stats", name=var_name, data_set=data_set_id)
+        index = arrays.pop("index")
+        return arrays, [decode_index(s) for s in index.tolist()]
@@ -0,0 +1,341 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Sharding (sqlite3.shard = model or month): every model file, or every
+# calendar month of inserts, gets its own database in sqlite3.shard_directory,
+# created with the full schema on first insert. sqlite3.file is then a small
+# catalog of the shards. Inserts are routed to their shard; queries run per
+# shard (in parallel threads) and the results are merged, e.g.
+#
+#   from pyoptdb import query, shards
+#   best = shards.solutions(status="optimal", limit=10)  # [(key, SolutionRow)]
+#   rows = shards.execute("SELECT count(*) FROM variable_data")  # [(key, n)]
+#   con = shards.connect(best[0][0])
+#   x, labels = query.var_matrix(con, "x", [best[0][1].solution_id])
+
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+from enum import Enum
+import heapq
+import itertools
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import time
+
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards(
+    shard_id INTEGER PRIMARY KEY,
+    shard_key TEXT NOT NULL UNIQUE,
+    file TEXT NOT NULL,
+    created TEXT NOT NULL
+);
+"""
+
+
+class Sharding(Enum):
+    none = 1
+    # one shard per model file
+    model = 2
+    # one shard per calendar month of inserts
+    month = 3
+
+
+def _sharding(config) -> Sharding:
+    name = config["sqlite3"].get("shard", "none")
+    if name not in Sharding.__members__:
+        raise ValueError(
+            f"unknown sqlite3.shard {name}, expected one of "
+            + ", ".join(Sharding.__members__)
+        )
+    return Sharding[name]
+
+
+def _catalog_file(config) -> pathlib.Path:
+    dbfile = config["sqlite3"].get("file", None)
+    if dbfile is None:
+        raise ValueError("No legal file name for sqlite3.file")
+    return pathlib.Path(dbfile)
+
+
+def _create_catalog(dbfile: pathlib.Path, config):
+    directory = pathlib.Path(config["sqlite3"].get("shard_directory"))
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with contextlib.closing(_connect(dbfile, config)) as con:
+        con.executescript(CATALOG_SCHEMA)
+
+
+def _shard_key(sharding: Sharding, model_file: pathlib.Path) -> str:
+    if sharding == Sharding.model:
+        return pathlib.Path(model_file).stem
+    return time.strftime("%Y-%m")
+
+
+def _shard_file(config, key: str) -> pathlib.Path:
+    directory = pathlib.Path(config["sqlite3"].get("shard_directory"))
+    return directory / (re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".sqlite3")
+
+
+def _route(config, model_file: pathlib.Path) -> pathlib.Path:
+    """Database file solutions of model_file are inserted into
+
+    Creates the shard if it does not exist yet.
+    """
+    sharding = _sharding(config)
+    key = None if sharding == Sharding.none else _shard_key(sharding, model_file)
+    return _route_key(config, key)
+
+
+def _route_key(config, key: str) -> pathlib.Path:
+    # database file of the shard key (the catalog file without sharding),
+    # created if it does not exist yet
+    dbfile = _catalog_file(config)
+    if not dbfile.exists():
+        raise FileNotFoundError(f"{dbfile} does not exist, run `pyoptdb init`")
+    if _sharding(config) == Sharding.none:
+        return dbfile
+
+    with contextlib.closing(
+        _connect(dbfile, config, isolation_level="IMMEDIATE")
+    ) as catalog:
+        row = catalog.execute(
+            "SELECT file FROM shards WHERE shard_key=?", (key,)
+        ).fetchone()
+        if row is not None:
+            return pathlib.Path(row[0])
+
+        # the catalog's write lock serializes concurrent creation of a shard
+        with catalog:
+            catalog.execute("BEGIN IMMEDIATE")
+            row = catalog.execute(
+                "SELECT file FROM shards WHERE shard_key=?", (key,)
+            ).fetchone()
+            if row is not None:
+                return pathlib.Path(row[0])
+
+            shard_file = _shard_file(config, key)
+            _create_shard(shard_file, config)
+            catalog.execute(
+                "INSERT INTO shards(shard_key,file,created) VALUES (?,?,?)",
+                (key, shard_file.as_posix(), time.strftime("%Y-%m-%dT%H:%M:%S")),
+            )
+
+    logger.info(f"created shard {key} ({shard_file})")
+    return shard_file
+
+
+def _create_shard(shard_file: pathlib.Path, config):
+    from pyoptdb.init import _create_database
+
+    if shard_file.exists() and shard_file.stat().st_size > 0:
+        _adopt_shard(shard_file, config)
+        return
+
+    # created under a temporary name, so that an interrupted creation never
+    # leaves a partial database behind
+    shard_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = shard_file.with_name(shard_file.name + f".{os.getpid()}.tmp")
+    try:
+        _create_database(tmp, config)
+        os.replace(tmp, shard_file)
+    finally:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            pathlib.Path(f"{tmp}{suffix}").unlink(missing_ok=True)
+
+
+def _adopt_shard(shard_file: pathlib.Path, config):
+    # a shard created by a process that died before committing its catalog
+    # row; anything but a pyoptdb database is left alone
+    from pyoptdb.migrate import _check_schema_version, _upgrade
+
+    try:
+        with contextlib.closing(_connect(shard_file, config)) as con:
+            tables = {
+                name
+                for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            }
+            if not {"models", "data_sets", "solutions"} <= tables:
+                raise FileExistsError(
+                    f"{shard_file} is not in the catalog and not a pyoptdb database"
+                )
+            _upgrade(con)
+            _check_schema_version(con)
+    except sqlite3.DatabaseError as e:
+        raise FileExistsError(
+            f"{shard_file} is not in the catalog and not a pyoptdb database"
+        ) from e
+    logger.warning(f"adding {shard_file}, which is not in the catalog, as a shard")
+
+
+def shards(config=None) -> list:
+    """(shard key, database file) of every shard
+
+    Without sharding, the configured database is the only shard, its key is
+    None.
+    """
+    if config is None:
+        config = _get_config()
+
+    dbfile = _catalog_file(config)
+    if not dbfile.exists():
+        raise FileNotFoundError(f"{dbfile} does not exist, run `pyoptdb init`")
+    if _sharding(config) == Sharding.none:
+        return [(None, dbfile)]
+
+    with contextlib.closing(
+        sqlite3.connect(f"{dbfile.resolve().as_uri()}?mode=ro", uri=True)
+    ) as catalog:
+        return [
+            (key, pathlib.Path(file))
+            for key, file in catalog.execute(
+                "SELECT shard_key, file FROM shards ORDER BY shard_id"
+            )
+        ]
+
+
+def _select(all_shards: list, keys: list) -> list:
+    if keys is None:
+        return all_shards
+    known = dict(all_shards)
+    unknown = [key for key in keys if key not in known]
+    if unknown:
+        raise KeyError(f"no shards {unknown}")
+    return [(key, known[key]) for key in keys]
+
+
+def connect(key: str = None, config=None) -> sqlite3.Connection:
+    """Read-only connection to the shard `key`"""
+    from pyoptdb import query
+
+    ((_, dbfile),) = _select(shards(config), [key])
+    return query.connect(dbfile)
+
+
+def fan_out(fn, keys: list = None, jobs: int = None, config=None) -> dict:
+    """Run fn(con) on every shard (or the given ones) in parallel
+
+    Every call gets its own read-only connection. Returns shard key -> result.
+    """
+    from pyoptdb import query
+
+    selected = _select(shards(config), keys)
+
+    def run(dbfile):
+        with contextlib.closing(query.connect(dbfile)) as con:
+            return fn(con)
+
+    # sqlite3 releases the GIL while a statement runs
+    jobs = jobs or min(len(selected), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [(key, executor.submit(run, dbfile)) for key, dbfile in selected]
+        return {key: future.result() for key, future in futures}
+
+
+def execute(sql: str, params=(), keys: list = None, jobs: int = None, config=None) -> list:
+    """Rows of a query run on every shard, each prefixed with its shard key"""
+    results = fan_out(
+        lambda con: con.execute(sql, params).fetchall(), keys, jobs, config
+    )
+    return [(key, *row) for key, rows in results.items() for row in rows]
+
+
+def solutions(
+    order_by: str = "objective", limit: int = None, keys: list = None, **filters
+) -> list:
+    """Solutions of all shards matching the filters of query.solutions
+
+    Returns (shard key, SolutionRow) pairs, ordered across the shards.
+    """
+    from pyoptdb import query
+
+    if order_by not in query._SOLUTION_ORDER:
+        raise ValueError(f"cannot order by {order_by}")
+
+    per_shard = fan_out(
+        lambda con: query.solutions(con, order_by=order_by, limit=limit, **filters),
+        keys,
+    )
+
+    # every shard is ordered already, NULLs first as in SQLite
+    def sort_key(item):
+        value = getattr(item[1], order_by)
+        return (value is not None, value if value is not None else 0, item[1].solution_id)
+
+    merged = heapq.merge(
+        *(zip(itertools.repeat(key), rows) for key, rows in per_shard.items()),
+        key=sort_key,
+    )
+    return list(itertools.islice(merged, limit))
+
+
+def _backup(args):
+    config = _get_config()
+
+    directory = pathlib.Path(args.DIRECTORY)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    selected = _select(shards(config), args.SHARDS)
+    if _sharding(config) != Sharding.none:
+        # the catalog is small, it is always copied
+        selected = [("catalog", _catalog_file(config))] + selected
+
+    for key, dbfile in selected:
+        target = directory / dbfile.name
+        start = time.perf_counter()
+        # the online backup API copies a consistent snapshot while writers
+        # only wait for the individual steps
+        with contextlib.closing(_connect(dbfile, config)) as src, contextlib.closing(
+            sqlite3.connect(target)
+        ) as dst:
+            src.backup(dst, pages=1024)
+        print(f"backed up {dbfile} to {target} in {time.perf_counter() - start:.3f} s")
+
+
+def _shards(args):
+    config = _get_config()
+
+    if args.DROP is not None:
+        _drop(config, args.DROP)
+        return
+
+    for key, dbfile in shards(config):
+        size = dbfile.stat().st_size if dbfile.exists() else 0
+        with contextlib.closing(connect(key, config)) as con:
+            (n_solutions,) = con.execute("SELECT count(*) FROM solutions").fetchone()
+        print(f"{key or '-'}\t{dbfile}\t{size}\t{n_solutions}")
+
+
+def _drop(config, key: str):
+    if _sharding(config) == Sharding.none:
+        raise ValueError("sqlite3.shard is none, there are no shards to drop")
+
+    ((_, dbfile),) = _select(shards(config), [key])
+    with contextlib.closing(
+        _connect(_catalog_file(config), config, isolation_level="IMMEDIATE")
+    ) as catalog, catalog:
+        catalog.execute("DELETE FROM shards WHERE shard_key=?", (key,))
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            pathlib.Path(f"{dbfile}{suffix}").unlink(missing_ok=True)
+
+    # archived files are shared by all shards and left in place
+    print(f"dropped shard {key} ({dbfile})")
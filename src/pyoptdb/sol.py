@@ -0,0 +1,170 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Readers for solution files that do not need a Pyomo model instance. Variable
+# values are returned by label, i.e. the name of the variable data object
+# (e.g. "x[a,1]"), which is matched against the labels stored by `insert`.
+
+from __future__ import annotations
+
+import dataclasses
+import itertools
+import pathlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pyomo.opt import SolverResults
+
+# first lines of the YAML/JSON results files written by Pyomo
+_RESULTS_MARKERS = ("#", "{", "Problem:", "Solver:", "Solution:")
+
+# solve_result_num ranges of the AMPL solver library, see pyomo.opt.plugins.sol
+_AMPL_STATUS = (
+    (0, 199, "optimal"),
+    (200, 299, "infeasible"),
+    (300, 399, "unbounded"),
+    (400, 499, "maxIterations"),
+    (500, 599, "internalSolverError"),
+)
+
+
+@dataclasses.dataclass
+class SolutionFile:
+    filename: pathlib.Path
+    message: str
+    status: str
+    objective: float
+    gap: float
+    time_seconds: float
+    # label -> value, variables missing from the file are taken to be 0
+    values: dict
+    # generated on insert if None
+    solution_uuid1: str = None
+
+
+def _defined(value):
+    from pyomo.opt.results.container import undefined
+
+    if value is undefined or value == "None":
+        return None
+    return value
+
+
+def _results_header(results: SolverResults) -> dict:
+    solution = results.solution(0)
+    message = _defined(results.solver.message)
+    status = _defined(results.solver.termination_condition)
+    return dict(
+        message=None if message is None else str(message),
+        status=None if status is None else str(status),
+        objective=next(iter(solution.objective.values()))["Value"],
+        gap=_defined(solution.gap),
+        time_seconds=_defined(results.solver.time),
+    )
+
+
+def is_ampl_sol(filename: pathlib.Path) -> bool:
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                return not line.startswith(_RESULTS_MARKERS)
+    return False
+
+
+def read_results(filename: pathlib.Path) -> SolutionFile:
+    from pyomo.opt import SolverResults
+
+    results = SolverResults()
+    results.read(filename=filename)
+
+    return SolutionFile(
+        filename=filename,
+        values={
+            label: data["Value"]
+            for label, data in results.solution(0).variable.items()
+        },
+        **_results_header(results),
+    )
+
+
+def read_col(filename: pathlib.Path):
+    with open(filename, "r") as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
+def read_ampl_sol(
+    filename: pathlib.Path, col_file: pathlib.Path = None
+) -> SolutionFile:
+    # the .col file written next to the .nl file maps the primal values to
+    # labels, the .row file is not needed since no duals are stored
+    if col_file is None:
+        col_file = filename.with_suffix(".col")
+    if not col_file.exists():
+        raise FileNotFoundError(
+            f"{col_file} not found, write the .nl file with symbolic_solver_labels=True"
+        )
+
+    with open(filename, "r") as f:
+        message = []
+        for line in f:
+            if line.strip() == "Options":
+                break
+            if line.strip():
+                message.append(line.strip())
+        else:
+            raise ValueError(f"{filename}: no Options line found")
+
+        nopts = int(next(f))
+        need_vbtol = nopts > 4
+        if need_vbtol:
+            nopts -= 2
+        z = [int(next(f)) for _ in range(nopts + 4)]
+        if need_vbtol:
+            next(f)
+
+        n_duals, n_primals = z[nopts + 1], z[nopts + 3]
+        for _ in range(n_duals):
+            next(f)
+
+        primals = [float(next(f)) for _ in range(n_primals)]
+        values = dict(zip(read_col(col_file), primals))
+
+        objno = next(itertools.dropwhile(lambda l: not l.strip(), f), "").split()
+
+    status = None
+    if len(objno) == 3 and objno[0] == "objno":
+        solve_result_num = int(objno[2])
+        status = next(
+            (s for lo, hi, s in _AMPL_STATUS if lo <= solve_result_num <= hi),
+            "unknown",
+        )
+
+    return SolutionFile(
+        filename=filename,
+        message="; ".join(message),
+        status=status,
+        objective=None,
+        gap=None,
+        time_seconds=None,
+        values=values,
+    )
+
+
+def read_solution(filename: pathlib.Path) -> SolutionFile:
+    if is_ampl_sol(filename):
+        return read_ampl_sol(filename)
+    return read_results(filename)
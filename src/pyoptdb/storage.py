@@ -0,0 +1,122 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Columnar storage: the values of one (solution, variable) or (data set,
+# parameter) are stored as a single little-endian float64 BLOB. The matching
+# index strings are stored once in an index dictionary, which is shared by
+# every array with the same ordered index set.
+
+import array
+from enum import Enum
+import hashlib
+import sqlite3
+import sys
+
+from pyoptdb.db import _executemany_chunked
+from pyoptdb.indices import _index_ids
+
+DTYPE = "<f8"
+
+
+class Storage(Enum):
+    rows = 1
+    columnar = 2
+    # rows, stored as the changes against a base solution, see pyoptdb/delta.py
+    delta = 3
+
+
+def _storage(config) -> Storage:
+    name = config["sqlite3"].get("storage", "rows")
+    if name not in Storage.__members__:
+        raise ValueError(
+            f"unknown sqlite3.storage {name}, expected one of "
+            + ", ".join(Storage.__members__)
+        )
+    return Storage[name]
+
+
+def pack(values) -> bytes:
+    # raises TypeError for non-numeric values
+    arr = array.array("d", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def unpack(blob: bytes):
+    try:
+        import numpy as np
+    except ImportError:
+        arr = array.array("d")
+        arr.frombytes(blob)
+        if sys.byteorder == "big":
+            arr.byteswap()
+        return arr
+
+    # a read-only view on the BLOB, no copy is made
+    return np.frombuffer(blob, dtype=DTYPE)
+
+
+def _index_dict_checksum(index_strs) -> tuple:
+    checksum = hashlib.sha1()
+    length = 0
+    for index_str in index_strs:
+        checksum.update(index_str.encode("utf-8"))
+        checksum.update(b"\0")
+        length += 1
+    return checksum.hexdigest(), length
+
+
+def _insert_or_ignore_index_dict(cur: sqlite3.Cursor, index_strs, chunk_size: int):
+    # index_strs() is called to look up the checksum and, if the dictionary
+    # is new, twice more to store the entries
+    checksum, length = _index_dict_checksum(index_strs())
+
+    row = cur.execute(
+        "SELECT index_dict_id FROM index_dicts WHERE checksum=?", (checksum,)
+    ).fetchone()
+    if row is not None:
+        return row[0]
+
+    cur.execute(
+        "INSERT INTO index_dicts(checksum,length) VALUES (?,?)", (checksum, length)
+    )
+    index_dict_id = cur.lastrowid
+
+    _executemany_chunked(
+        cur,
+        "INSERT INTO index_dict_entries(index_dict_id,position,index_str,index_id) "
+        "VALUES (?,?,?,?)",
+        (
+            (index_dict_id, position, index_str, index_id)
+            for position, (index_str, index_id) in enumerate(
+                zip(index_strs(), _index_ids(cur, index_strs(), chunk_size))
+            )
+        ),
+        chunk_size,
+    )
+
+    return index_dict_id
+
+
+def _index_dict(cur: sqlite3.Cursor, index_dict_id: int) -> list:
+    return [
+        index_str
+        for (index_str,) in cur.execute(
+            "SELECT index_str FROM index_dict_entries WHERE index_dict_id=? "
+            "ORDER BY position",
+            (index_dict_id,),
+        )
+    ]
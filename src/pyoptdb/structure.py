@@ -0,0 +1,252 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# What `insert` needs to know about a model instance: the names of its
+# components and the checksum of its data. The index strings, labels and
+# values are streamed from the instance while they are inserted. The cache
+# keeps the structure together with a copy of the parameter and set values
+# and variable labels (see _Copy), enough to insert a data set and match
+# solution files against its labels without building the model. It is keyed
+# by the checksums of the model and data file, a changed file therefore never
+# hits a stale entry.
+
+import collections
+import dataclasses
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+
+logger = logging.getLogger(__name__)
+
+# bump when the dataclasses below change, older cache entries are ignored
+FORMAT_VERSION = 3
+
+
+@dataclasses.dataclass
+class ParamStructure:
+    name: str
+    doc: str
+
+
+@dataclasses.dataclass
+class SetStructure:
+    name: str
+    doc: str
+
+
+@dataclasses.dataclass
+class VarStructure:
+    name: str
+    doc: str
+
+
+@dataclasses.dataclass
+class ModelStructure:
+    name: str
+    doc: str
+    params: list
+    sets: list
+    vars: list
+    # see _data_checksum
+    data_checksum: str
+
+
+def str_repr_index(idx):
+    return str(idx)
+
+
+def _index_strs(component):
+    return (str_repr_index(idx) for idx in component.keys())
+
+
+def _param_values(param):
+    import pyomo.environ as pyo
+
+    return (pyo.value(param[idx]) for idx in param.keys())
+
+
+def _set_members(_set):
+    return (str(_member) for _member in _set)
+
+
+def _labels(var):
+    # names of the variable data objects, as used in solution files
+    return (vardata.name for vardata in var.values())
+
+
+# what _labels reads from a variable entry
+_VarData = collections.namedtuple("_VarData", "name")
+
+
+class _Copy(dict):
+    # the entries of a component under its name, read like the component by
+    # the functions above: {index: value} of a Param, {member: None} of a Set,
+    # {index: _VarData} of a Var
+    def __init__(self, name: str, entries):
+        super().__init__(entries)
+        self.name = name
+
+
+def _copies(model):
+    # a _Copy of every Param, Set and Var of model, one at a time
+    import pyomo.environ as pyo
+
+    for name, param in model.component_map(pyo.Param).items():
+        yield _Copy(name, zip(param.keys(), _param_values(param)))
+    for name, _set in model.component_map(pyo.Set).items():
+        yield _Copy(name, dict.fromkeys(_set))
+    for name, var in model.component_map(pyo.Var).items():
+        yield _Copy(name, ((idx, _VarData(vardata.name)) for idx, vardata in var.items()))
+
+
+def _snapshot(model) -> dict:
+    # component name -> _Copy
+    return {copy.name: copy for copy in _copies(model)}
+
+
+def _extract_structure(model) -> ModelStructure:
+    import pyomo.environ as pyo
+
+    sets = []
+    for _set in model.component_map(pyo.Set).values():
+        if _set.is_indexed():
+            raise NotImplementedError("TODO indexed sets")
+        sets.append(SetStructure(name=_set.name, doc=_set.doc))
+
+    return ModelStructure(
+        name=model.name.strip("\'").strip("\""),
+        doc=model.doc,
+        params=[
+            ParamStructure(name=param.name, doc=param.doc)
+            for param in model.component_map(pyo.Param).values()
+        ],
+        sets=sets,
+        vars=[
+            VarStructure(name=var.name, doc=var.doc)
+            for var in model.component_map(pyo.Var).values()
+        ],
+        data_checksum=_data_checksum(model),
+    )
+
+
+def _data_checksum(model) -> str:
+    # independent of the data file, two files defining the same values give
+    # the same checksum
+    import pyomo.environ as pyo
+
+    checksum = hashlib.sha1()
+    params = model.component_map(pyo.Param)
+    for name in sorted(params):
+        checksum.update(f"param {name}\0".encode("utf-8"))
+        for index_str, value in zip(
+            _index_strs(params[name]), _param_values(params[name])
+        ):
+            checksum.update(f"{index_str}\0{value!r}\0".encode("utf-8"))
+    sets = model.component_map(pyo.Set)
+    for name in sorted(sets):
+        checksum.update(f"set {name}\0".encode("utf-8"))
+        for member in _set_members(sets[name]):
+            checksum.update(f"{member}\0".encode("utf-8"))
+    return checksum.hexdigest()
+
+
+@dataclasses.dataclass
+class CachedModel:
+    structure: ModelStructure
+    # component name -> _Copy, see _copies
+    components: dict
+
+
+@dataclasses.dataclass
+class StructureCache:
+    directory: pathlib.Path
+    # in bytes, least recently used entries are evicted beyond this size
+    max_size: int
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            directory=pathlib.Path(config["cache"].get("directory")),
+            max_size=config["cache"].getint("max_size") * 2**20,
+        )
+
+    def _path(self, model_checksum: str, data_checksum: str) -> pathlib.Path:
+        return self.directory / (
+            f"{model_checksum}-{data_checksum}.v{FORMAT_VERSION}.pickle"
+        )
+
+    def get(self, model_checksum: str, data_checksum: str) -> CachedModel:
+        if self.max_size <= 0:
+            return None
+
+        path = self._path(model_checksum, data_checksum)
+        try:
+            with open(path, "rb") as f:
+                structure = pickle.load(f)
+                components = {}
+                # the copies follow the structure, None ends the entry
+                while (copy := pickle.load(f)) is not None:
+                    components[copy.name] = copy
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"ignoring corrupt cache entry {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+        # the modification time orders the entries for eviction
+        os.utime(path)
+        logger.debug(f"using cached model structure {path}")
+        return CachedModel(structure, components)
+
+    def put(self, model_checksum: str, data_checksum: str, structure: ModelStructure, model):
+        if self.max_size <= 0:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        path = self._path(model_checksum, data_checksum)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(structure, f, protocol=pickle.HIGHEST_PROTOCOL)
+                # one component at a time, next to the instance
+                for copy in _copies(model):
+                    pickle.dump(copy, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(None, f)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob("*.pickle"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            logger.debug(f"evicting {path} from the model structure cache")
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,312 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Summary tables: variable_stats (count, sum, min and max of every variable
+# entry over the solutions of a data set), model_stats (number of solutions
+# and best objectives per model) and status_counts. insert accumulates the
+# solutions of a batch in a _Summary and adds it to the tables right before
+# the batch is committed, independent of the storage mode; pyoptdb merge adds
+# the solutions it copies with one query. `pyoptdb summary --rebuild`
+# recomputes the tables from the stored solutions.
+
+import collections
+import contextlib
+import logging
+import sqlite3
+
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect, _executemany_chunked
+from pyoptdb.instrument import count_rows
+from pyoptdb.storage import unpack
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_STATUS = "unknown"
+
+_ON_CONFLICT_VARIABLE_STATS = (
+    "ON CONFLICT(data_set_id,var_id,index_id) DO UPDATE SET "
+    "n=n+excluded.n, sum_value=sum_value+excluded.sum_value, "
+    "min_value=min(min_value,excluded.min_value), "
+    "max_value=max(max_value,excluded.max_value)"
+)
+
+_UPSERT_VARIABLE_STATS = (
+    "INSERT INTO variable_stats(data_set_id,var_id,index_id,n,sum_value,min_value,max_value) "
+    "VALUES (?,?,?,?,?,?,?) " + _ON_CONFLICT_VARIABLE_STATS
+)
+
+# all expressions see the values before the update
+_UPSERT_MODEL_STATS = (
+    "INSERT INTO model_stats(model_id,n_solutions,min_objective,min_solution_id,"
+    "max_objective,max_solution_id) VALUES (?,?,?,?,?,?) "
+    "ON CONFLICT(model_id) DO UPDATE SET "
+    "n_solutions=n_solutions+excluded.n_solutions, "
+    "min_solution_id=CASE WHEN min_objective IS NULL "
+    "OR excluded.min_objective<min_objective "
+    "THEN excluded.min_solution_id ELSE min_solution_id END, "
+    "min_objective=CASE WHEN min_objective IS NULL "
+    "OR excluded.min_objective<min_objective "
+    "THEN excluded.min_objective ELSE min_objective END, "
+    "max_solution_id=CASE WHEN max_objective IS NULL "
+    "OR excluded.max_objective>max_objective "
+    "THEN excluded.max_solution_id ELSE max_solution_id END, "
+    "max_objective=CASE WHEN max_objective IS NULL "
+    "OR excluded.max_objective>max_objective "
+    "THEN excluded.max_objective ELSE max_objective END"
+)
+
+_UPSERT_STATUS_COUNTS = (
+    "INSERT INTO status_counts(model_id,sol_status,n) VALUES (?,?,?) "
+    "ON CONFLICT(model_id,sol_status) DO UPDATE SET n=n+excluded.n"
+)
+
+
+class _Summary:
+    def __init__(self):
+        # (data_set_id, var_id, index_id) -> [n, sum, min, max]
+        self.values = {}
+        # model_id -> [n, min objective, its solution_id, max objective, ...]
+        self.models = {}
+        # (model_id, status) -> n
+        self.statuses = collections.Counter()
+        # data_set_id -> [(label, var_id, index_id)], see add_labelled
+        self._labels = {}
+
+    def add_solution(self, model_id: int, solution_id: int, status: str, objective):
+        self.statuses[(model_id, status or UNKNOWN_STATUS)] += 1
+
+        entry = self.models.setdefault(model_id, [0, None, None, None, None])
+        entry[0] += 1
+        if objective is None:
+            return
+        if entry[1] is None or objective < entry[1]:
+            entry[1:3] = objective, solution_id
+        if entry[3] is None or objective > entry[3]:
+            entry[3:5] = objective, solution_id
+
+    def add_values(self, data_set_id: int, rows):
+        # rows: (var_id, index_id, value)
+        values = self.values
+        for var_id, index_id, value in rows:
+            if value is None:
+                continue
+            key = (data_set_id, var_id, index_id)
+            entry = values.get(key)
+            if entry is None:
+                values[key] = [1, value, value, value]
+            else:
+                entry[0] += 1
+                entry[1] += value
+                if value < entry[2]:
+                    entry[2] = value
+                if value > entry[3]:
+                    entry[3] = value
+
+    def add_labelled(self, cur: sqlite3.Cursor, data_set_id: int, values: dict):
+        # values: label -> value of a solution file, missing labels are 0
+        if data_set_id not in self._labels:
+            self._labels[data_set_id] = cur.execute(
+                "SELECT label, var_id, index_id FROM variable_labels "
+                "WHERE data_set_id=?",
+                (data_set_id,),
+            ).fetchall()
+        self.add_values(
+            data_set_id,
+            (
+                (var_id, index_id, values.get(label, 0))
+                for label, var_id, index_id in self._labels[data_set_id]
+            ),
+        )
+
+    def flush(self, cur: sqlite3.Cursor, chunk_size: int = 10000):
+        _executemany_chunked(
+            cur,
+            _UPSERT_VARIABLE_STATS,
+            (key + tuple(entry) for key, entry in self.values.items()),
+            chunk_size,
+        )
+        cur.executemany(
+            _UPSERT_MODEL_STATS,
+            ((model_id, *entry) for model_id, entry in self.models.items()),
+        )
+        count_rows("model_stats", cur.rowcount)
+        cur.executemany(
+            _UPSERT_STATUS_COUNTS,
+            (key + (n,) for key, n in self.statuses.items()),
+        )
+        count_rows("status_counts", cur.rowcount)
+        self.values.clear()
+        self.models.clear()
+        self.statuses.clear()
+
+
+def _rebuild(cur: sqlite3.Cursor, data_set_ids: list = None):
+    # all tables, or the entries of the given data sets and their models
+    if data_set_ids is None:
+        _rebuild_models(cur)
+        _rebuild_variables(cur)
+        return
+
+    model_ids = set()
+    for data_set_id in data_set_ids:
+        row = cur.execute(
+            "SELECT model_id FROM data_sets WHERE data_set_id=?", (data_set_id,)
+        ).fetchone()
+        if row is not None:
+            model_ids.add(row[0])
+    for model_id in sorted(model_ids):
+        _rebuild_models(cur, model_id)
+    for data_set_id in data_set_ids:
+        _rebuild_variables(cur, data_set_id)
+
+
+def _rebuild_models(cur: sqlite3.Cursor, model_id: int = None):
+    if model_id is None:
+        join, where, params = "", "", ()
+    else:
+        join, where, params = " AND ds.model_id=?", " WHERE model_id=?", (model_id,)
+    cur.execute(f"DELETE FROM status_counts{where}", params)
+    cur.execute(f"DELETE FROM model_stats{where}", params)
+
+    cur.execute(
+        "INSERT INTO status_counts(model_id,sol_status,n) "
+        "SELECT ds.model_id, COALESCE(s.sol_status, ?), count(*) "
+        f"FROM solutions s JOIN data_sets ds ON ds.data_set_id=s.data_set_id{join} "
+        "GROUP BY ds.model_id, COALESCE(s.sol_status, ?)",
+        (UNKNOWN_STATUS, *params, UNKNOWN_STATUS),
+    )
+    cur.execute(
+        "INSERT INTO model_stats(model_id,n_solutions,min_objective,max_objective) "
+        "SELECT ds.model_id, count(*), min(s.objective), max(s.objective) "
+        f"FROM solutions s JOIN data_sets ds ON ds.data_set_id=s.data_set_id{join} "
+        "GROUP BY ds.model_id",
+        params,
+    )
+    for column, order in (("min", "ASC"), ("max", "DESC")):
+        cur.execute(
+            f"UPDATE model_stats SET {column}_solution_id=("
+            "SELECT s.solution_id FROM solutions s "
+            "JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+            "WHERE ds.model_id=model_stats.model_id AND s.objective IS NOT NULL "
+            f"ORDER BY s.objective {order}, s.solution_id LIMIT 1){where}",
+            params,
+        )
+
+
+def _rebuild_variables(cur: sqlite3.Cursor, data_set_id: int = None):
+    if data_set_id is None:
+        cur.execute("DELETE FROM variable_stats")
+        _add_variables(cur, "", ())
+    else:
+        cur.execute("DELETE FROM variable_stats WHERE data_set_id=?", (data_set_id,))
+        _add_variables(cur, " AND s.data_set_id=?", (data_set_id,))
+
+
+def _add_solutions(cur: sqlite3.Cursor, first_solution_id: int):
+    # adds the solutions with ids from first_solution_id on, e.g. those copied
+    # by pyoptdb merge, to the tables
+    summary = _Summary()
+    for solution_id, model_id, status, objective in cur.connection.execute(
+        "SELECT s.solution_id, ds.model_id, s.sol_status, s.objective FROM solutions s "
+        "JOIN data_sets ds ON ds.data_set_id=s.data_set_id WHERE s.solution_id>=? "
+        "ORDER BY s.solution_id",
+        (first_solution_id,),
+    ):
+        summary.add_solution(model_id, solution_id, status, objective)
+    summary.flush(cur)
+    _add_variables(cur, " AND s.solution_id>=?", (first_solution_id,))
+
+
+def _add_variables(cur: sqlite3.Cursor, where: str, params: tuple):
+    # adds the values of the solutions s matching where to variable_stats
+
+    # solutions stored as rows, delta-encoded ones (see pyoptdb/delta.py)
+    # take the value of their base where they store none
+    cur.execute(
+        "INSERT INTO variable_stats(data_set_id,var_id,index_id,n,sum_value,min_value,max_value) "
+        "SELECT data_set_id, var_id, index_id, count(value), sum(value), min(value), max(value) "
+        "FROM ("
+        "SELECT s.data_set_id, d.var_id, d.index_id, d.value FROM solutions s "
+        "JOIN variable_data d ON d.solution_id=s.solution_id "
+        f"WHERE s.base_solution_id IS NULL{where} "
+        "UNION ALL "
+        "SELECT s.data_set_id, b.var_id, b.index_id, COALESCE(d.value, b.value) "
+        "FROM solutions s "
+        "JOIN variable_data b ON b.solution_id=s.base_solution_id "
+        "LEFT JOIN variable_data d ON d.solution_id=s.solution_id "
+        "AND d.var_id=b.var_id AND d.index_str=b.index_str "
+        f"WHERE s.base_solution_id IS NOT NULL{where}"
+        ") WHERE value IS NOT NULL "
+        "GROUP BY data_set_id, var_id, index_id " + _ON_CONFLICT_VARIABLE_STATS,
+        params * 2,
+    )
+
+    # columnar solutions, one data set at a time
+    index_ids = {}
+    rows = cur.connection.execute(
+        "SELECT s.data_set_id, a.var_id, a.index_dict_id, a.value_array "
+        f"FROM variable_arrays a JOIN solutions s ON s.solution_id=a.solution_id{where} "
+        "ORDER BY s.data_set_id",
+        params,
+    )
+    summary = _Summary()
+    last_data_set_id = None
+    for data_set_id, var_id, index_dict_id, value_array in rows:
+        if data_set_id != last_data_set_id:
+            summary.flush(cur)
+            last_data_set_id = data_set_id
+        if index_dict_id not in index_ids:
+            index_ids[index_dict_id] = [
+                index_id
+                for (index_id,) in cur.connection.execute(
+                    "SELECT index_id FROM index_dict_entries WHERE index_dict_id=? "
+                    "ORDER BY position",
+                    (index_dict_id,),
+                )
+            ]
+        summary.add_values(
+            data_set_id,
+            (
+                (var_id, index_id, float(value))
+                for index_id, value in zip(index_ids[index_dict_id], unpack(value_array))
+            ),
+        )
+    summary.flush(cur)
+
+
+def _summary(args):
+    from pyoptdb.query import model_stats, status_counts
+    from pyoptdb.shards import shards
+
+    config = _get_config()
+
+    for key, dbfile in shards(config):
+        with contextlib.closing(_connect(dbfile, config)) as con:
+            if args.REBUILD:
+                with con:
+                    _rebuild(con.cursor())
+                print(f"rebuilt the summary tables of {dbfile}")
+                continue
+
+            if key is not None:
+                print(f"shard {key}")
+            for stats in model_stats(con):
+                print(
+                    f"{stats.model_name}: {stats.n_solutions} solution(s), "
+                    f"objective min {stats.min_objective} (solution {stats.min_solution_id}), "
+                    f"max {stats.max_objective} (solution {stats.max_solution_id})"
+                )
+                for status, n in status_counts(con, stats.model_name).items():
+                    print(f"\t{status}: {n}")
@@ -0,0 +1,305 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Loading stored solutions and parameter data back into a Pyomo model, e.g.
+# to warm-start a solve:
+#
+#   from pyoptdb import query, warmstart
+#
+#   con = query.connect()
+#   solution = warmstart.warm_start(instance, con, same_data=True)
+#
+# The values of a variable are read with one query per variable (in any
+# storage mode) and assigned through a lookup from the stored index strings
+# to the component data of the model, built once per component. A Loader
+# keeps these lookups, so loading several solutions into the same model only
+# pays for them once.
+
+import contextlib
+import logging
+import sqlite3
+
+from pyoptdb.query import SolutionRow, _param_values, _var_values
+from pyoptdb.structure import str_repr_index
+
+logger = logging.getLogger(__name__)
+
+SELECT = ("best", "latest")
+
+
+def _model_name(model) -> str:
+    # as stored by insert, see pyoptdb/structure.py
+    return model.name.strip("'").strip('"')
+
+
+def _model_id(con: sqlite3.Connection, model_name: str) -> int:
+    row = con.execute(
+        "SELECT model_id FROM models WHERE model_name=?", (model_name,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"no model {model_name} in the database")
+    return row[0]
+
+
+def _matching_data_set(con: sqlite3.Connection, model) -> int:
+    # the data set with the same parameter and set values as the model
+    from pyoptdb.structure import _data_checksum
+
+    model_name = _model_name(model)
+    row = con.execute(
+        "SELECT ds.data_set_id FROM data_sets ds JOIN models m ON m.model_id=ds.model_id "
+        "WHERE m.model_name=? AND ds.data_checksum=?",
+        (model_name, _data_checksum(model)),
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"no data set of {model_name} has the data of the model")
+    return row[0]
+
+
+def find_solution(
+    con: sqlite3.Connection,
+    model_name: str = None,
+    solution_id: int = None,
+    uuid: str = None,
+    data_set_id: int = None,
+    status: str = None,
+    select: str = "best",
+    maximize: bool = False,
+) -> SolutionRow:
+    """A single stored solution
+
+    Either the one with the given solution_id or uuid, or the best (lowest
+    objective, highest with maximize=True) or latest of the solutions
+    matching model_name, data_set_id and status. Raises KeyError if there is
+    none.
+    """
+    if select not in SELECT:
+        raise ValueError(f"unknown select {select}, expected one of " + ", ".join(SELECT))
+
+    where, params = [], []
+    for clause, value in (
+        ("s.solution_id=?", solution_id),
+        ("s.solution_uuid1=?", uuid),
+        ("m.model_name=?", model_name),
+        ("s.data_set_id=?", data_set_id),
+        ("s.sol_status=?", status),
+    ):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+
+    if select == "latest":
+        order = "s.solution_id DESC"
+    else:
+        # solutions without an objective come last
+        order = f"s.objective IS NULL, s.objective {'DESC' if maximize else 'ASC'}, s.solution_id"
+
+    row = con.execute(
+        "SELECT s.solution_id, s.solution_uuid1, s.data_set_id, m.model_name, "
+        "s.sol_message, s.sol_status, s.objective, s.gap, s.time_seconds "
+        "FROM solutions s "
+        "JOIN data_sets ds ON ds.data_set_id=s.data_set_id "
+        "JOIN models m ON m.model_id=ds.model_id"
+        + ("" if not where else " WHERE " + " AND ".join(where))
+        + f" ORDER BY {order} LIMIT 1",
+        params,
+    ).fetchone()
+    if row is None:
+        filters = ", ".join(
+            f"{name}={value!r}"
+            for name, value in (
+                ("model_name", model_name),
+                ("solution_id", solution_id),
+                ("uuid", uuid),
+                ("data_set_id", data_set_id),
+                ("status", status),
+            )
+            if value is not None
+        )
+        raise KeyError(f"no solution with {filters or 'any properties'}")
+    return SolutionRow(*row)
+
+
+class Loader:
+    """Assigns stored values to the components of a model instance
+
+    The index lookups of the components are built on first use and kept.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.model_name = _model_name(model)
+        # component name -> {index_str: component data} (variables) or
+        # {index_str: index} (parameters)
+        self._lookups = {}
+
+    def _lookup(self, component, data: bool) -> dict:
+        lookup = self._lookups.get(component.name)
+        if lookup is None:
+            if data:
+                lookup = {str_repr_index(idx): obj for idx, obj in component.items()}
+            else:
+                lookup = {str_repr_index(idx): idx for idx in component.index_set()}
+            self._lookups[component.name] = lookup
+        return lookup
+
+    def _components(self, ctype, names: list) -> list:
+        available = self.model.component_map(ctype)
+        if names is None:
+            return list(available.values())
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise KeyError(f"no {ctype.__name__} {unknown} in the model")
+        return [available[name] for name in names]
+
+    def _ids(self, con: sqlite3.Connection, table: str, column: str) -> dict:
+        return dict(
+            con.execute(
+                f"SELECT {column}_name, {column}_id FROM {table} WHERE model_id=?",
+                (_model_id(con, self.model_name),),
+            )
+        )
+
+    def load_solution(
+        self,
+        con: sqlite3.Connection,
+        solution_id: int,
+        variables: list = None,
+        fix: bool = False,
+    ) -> int:
+        """Set the variables (default: all) to the values of a stored solution
+
+        Entries without a stored value are left unchanged, values are not
+        checked against the bounds and domain. Returns the number of values
+        assigned.
+        """
+        import pyomo.environ as pyo
+
+        var_ids = self._ids(con, "variables", "var")
+        n_assigned, n_unmatched = 0, 0
+
+        for var in self._components(pyo.Var, variables):
+            if var.name not in var_ids:
+                logger.warning(f"variable {var.name} is not stored for {self.model_name}")
+                continue
+
+            index_strs, _, values = _var_values(con, var_ids[var.name], solution_id)
+            lookup = self._lookup(var, data=True)
+            for index_str, value in zip(index_strs, values.tolist()):
+                vardata = lookup.get(index_str)
+                if vardata is None:
+                    n_unmatched += 1
+                    continue
+                if value != value:
+                    # NaN, no value stored
+                    continue
+                vardata.set_value(value, skip_validation=True)
+                if fix:
+                    vardata.fixed = True
+                n_assigned += 1
+
+        if n_unmatched:
+            logger.warning(
+                f"{n_unmatched} stored value(s) of solution {solution_id} have no "
+                "counterpart in the model"
+            )
+        return n_assigned
+
+    def load_params(
+        self, con: sqlite3.Connection, data_set_id: int, params: list = None
+    ) -> int:
+        """Set mutable Params (default: all) to the values of a stored data set
+
+        Immutable Params are skipped unless named in params, which raises
+        ValueError. Returns the number of values assigned.
+        """
+        import pyomo.environ as pyo
+
+        param_ids = self._ids(con, "parameters", "param")
+        n_assigned, n_unmatched = 0, 0
+
+        for param in self._components(pyo.Param, params):
+            if not param.mutable:
+                if params is not None:
+                    raise ValueError(f"parameter {param.name} is not mutable")
+                logger.debug(f"skipping immutable parameter {param.name}")
+                continue
+            if param.name not in param_ids:
+                logger.warning(f"parameter {param.name} is not stored for {self.model_name}")
+                continue
+
+            index_strs, _, values = _param_values(con, param_ids[param.name], data_set_id)
+            lookup = self._lookup(param, data=False)
+            new_values = {}
+            for index_str, value in zip(index_strs, values.tolist()):
+                idx = lookup.get(index_str)
+                if idx is None:
+                    n_unmatched += 1
+                    continue
+                new_values[idx] = value
+
+            # the indices come from the index set of the Param, so the
+            # per-item checks of __setitem__ are skipped
+            param.store_values(new_values, check=False)
+            n_assigned += len(new_values)
+
+        if n_unmatched:
+            logger.warning(
+                f"{n_unmatched} stored value(s) of data set {data_set_id} have no "
+                "counterpart in the model"
+            )
+        return n_assigned
+
+
+def load_solution(
+    model, con: sqlite3.Connection, solution_id: int, variables: list = None, fix: bool = False
+) -> int:
+    """Set the variables of model to the values of a stored solution"""
+    return Loader(model).load_solution(con, solution_id, variables, fix)
+
+
+def load_params(model, con: sqlite3.Connection, data_set_id: int, params: list = None) -> int:
+    """Set the mutable Params of model to the values of a stored data set"""
+    return Loader(model).load_params(con, data_set_id, params)
+
+
+def warm_start(
+    model,
+    con: sqlite3.Connection = None,
+    same_data: bool = False,
+    variables: list = None,
+    **selector,
+) -> SolutionRow:
+    """Load the stored solution chosen by selector into model
+
+    selector takes the arguments of find_solution, by default the best
+    solution of the model. With same_data=True only solutions of the data
+    set with the same parameter and set values as the model are considered.
+    Returns the solution loaded.
+    """
+    if con is None:
+        from pyoptdb.query import connect
+
+        with contextlib.closing(connect()) as con:
+            return warm_start(model, con, same_data, variables, **selector)
+
+    if same_data:
+        selector["data_set_id"] = _matching_data_set(con, model)
+    selector.setdefault("model_name", _model_name(model))
+
+    solution = find_solution(con, **selector)
+    n = load_solution(model, con, solution.solution_id, variables)
+    logger.info(f"loaded {n} value(s) of solution {solution.solution_id}")
+    return solution
@@ -0,0 +1,478 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# `pyoptdb watch`: a long-running process that inserts the solution files
+# appearing in one or more directories (recursively). A file is taken once
+# it has not been modified for watch.settle seconds. Ready files are inserted
+# in batches of watch.batch_size, a partial batch once its oldest file waited
+# watch.max_latency seconds; at most watch.max_pending files are queued. The
+# database connection stays open and, after the first batch, solutions are
+# matched against the stored variable labels without building the model.
+#
+# Every inserted file is recorded in ingested_files in the same transaction
+# as its solution, so a restart never inserts a file twice. A file seen for
+# the first time is looked up there; only the files still on disk are
+# remembered. On Linux the directories are watched with inotify and only the
+# directories named by an event are scanned again, elsewhere all of them are
+# polled every watch.poll_interval seconds.
+
+import contextlib
+import ctypes
+import ctypes.util
+import dataclasses
+import fnmatch
+import functools
+import itertools
+import logging
+import os
+import pathlib
+import select
+import sqlite3
+import struct
+import sys
+import time
+
+from pyoptdb.archive import Archive
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+from pyoptdb.migrate import _check_schema_version
+from pyoptdb.shards import _route, shards
+from pyoptdb.structure import StructureCache
+
+logger = logging.getLogger(__name__)
+
+# IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_ATTRIB
+_INOTIFY_MASK = 0x100 | 0x08 | 0x80 | 0x04
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+# struct inotify_event without the name that follows it
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+@dataclasses.dataclass
+class _Settings:
+    pattern: str
+    settle: float
+    poll_interval: float
+    batch_size: int
+    max_latency: float
+    max_pending: int
+    inotify: bool
+
+    @classmethod
+    def from_config(cls, config, pattern: str = None, batch_size: int = None):
+        section = config["watch"]
+        settings = cls(
+            pattern=pattern or section.get("pattern"),
+            settle=section.getfloat("settle"),
+            poll_interval=section.getfloat("poll_interval"),
+            batch_size=batch_size or section.getint("batch_size"),
+            max_latency=section.getfloat("max_latency"),
+            max_pending=section.getint("max_pending"),
+            inotify=section.getboolean("inotify"),
+        )
+        if settings.batch_size < 1:
+            raise ValueError("watch.batch_size must be a positive integer")
+        if settings.max_pending < settings.batch_size:
+            raise ValueError("watch.max_pending must be at least watch.batch_size")
+        if settings.poll_interval <= 0:
+            raise ValueError("watch.poll_interval must be positive")
+        return settings
+
+
+class _Inotify:
+    # wakes the watcher up on changes in the watched directories and tells
+    # it which directories to scan again
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # directory -> watch descriptor and back
+        self.watched = {}
+        self.directories = {}
+        # True once a directory could not be watched or events were lost,
+        # from then on every wake up scans all directories
+        self.incomplete = False
+
+    def add(self, directory: str):
+        if directory in self.watched:
+            return
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), _INOTIFY_MASK
+        )
+        if wd < 0:
+            # e.g. fs.inotify.max_user_watches reached, the full scans find
+            # the files anyway
+            logger.warning(f"cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+            self.incomplete = True
+            return
+        self.watched[directory] = wd
+        self.directories[wd] = directory
+
+    def wait(self, timeout: float):
+        # -> the directories with events, None if all have to be scanned
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        changed = set()
+        if readable:
+            with contextlib.suppress(BlockingIOError):
+                while data := os.read(self.fd, 65536):
+                    for wd, mask in self._events(data):
+                        if mask & _IN_Q_OVERFLOW:
+                            self.incomplete = True
+                        elif mask & _IN_IGNORED:
+                            # the directory was removed
+                            directory = self.directories.pop(wd, None)
+                            self.watched.pop(directory, None)
+                        elif wd in self.directories:
+                            changed.add(self.directories[wd])
+        return None if self.incomplete else changed
+
+    @staticmethod
+    def _events(data: bytes):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size + length
+            yield wd, mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _inotify(settings: _Settings):
+    if not settings.inotify or not sys.platform.startswith("linux"):
+        return None
+    try:
+        return _Inotify()
+    except (OSError, AttributeError) as e:
+        logger.warning(f"inotify is not available ({e}), polling")
+        return None
+
+
+class _Watcher:
+    def __init__(self, directories: list, settings: _Settings, is_done, inotify=None):
+        self.directories = directories
+        self.settings = settings
+        # is_done(path, size, mtime_ns) looks a file up in the databases
+        self.is_done = is_done
+        # directory -> {name: (size, mtime_ns)} of the files already inserted
+        # or failed, only for the files still in the directory
+        self.done = {}
+        # directories to scan again without an event: files not settled yet
+        # or left on disk because of max_pending
+        self.retry = set()
+        self.inotify = inotify
+        # path -> (size, mtime_ns, monotonic time it became ready), in the
+        # order the files became ready
+        self.pending = {}
+        # seconds until the next modified file settles, None if there is none
+        self.next_settled = None
+        # True if ready files were left on disk because of max_pending
+        self.deferred = False
+        self._warned = False
+
+    def scan(self, changed: set = None):
+        # scans the changed directories, all of them if changed is None
+        now = time.time()
+        self.next_settled = None
+        self.deferred = False
+        retry, self.retry = self.retry, set()
+
+        if changed is None:
+            self.done = {}
+            for directory in self.directories:
+                self._walk(directory, now)
+            return
+
+        for directory in changed | retry:
+            try:
+                entries = list(os.scandir(directory))
+            except (FileNotFoundError, NotADirectoryError):
+                self.done.pop(directory, None)
+                continue
+            self._scan_files(
+                directory, [e.name for e in entries if e.is_file()], now
+            )
+            for entry in entries:
+                if entry.is_dir() and entry.path not in self.inotify.watched:
+                    # created since the last scan
+                    self._walk(entry.path, now)
+
+    def _walk(self, directory: str, now: float):
+        for root, _, files in os.walk(directory):
+            if self.inotify is not None:
+                self.inotify.add(root)
+            self._scan_files(root, files, now)
+
+    def _scan_files(self, root: str, files: list, now: float):
+        names = set(fnmatch.filter(files, self.settings.pattern))
+        done = self.done.setdefault(root, {})
+        for name in done.keys() - names:
+            # removed from the directory
+            del done[name]
+        for name in names:
+            self._check(root, name, now)
+
+    def _check(self, root: str, name: str, now: float):
+        path = os.path.join(root, name)
+        if path in self.pending:
+            return
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        done = self.done[root]
+        if done.get(name) == (st.st_size, st.st_mtime_ns):
+            return
+
+        age = now - st.st_mtime_ns / 1e9
+        if age < self.settings.settle:
+            wait = self.settings.settle - age
+            self.next_settled = min(wait, self.next_settled or wait)
+            self.retry.add(root)
+            return
+
+        if self.is_done(path, st.st_size, st.st_mtime_ns):
+            done[name] = (st.st_size, st.st_mtime_ns)
+            return
+
+        if len(self.pending) >= self.settings.max_pending:
+            # backpressure: ready files beyond the limit stay on disk and are
+            # picked up by a later scan
+            self.deferred = True
+            self.retry.add(root)
+            if not self._warned:
+                logger.warning(
+                    f"{len(self.pending)} files pending (watch.max_pending), "
+                    "inserting is falling behind"
+                )
+                self._warned = True
+            return
+        self._warned = False
+        self.pending[path] = (st.st_size, st.st_mtime_ns, time.monotonic())
+
+    def take(self, n: int) -> list:
+        # -> up to n pending files, oldest first
+        batch = list(itertools.islice(self.pending.items(), n))
+        for path, _ in batch:
+            del self.pending[path]
+        return [(path, size, mtime_ns) for path, (size, mtime_ns, _) in batch]
+
+    def mark_done(self, files: list):
+        for path, size, mtime_ns in files:
+            root, name = os.path.split(path)
+            self.done.setdefault(root, {})[name] = (size, mtime_ns)
+
+    def latency(self) -> float:
+        # seconds the oldest pending file has been waiting
+        if not self.pending:
+            return 0.0
+        _, _, ready = next(iter(self.pending.values()))
+        return time.monotonic() - ready
+
+
+def _is_done(connections: list, path: str, size: int, mtime_ns: int) -> bool:
+    # recorded in any of the databases (shards)
+    return any(
+        con.execute(
+            "SELECT 1 FROM ingested_files WHERE path=? AND size=? AND mtime_ns=?",
+            (path, size, mtime_ns),
+        ).fetchone()
+        for con in connections
+    )
+
+
+def _record(con, files: list, status: str, error: str = None):
+    # con is a connection or cursor. A file another watcher has recorded
+    # meanwhile violates the primary key, which rolls back the insert of its
+    # solution
+    conflict = "" if status == "ingested" else " OR IGNORE"
+    con.executemany(
+        f"INSERT{conflict} INTO ingested_files(path,size,mtime_ns,status,error,ingested_at) "
+        "VALUES (?,?,?,?,?,?)",
+        (
+            (path, size, mtime_ns, status, error, time.strftime("%Y-%m-%dT%H:%M:%S"))
+            for path, size, mtime_ns in files
+        ),
+    )
+
+
+def _insert_batch(
+    con, batch: list, config, model_file, datacmd_file, **kwargs
+) -> tuple:
+    from pyoptdb.insert import _insert_solutions
+
+    # the records join the transaction _insert_solutions commits or rolls
+    # back, it starts once the model has been built
+    return _insert_solutions(
+        con,
+        config,
+        model_file,
+        datacmd_file,
+        [pathlib.Path(path) for path, _, _ in batch],
+        batch_size=len(batch),
+        record=lambda cur: _record(cur, batch, "ingested"),
+        **kwargs,
+    )
+
+
+def _flush(connection, insert, batch: list, watcher: _Watcher):
+    # insert(con, batch) is _insert_batch with everything else bound
+    con = connection()
+    try:
+        n_solutions, n_rows, seconds = insert(con, batch)
+        print(f"inserted {n_solutions} solution(s), {n_rows} row(s) in {seconds:.3f} s")
+    except Exception as e:
+        con.rollback()
+        logger.warning(f"batch of {len(batch)} failed ({e}), inserting one by one")
+        for entry in batch:
+            try:
+                insert(con, [entry])
+            except sqlite3.IntegrityError:
+                con.rollback()
+                logger.info(f"{entry[0]} has been inserted by another process")
+            except Exception as e:
+                con.rollback()
+                logger.error(f"failed to insert {entry[0]}: {e}")
+                with con:
+                    _record(con, [entry], "failed", f"{type(e).__name__}: {e}")
+    watcher.mark_done(batch)
+
+
+def watch(
+    directories: list,
+    model_file: pathlib.Path,
+    datacmd_file: pathlib.Path,
+    config=None,
+    pattern: str = None,
+    batch_size: int = None,
+    once: bool = False,
+):
+    """Insert the solution files appearing in directories until interrupted
+
+    With once=True, returns once all files present have been inserted.
+    """
+    if config is None:
+        config = _get_config()
+    settings = _Settings.from_config(config, pattern=pattern, batch_size=batch_size)
+
+    directories = [pathlib.Path(d).resolve().as_posix() for d in directories]
+    for directory in directories:
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"{directory} is not a directory")
+    model_file = pathlib.Path(model_file).resolve()
+    if datacmd_file is not None:
+        datacmd_file = pathlib.Path(datacmd_file).resolve()
+    # created once, so the model and data file are hashed once
+    insert = functools.partial(
+        _insert_batch,
+        config=config,
+        model_file=model_file,
+        datacmd_file=datacmd_file,
+        file_archive=Archive.from_config(config),
+        cache=StructureCache.from_config(config),
+    )
+
+    with contextlib.ExitStack() as stack:
+        # one connection per database, with sqlite3.shard per shard
+        connections = {}
+        # the databases the files are looked up in: the shards present at
+        # the start and the ones inserted into since
+        lookups = {
+            dbfile: stack.enter_context(contextlib.closing(_connect(dbfile, config)))
+            for _, dbfile in shards(config)
+        }
+
+        def connection():
+            dbfile = _route(config, model_file)
+            if dbfile not in connections:
+                con = stack.enter_context(
+                    contextlib.closing(
+                        _connect(dbfile, config, isolation_level="IMMEDIATE")
+                    )
+                )
+                _check_schema_version(con)
+                connections[dbfile] = con
+                lookups.setdefault(dbfile, con)
+            return connections[dbfile]
+
+        connection()
+        inotify = _inotify(settings)
+        if inotify is not None:
+            stack.callback(inotify.close)
+
+        watcher = _Watcher(
+            directories,
+            settings,
+            lambda *file: _is_done(lookups.values(), *file),
+            inotify,
+        )
+        logger.info(
+            f"watching {', '.join(directories)} for {settings.pattern} "
+            f"({'inotify' if inotify is not None else 'polling'})"
+        )
+
+        # the first scan and every scan when polling cover all directories
+        changed = None
+        while True:
+            watcher.scan(changed)
+            changed = None if inotify is None else set()
+
+            while len(watcher.pending) >= settings.batch_size or (
+                watcher.pending
+                and (
+                    watcher.latency() >= settings.max_latency
+                    or (once and watcher.next_settled is None)
+                )
+            ):
+                batch = watcher.take(settings.batch_size)
+                _flush(connection, insert, batch, watcher)
+
+            if watcher.deferred:
+                # scan again right away for the files left on disk
+                continue
+            if once and watcher.next_settled is None and not watcher.pending:
+                return
+
+            # sleep until the next file settles or the pending batch is due
+            timeouts = [watcher.next_settled]
+            if watcher.pending:
+                timeouts.append(settings.max_latency - watcher.latency())
+            if inotify is None:
+                timeouts.append(settings.poll_interval)
+            timeouts = [max(t, 0.01) for t in timeouts if t is not None]
+            timeout = min(timeouts) if timeouts else None
+
+            if inotify is not None:
+                changed = inotify.wait(timeout)
+            else:
+                time.sleep(timeout)
+
+
+def _watch(args):
+    try:
+        watch(
+            args.DIRECTORIES,
+            args.MODEL,
+            args.DATA,
+            pattern=args.PATTERN,
+            batch_size=args.BATCH_SIZE,
+            once=args.ONCE,
+        )
+    except KeyboardInterrupt:
+        # batches are committed as a whole, nothing is left half-inserted
+        logger.info("stopped")
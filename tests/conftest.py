@@ -0,0 +1,133 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Every test runs in its own directory, with its own .pyoptdb and global
+# configuration. The models are in tests/models; solution files are written
+# by the `solution` fixture in the format Pyomo writes results in.
+
+import pathlib
+import sys
+
+import pytest
+
+from pyoptdb import CONFIG_FILE, CONFIG_PATH_LOCAL
+from pyoptdb.config import _get_config
+
+MODELS = pathlib.Path(__file__).parent / "models"
+TOY = MODELS / "toy.py"
+TOY_DATA = MODELS / "toy.dat"
+CTOY = MODELS / "ctoy.py"
+
+# label in solution files -> (variable, index string) of the toy models
+TOY_LABELS = {
+    f"x[{i},{t}]": ("x", str((i, t))) for i in ("a", "b", "c d") for t in (1, 2, 3)
+}
+TOY_LABELS["y"] = ("y", "None")
+
+
+def toy_values(k: float) -> dict:
+    # distinct values of every label for solution k
+    return {label: k + n / 2 for n, label in enumerate(TOY_LABELS)}
+
+
+def stored_values(con, solution_id: int) -> dict:
+    # -> (variable, index string) -> value, whatever the storage mode
+    pytest.importorskip("numpy")
+    from pyoptdb.query import _var_values
+
+    values = {}
+    for var_id, var_name in con.execute("SELECT var_id, var_name FROM variables"):
+        index_strs, _, array = _var_values(con, var_id, solution_id)
+        values.update(
+            ((var_name, index_str), value)
+            for index_str, value in zip(index_strs, array.tolist())
+        )
+    return values
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("pyoptdb.config.CONFIG_PATH_GLOBAL", tmp_path / "home")
+    return tmp_path
+
+
+@pytest.fixture
+def configure(workspace):
+    def configure(**options):
+        # section_option=value, e.g. sqlite3_storage="columnar"; written to
+        # the local configuration file and returned
+        config = _get_config()
+        for key, value in options.items():
+            section, option = key.split("_", 1)
+            config[section][option] = str(value)
+        CONFIG_PATH_LOCAL.mkdir(exist_ok=True)
+        with open(CONFIG_PATH_LOCAL / CONFIG_FILE, "w") as f:
+            config.write(f)
+        return config
+
+    return configure
+
+
+@pytest.fixture
+def database(configure):
+    from pyoptdb.init import _init
+
+    configure()
+    _init()
+    return CONFIG_PATH_LOCAL / "pyoptdb.sqlite3"
+
+
+@pytest.fixture
+def pyoptdb(workspace, monkeypatch):
+    from pyoptdb.cli import main
+
+    def pyoptdb(*args):
+        monkeypatch.setattr(sys, "argv", ["pyoptdb", *map(str, args)])
+        main()
+
+    return pyoptdb
+
+
+@pytest.fixture
+def solution(workspace):
+    def solution(
+        name: str, values: dict, objective: float = 0.0, status: str = "optimal"
+    ) -> pathlib.Path:
+        path = workspace / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [
+            "Solver: ",
+            "- Status: ok",
+            "  Message: done",
+            f"  Termination condition: {status}",
+            "  Time: 0.0",
+            "Solution: ",
+            "- number of solutions: 1",
+            "  number of solutions displayed: 1",
+            "- Gap: None",
+            f"  Status: {status}",
+            "  Objective:",
+            "    obj:",
+            f"      Value: {objective}",
+            "  Variable:",
+        ]
+        for label, value in values.items():
+            lines += [f"    {label}:", f"      Value: {value}"]
+        lines.append("  Constraint: No values")
+        path.write_text("\n".join(lines) + "\n")
+        return path
+
+    return solution
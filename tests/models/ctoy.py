@@ -0,0 +1,29 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# The concrete counterpart of toy.py, inserted without a data file.
+
+import pyomo.environ as pyo
+
+
+def pyomo_create_model():
+    m = pyo.ConcreteModel(name="ctoy")
+    m.I = pyo.Set(initialize=["a", "b", "c d"])
+    m.T = pyo.Set(initialize=[1, 2, 3])
+    m.c = pyo.Param(m.I, initialize={"a": 1, "b": 2, "c d": 3})
+    m.x = pyo.Var(m.I, m.T, within=pyo.NonNegativeReals)
+    m.y = pyo.Var()
+    m.obj = pyo.Objective(expr=sum(m.c[i] * m.x[i, t] for i in m.I for t in m.T) + m.y)
+    return m
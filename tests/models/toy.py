@@ -0,0 +1,32 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# An abstract model with its data in toy.dat, used by most tests.
+
+import pyomo.environ as pyo
+
+
+def pyomo_create_model():
+    m = pyo.AbstractModel(name="toy", doc="toy model")
+    m.I = pyo.Set(doc="items")
+    m.T = pyo.Set(doc="times")
+    m.c = pyo.Param(m.I, doc="cost")
+    m.d = pyo.Param(m.I, m.T, doc="demand")
+    m.x = pyo.Var(m.I, m.T, within=pyo.NonNegativeReals, doc="flow")
+    m.y = pyo.Var(doc="scalar")
+    m.obj = pyo.Objective(
+        expr=lambda m: sum(m.c[i] * m.x[i, t] for i in m.I for t in m.T) + m.y
+    )
+    return m
@@ -0,0 +1,73 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import os
+import sqlite3
+import stat
+
+import pytest
+
+from pyoptdb.archive import Archive, open_file
+from tests.conftest import TOY, TOY_DATA, toy_values
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "bz2", "lzma"])
+def test_store_and_open(workspace, compression):
+    archive = Archive(workspace / "files", compression=compression)
+    archive.directory.mkdir()
+    src = workspace / "a.txt"
+    src.write_text("content\n" * 1000)
+
+    checksum = archive.checksum(src)
+    location = archive.store(src, checksum)
+    assert archive.store(src, checksum) == location
+    assert len(list(archive.directory.iterdir())) == 1
+
+    with contextlib.closing(sqlite3.connect(":memory:")) as con:
+        con.execute(
+            "CREATE TABLE files(file_id INTEGER, file_location TEXT, compression TEXT)"
+        )
+        con.execute("INSERT INTO files VALUES (1,?,?)", (str(location), compression))
+        with open_file(con, 1) as f:
+            assert f.read() == src.read_bytes()
+
+
+def test_unknown_compression(workspace):
+    with pytest.raises(ValueError, match="archive.compression"):
+        Archive(workspace, compression="zip")
+
+
+def test_hardlinks_are_read_only(workspace):
+    archive = Archive(workspace / "files", hardlink=True)
+    archive.directory.mkdir()
+    src = workspace / "a.txt"
+    src.write_text("content")
+
+    location = archive.store(src, archive.checksum(src))
+    assert os.stat(location).st_ino == os.stat(src).st_ino
+    assert not os.stat(src).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def test_files_are_archived_once(database, pyoptdb, solution):
+    # the same solution file under two names is stored once, linked twice
+    sol0 = solution("sol0.yml", toy_values(0))
+    sol1 = solution("copy/sol0.yml", toy_values(0))
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, sol0, sol1)
+
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert con.execute("SELECT COUNT(*) FROM files").fetchone() == (3,)
+        assert con.execute("SELECT COUNT(*) FROM solution_has_file").fetchone() == (2,)
+    assert len(os.listdir(".pyoptdb/.files")) == 3
@@ -0,0 +1,51 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# The benchmark scripts at a tiny scale, so that they keep working.
+
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+BENCHMARKS = pathlib.Path(__file__).parents[1] / "benchmarks"
+
+
+@pytest.mark.parametrize("storage", ["rows", "columnar", "delta"])
+def test_suite(workspace, storage):
+    pytest.importorskip("numpy")
+    subprocess.run(
+        [
+            sys.executable,
+            BENCHMARKS / "suite.py",
+            "--entries",
+            "20",
+            "--solutions",
+            "2",
+            "--storage",
+            storage,
+            "--output",
+            "results.json",
+        ],
+        cwd=workspace,
+        check=True,
+        capture_output=True,
+    )
+    (result,) = json.loads((workspace / "results.json").read_text())["results"]
+    assert result["storage"] == storage
+    assert set(result["phases"]) == {"init", "insert", "reinsert"}
+    assert result["database_bytes"] > 0
@@ -0,0 +1,62 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import os
+import subprocess
+import sys
+
+# runs in a fresh interpreter, prints whether pyomo got imported
+CHILD = """
+import sys
+from pyoptdb.cli import main
+sys.argv = ["pyoptdb"] + sys.argv[1:]
+main()
+print("PYOMO", any(m.startswith("pyomo") for m in sys.modules))
+"""
+
+
+def _run(workspace, *args):
+    env = dict(os.environ, HOME=str(workspace / "home"))
+    return subprocess.run(
+        [sys.executable, "-c", CHILD, *args],
+        cwd=workspace,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_import_has_no_side_effects(workspace):
+    env = dict(os.environ, HOME=str(workspace / "home"))
+    subprocess.run(
+        [sys.executable, "-c", "import pyoptdb.cli"], cwd=workspace, env=env, check=True
+    )
+    assert list(workspace.iterdir()) == []
+
+
+def test_commands_do_not_import_pyomo(workspace):
+    _run(workspace, "init")
+    for args in (["config", "--list"], ["migrate"], ["summary"]):
+        assert "PYOMO False" in _run(workspace, *args).stdout
+
+
+def test_log_to_stderr(workspace):
+    result = _run(workspace, "--log-level", "DEBUG", "config", "--list")
+    assert "DEBUG:pyoptdb.config" in result.stderr
+    assert not (workspace / "pyoptdb.log").exists()
+
+    _run(workspace, "--log-level", "DEBUG", "--log-file", "out.log", "config", "--list")
+    assert "DEBUG:pyoptdb.config" in (workspace / "out.log").read_text()
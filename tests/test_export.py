@@ -0,0 +1,105 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import json
+
+import pytest
+
+from tests.conftest import TOY, TOY_DATA, toy_values
+
+np = pytest.importorskip("numpy")
+
+from pyoptdb import query  # noqa: E402
+from pyoptdb.export import MANIFEST, export  # noqa: E402
+
+# the toy model with a non-numeric parameter
+TAGGED = """
+import pyomo.environ as pyo
+
+from toy import pyomo_create_model as toy
+
+
+def pyomo_create_model():
+    m = toy()
+    m.tag = pyo.Param(m.I, within=pyo.Any)
+    return m
+"""
+
+
+@pytest.fixture
+def con(database, pyoptdb, solution):
+    # two solutions of the toy model
+    files = [solution(f"sol{k}.yml", toy_values(k)) for k in range(2)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+    with contextlib.closing(query.connect()) as con:
+        yield con
+
+
+def test_export_npy(con, workspace):
+    manifest = export(con, workspace / "out", [1, 2])
+    assert json.loads((workspace / "out" / MANIFEST).read_text()) == manifest
+    assert manifest["solution_ids"] == [1, 2]
+    assert manifest["data_set_ids"] == [1]
+    assert set(manifest["variables"]) == {"x", "y"}
+    assert set(manifest["parameters"]) == {"c", "d"}
+
+    entry = manifest["variables"]["x"]
+    assert entry["shape"] == [9, 2]
+    index = np.load(workspace / "out" / entry["index"])
+    assert index[0] == str(("a", 1))
+    values = np.load(workspace / "out" / entry["values"], mmap_mode="r")
+    assert values.flags.f_contiguous
+    assert values[:, 0].tolist() == [0.0 + n / 2 for n in range(9)]
+    assert values[:, 1].tolist() == [1.0 + n / 2 for n in range(9)]
+
+    d = np.load(workspace / "out" / manifest["parameters"]["d"]["values"])
+    assert d[:, 0].tolist() == [float(n) for n in range(1, 10)]
+
+
+def test_export_npz(con, workspace):
+    manifest = export(con, workspace / "out", [2], variables=["y"], fmt="npz")
+    assert set(manifest["variables"]) == {"y"}
+    with np.load(workspace / "out" / manifest["npz"]) as npz:
+        assert npz[manifest["variables"]["y"]["values"]].tolist() == [[1.0 + 9 / 2]]
+    # the .npy files are moved into the archive
+    assert sorted(p.name for p in (workspace / "out").iterdir()) == [
+        "export.npz",
+        MANIFEST,
+    ]
+
+
+def test_export_errors(con, workspace):
+    with pytest.raises(ValueError):
+        export(con, workspace / "out", [1], fmt="csv")
+    with pytest.raises(ValueError):
+        export(con, workspace / "out", [])
+    with pytest.raises(KeyError):
+        export(con, workspace / "out", [1, 99])
+    with pytest.raises(KeyError):
+        export(con, workspace / "out", [1], variables=["z"])
+
+
+def test_non_numeric_parameter_is_skipped(database, pyoptdb, solution, workspace):
+    (workspace / "toy.py").write_text(TOY.read_text())
+    (workspace / "tagged.py").write_text(TAGGED)
+    data = workspace / "tagged.dat"
+    data.write_text(TOY_DATA.read_text() + "param tag := a red b green 'c d' blue;\n")
+    pyoptdb("insert", "-m", "tagged.py", "-d", data, solution("sol.yml", toy_values(0)))
+
+    pyoptdb("export", "out")
+    manifest = json.loads((workspace / "out" / MANIFEST).read_text())
+    assert set(manifest["parameters"]) == {"c", "d"}
+    assert not (workspace / "out" / "tag.values.npy").exists()
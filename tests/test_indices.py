@@ -0,0 +1,49 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import sqlite3
+
+import pytest
+
+from pyoptdb.indices import _components, _index_filter, _index_ids, decode_index
+
+
+def test_decode_index():
+    assert decode_index("('a', 1)") == ("a", 1)
+    assert decode_index("3") == 3
+    assert decode_index("c d") == "c d"
+    assert _components("None") == ()
+    assert _components("('c d', 2.5)") == ("c d", 2.5)
+
+
+def test_index_ids_are_interned(database):
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        cur = con.cursor()
+        first = _index_ids(cur, (s for s in ["('a', 1)", "b", "('a', 1)"]), 2)
+        assert first[0] == first[2] != first[1]
+        assert list(_index_ids(cur, ["b"], 2)) == [first[1]]
+
+        components = con.execute(
+            "SELECT position, value, typeof(value) FROM index_components "
+            "WHERE index_id=? ORDER BY position",
+            (first[0],),
+        ).fetchall()
+        assert components == [(0, "a", "text"), (1, 1, "integer")]
+
+
+def test_index_filter_needs_conditions():
+    with pytest.raises(ValueError):
+        _index_filter({})
@@ -0,0 +1,116 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import pathlib
+import sqlite3
+
+import pytest
+
+from pyoptdb.ingest import LOCK_FILE, _exclusive_lock
+from tests.conftest import TOY, TOY_DATA, TOY_LABELS, stored_values, toy_values
+
+SPOOL = pathlib.Path(".pyoptdb/.spool")
+
+
+def _submit(pyoptdb, solution, ks):
+    files = [solution(f"sol{k}.yml", toy_values(k), objective=k) for k in ks]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, "--submit", *files)
+
+
+def _count(database, table: str) -> int:
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_ingest(database, pyoptdb, solution):
+    _submit(pyoptdb, solution, [0, 1])
+    _submit(pyoptdb, solution, [2])
+    assert len(list(SPOOL.glob("*.json"))) == 2
+    assert _count(database, "solutions") == 0
+
+    pyoptdb("ingest", "--once")
+    assert list(SPOOL.glob("*.json")) == []
+    assert _count(database, "ingested_submissions") == 2
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        objectives = con.execute("SELECT objective FROM solutions ORDER BY 1").fetchall()
+        assert objectives == [(0.0,), (1.0,), (2.0,)]
+        expected = {TOY_LABELS[label]: v for label, v in toy_values(2).items()}
+        (solution_id,) = con.execute(
+            "SELECT solution_id FROM solutions WHERE objective=2"
+        ).fetchone()
+        assert stored_values(con, solution_id) == expected
+
+
+def test_broken_submission_fails_alone(database, pyoptdb, solution):
+    _submit(pyoptdb, solution, [0])
+    (SPOOL / "broken.json").write_text("{")
+
+    pyoptdb("ingest", "--once")
+    assert _count(database, "solutions") == 1
+    assert (SPOOL / "failed" / "broken.json").exists()
+    assert "JSONDecodeError" in (SPOOL / "failed" / "broken.json.error").read_text()
+
+
+def test_crash_before_unlink(database, pyoptdb, solution, monkeypatch):
+    # committed, but the submission file was not removed
+    _submit(pyoptdb, solution, [0, 1])
+    unlink = pathlib.Path.unlink
+
+    def crash(self, *args, **kwargs):
+        if self.suffix == ".json":
+            raise KeyboardInterrupt
+        return unlink(self, *args, **kwargs)
+
+    monkeypatch.setattr(pathlib.Path, "unlink", crash)
+    with pytest.raises(KeyboardInterrupt):
+        pyoptdb("ingest", "--once")
+    monkeypatch.setattr(pathlib.Path, "unlink", unlink)
+    assert len(list(SPOOL.glob("*.json"))) == 1
+
+    pyoptdb("ingest", "--once")
+    assert list(SPOOL.glob("*.json")) == []
+    assert _count(database, "solutions") == 2
+
+
+def test_one_ingest_per_spool(database, pyoptdb, solution):
+    _submit(pyoptdb, solution, [0])
+    with _exclusive_lock(SPOOL / LOCK_FILE):
+        with pytest.raises(RuntimeError, match="another `pyoptdb ingest`"):
+            pyoptdb("ingest", "--once")
+    assert _count(database, "solutions") == 0
+
+
+def test_model_is_built_without_the_write_lock(database, pyoptdb, solution, monkeypatch):
+    from pyoptdb import insert
+
+    _submit(pyoptdb, solution, [0])
+    get_model = insert._get_model
+    locked = []
+
+    def check_lock(**kwargs):
+        # another writer gets the lock while the model is built
+        with contextlib.closing(sqlite3.connect(database, timeout=0)) as other:
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                other.rollback()
+            except sqlite3.OperationalError:
+                locked.append(True)
+        return get_model(**kwargs)
+
+    monkeypatch.setattr("pyoptdb.insert._get_model", check_lock)
+    pyoptdb("ingest", "--once")
+    assert locked == []
+    assert _count(database, "ingested_submissions") == 1
@@ -0,0 +1,199 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import logging
+import sqlite3
+
+import pytest
+
+from tests.conftest import CTOY, TOY, TOY_DATA, TOY_LABELS, stored_values, toy_values
+
+def _expected(values: dict) -> dict:
+    return {TOY_LABELS[label]: value for label, value in values.items()}
+
+
+def test_round_trip(database, pyoptdb, solution):
+    files = [solution(f"sol{k}.yml", toy_values(k), objective=k) for k in range(3)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+
+    with sqlite3.connect(database) as con:
+        rows = con.execute(
+            "SELECT solution_id, objective, sol_status FROM solutions ORDER BY solution_id"
+        ).fetchall()
+        assert [(objective, status) for _, objective, status in rows] == [
+            (0.0, "optimal"),
+            (1.0, "optimal"),
+            (2.0, "optimal"),
+        ]
+        for k, (solution_id, _, _) in enumerate(rows):
+            assert stored_values(con, solution_id) == _expected(toy_values(k))
+
+
+def test_missing_labels_are_zero(database, pyoptdb, solution):
+    values = toy_values(1)
+    del values["x[a,1]"]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol.yml", values))
+
+    with sqlite3.connect(database) as con:
+        assert stored_values(con, 1)[("x", "('a', 1)")] == 0.0
+
+
+def test_concrete_model_without_data_file(database, pyoptdb, solution, caplog):
+    pyoptdb("insert", "-m", CTOY, solution("sol0.yml", toy_values(0)))
+    with caplog.at_level(logging.DEBUG, logger="pyoptdb.insert"):
+        pyoptdb("insert", "-m", CTOY, solution("sol1.yml", toy_values(1)))
+    # the second insert matches the stored labels, the model is not built
+    assert "skipping model build" in caplog.text
+
+    with sqlite3.connect(database) as con:
+        assert con.execute("SELECT model_name FROM models").fetchall() == [("ctoy",)]
+        assert con.execute("SELECT COUNT(*) FROM data_sets").fetchone() == (1,)
+        assert stored_values(con, 2) == _expected(toy_values(1))
+
+
+@pytest.mark.parametrize("rebuild", [False, True])
+def test_chunk_size_does_not_change_rows(configure, pyoptdb, solution, rebuild):
+    from pyoptdb.init import _init
+
+    configure(insert_chunk_size=2, insert_batch_size=2)
+    _init()
+    files = [solution(f"sol{k}.yml", toy_values(k)) for k in range(3)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, files[0])
+    args = ["--rebuild"] if rebuild else []
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *args, *files[1:])
+
+    with sqlite3.connect(".pyoptdb/pyoptdb.sqlite3") as con:
+        assert con.execute("SELECT COUNT(*) FROM variable_data").fetchone() == (30,)
+        for k in range(3):
+            assert stored_values(con, k + 1) == _expected(toy_values(k))
+
+
+def test_executemany_chunked_reads_rows_lazily():
+    from pyoptdb.db import _executemany_chunked
+
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE t(a INTEGER, b REAL)")
+    produced = []
+
+    def rows():
+        for n in range(7):
+            produced.append(n)
+            yield n, n / 2
+
+    class Cursor:
+        # records how many rows were produced when each chunk was executed
+        def __init__(self):
+            self.cur, self.seen = con.cursor(), []
+
+        def executemany(self, sql, chunk):
+            self.seen.append((len(produced), len(chunk)))
+            return self.cur.executemany(sql, chunk)
+
+        @property
+        def rowcount(self):
+            return self.cur.rowcount
+
+    cur = Cursor()
+    _executemany_chunked(cur, "INSERT INTO t(a,b) VALUES (?,?)", rows(), 3)
+    assert cur.seen == [(3, 3), (6, 3), (7, 1)]
+    assert con.execute("SELECT COUNT(*), SUM(b) FROM t").fetchone() == (7, 10.5)
+
+
+def test_no_solution_files(database, pyoptdb, workspace):
+    with pytest.raises(ValueError, match="no solution files"):
+        pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, "--manifest", _empty(workspace))
+
+
+def _empty(workspace):
+    path = workspace / "manifest.txt"
+    path.write_text("# nothing\n")
+    return path
+
+
+def test_parallel_parsing(database, pyoptdb, solution):
+    files = [solution(f"sol{k}.yml", toy_values(k), objective=k) for k in range(4)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, "--rebuild", "--jobs", 2, *files)
+
+    with sqlite3.connect(database) as con:
+        # stored in the order of the files
+        rows = con.execute(
+            "SELECT solution_id, objective FROM solutions ORDER BY solution_id"
+        ).fetchall()
+        assert [objective for _, objective in rows] == [0.0, 1.0, 2.0, 3.0]
+        for k, (solution_id, _) in enumerate(rows):
+            assert stored_values(con, solution_id) == _expected(toy_values(k))
+
+
+def test_data_sets_are_deduplicated(database, pyoptdb, solution, workspace):
+    same = workspace / "same.dat"
+    same.write_text("# the values of toy.dat\n" + TOY_DATA.read_text())
+    other = workspace / "other.dat"
+    other.write_text(TOY_DATA.read_text().replace("a 1.0", "a 2.0"))
+
+    for k, data in enumerate([TOY_DATA, same, other]):
+        sol = solution(f"sol{k}.yml", toy_values(k))
+        pyoptdb("insert", "-m", TOY, "-d", data, "--rebuild", sol)
+
+    with sqlite3.connect(database) as con:
+        rows = con.execute(
+            "SELECT s.data_set_id FROM solutions s ORDER BY s.solution_id"
+        ).fetchall()
+        assert rows == [(1,), (1,), (2,)]
+        assert con.execute("SELECT COUNT(*) FROM parameter_data").fetchone() == (24,)
+
+
+def test_manifest_and_glob_batches(database, pyoptdb, solution, workspace):
+    for k in range(5):
+        solution(f"runs/{k}/sol.yml", toy_values(k), objective=k)
+    manifest = workspace / "manifest.txt"
+    manifest.write_text("# runs 3 and 4\nruns/[34]/sol.yml\n")
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, "--batch-size", 2, "runs/[012]/*.yml")
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, "--manifest", manifest)
+
+    with sqlite3.connect(database) as con:
+        objectives = con.execute("SELECT objective FROM solutions ORDER BY 1").fetchall()
+        assert objectives == [(float(k),) for k in range(5)]
+
+
+def test_failing_file_rolls_back_its_batch(database, pyoptdb, solution, workspace):
+    yaml = pytest.importorskip("yaml")
+
+    files = [solution(f"sol{k}.yml", toy_values(k)) for k in range(2)]
+    broken = workspace / "broken.yml"
+    broken.write_text("Solution: [")
+    with pytest.raises(yaml.YAMLError):
+        pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files, broken)
+
+    with sqlite3.connect(database) as con:
+        assert con.execute("SELECT COUNT(*) FROM solutions").fetchone() == (0,)
+
+
+def test_throughput_counts_inserted_solutions(
+    database, pyoptdb, solution, monkeypatch, capsys
+):
+    files = [solution(f"sol{k}.yml", toy_values(k)) for k in range(3)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, "--rebuild", files[0])
+    with sqlite3.connect(database) as con:
+        (stored,) = con.execute("SELECT solution_uuid1 FROM solutions").fetchone()
+
+    # the second file gets the uuid of the stored solution and is ignored
+    uuids = iter([stored, "c0ffee00-0000-1000-8000-000000000000"])
+    monkeypatch.setattr("pyoptdb.insert.uuid.uuid1", lambda: next(uuids))
+    capsys.readouterr()
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files[1:])
+
+    assert "inserted 1 solution(s)" in capsys.readouterr().out
+    with sqlite3.connect(database) as con:
+        assert con.execute("SELECT COUNT(*) FROM solutions").fetchone() == (2,)
@@ -0,0 +1,62 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import json
+
+import pytest
+
+from pyoptdb import instrument
+from tests.conftest import TOY, TOY_DATA, toy_values
+
+
+@pytest.mark.parametrize(
+    "storage, table", [("rows", "variable_data"), ("columnar", "variable_arrays")]
+)
+def test_profile_json(database, configure, pyoptdb, solution, workspace, storage, table):
+    configure(sqlite3_storage=storage)
+    files = [solution(f"sol{k}.yml", toy_values(k)) for k in range(2)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, files[0])
+    pyoptdb(
+        "insert", "-m", TOY, "-d", TOY_DATA, "--profile-json", "profile.json", files[1]
+    )
+
+    profile = json.loads((workspace / "profile.json").read_text())
+    assert {"parse", "insert_solution", "commit"} <= set(profile["phases"])
+    assert profile["counters"]["solutions"] == 1
+    # only the rows of the second insert
+    assert profile["rows"]["solutions"] == 1
+    assert profile["rows"][table] == (10 if storage == "rows" else 2)
+    assert "models" not in profile["rows"]
+    assert profile["rows"]["status_counts"] == 1
+
+
+def test_hook(database, pyoptdb, solution):
+    metrics = []
+    instrument.add_hook(metrics.append)
+    try:
+        pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol.yml", toy_values(0)))
+    finally:
+        instrument.remove_hook(metrics.append)
+
+    (profile,) = metrics
+    assert profile["rows"]["variable_data"] == 10
+    assert profile["sqlite"]["page_count"] > 0
+
+
+def test_off_without_profiling():
+    with instrument.phase("parse"):
+        instrument.count("solutions")
+        instrument.count_rows("solutions", 1)
+    assert instrument._profile is None
@@ -0,0 +1,115 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import sqlite3
+
+import pytest
+
+from pyoptdb.init import _init
+from pyoptdb.merge import merge
+from tests.conftest import CTOY, TOY, TOY_DATA, stored_values, toy_values
+
+
+def _by_uuid(database) -> dict:
+    # solution uuid -> stored values
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        return {
+            uuid: stored_values(con, solution_id)
+            for solution_id, uuid in con.execute(
+                "SELECT solution_id, solution_uuid1 FROM solutions"
+            )
+        }
+
+
+def _summary(database) -> list:
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        return [
+            sorted(con.execute(f"SELECT * FROM {table}").fetchall())
+            for table in ("variable_stats", "model_stats", "status_counts")
+        ]
+
+
+@pytest.fixture
+def nodes(workspace, configure, pyoptdb, solution, monkeypatch, request):
+    # two databases written separately, in node1 and node2
+    def node(name, inserts):
+        (workspace / name).mkdir()
+        monkeypatch.chdir(workspace / name)
+        configure(sqlite3_storage=request.param)
+        _init()
+        for args, k in inserts:
+            pyoptdb("insert", *args, solution(f"{name}/sol{k}.yml", toy_values(k)))
+        return workspace / name / ".pyoptdb" / "pyoptdb.sqlite3"
+
+    toy = ("-m", TOY, "-d", TOY_DATA)
+    sources = [
+        node("node1", [(toy, 0), (toy, 1)]),
+        node("node2", [(("-m", CTOY), 2), (toy, 3)]),
+    ]
+    monkeypatch.chdir(workspace)
+    configure(sqlite3_storage=request.param)
+    _init()
+    return sources
+
+
+@pytest.mark.parametrize("nodes", ["rows", "columnar"], indirect=True)
+def test_merge(nodes, pyoptdb, solution, workspace):
+    database = workspace / ".pyoptdb" / "pyoptdb.sqlite3"
+    # ids in the target differ from those in the sources
+    pyoptdb("insert", "-m", CTOY, solution("sol4.yml", toy_values(4)))
+    pyoptdb("merge", *nodes)
+
+    merged = _by_uuid(database)
+    assert len(merged) == 5
+    for source in nodes:
+        assert _by_uuid(source).items() <= merged.items()
+
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert sorted(con.execute("SELECT model_name FROM models")) == [("ctoy",), ("toy",)]
+        # the toy data sets of both nodes are the same
+        assert con.execute("SELECT COUNT(*) FROM data_sets").fetchone() == (2,)
+        locations = [
+            location for (location,) in con.execute("SELECT file_location FROM files")
+        ]
+    # the archived files of the sources are copied
+    assert all((workspace / location).exists() for location in locations)
+
+    summary = _summary(database)
+    pyoptdb("summary", "--rebuild")
+    assert _summary(database) == summary
+
+    # merging again adds nothing
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        counts = merge(con, nodes)
+        assert +counts == {}
+        assert con.execute("SELECT COUNT(*) FROM files").fetchone() == (len(locations),)
+    assert _by_uuid(database) == merged
+
+
+@pytest.mark.parametrize("nodes", ["rows"], indirect=True)
+def test_merge_errors(nodes, workspace):
+    database = workspace / ".pyoptdb" / "pyoptdb.sqlite3"
+    (workspace / "other.sqlite3").touch()
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        with pytest.raises(FileNotFoundError):
+            merge(con, [workspace / "missing.sqlite3"])
+        with pytest.raises(ValueError):
+            merge(con, [database])
+        with pytest.raises(ValueError):
+            merge(con, [workspace / "other.sqlite3"])
+        # only the named model
+        merge(con, nodes, model_names=["ctoy"])
+        assert con.execute("SELECT model_name FROM models").fetchall() == [("ctoy",)]
@@ -0,0 +1,133 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import re
+import sqlite3
+
+import pytest
+
+from pyoptdb import PYOPTDB_DIR
+from pyoptdb.migrate import (
+    MIGRATIONS_DIR,
+    SCHEMA_VERSION,
+    _check_schema_version,
+    _load_migration,
+    _schema_version,
+    _upgrade,
+)
+from tests.conftest import TOY, TOY_DATA, toy_values
+
+
+def _version_0(dbfile):
+    # a database created before the migrations existed
+    dbfile.unlink()
+    with contextlib.closing(sqlite3.connect(dbfile)) as con:
+        con.executescript((PYOPTDB_DIR / "schema.sql").read_text())
+
+
+def test_init_creates_the_current_version(database):
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert _schema_version(con) == SCHEMA_VERSION
+
+
+def test_migrate_version_0(database, pyoptdb, solution, capsys):
+    _version_0(database)
+    sol0 = solution("sol0.yml", toy_values(0))
+    with pytest.raises(RuntimeError, match="pyoptdb migrate"):
+        pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, sol0)
+
+    pyoptdb("migrate")
+    assert f"from version 0 to {SCHEMA_VERSION}" in capsys.readouterr().out
+    pyoptdb("migrate")
+    assert "is up to date" in capsys.readouterr().out
+
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol1.yml", toy_values(1)))
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert con.execute("SELECT COUNT(*) FROM variable_data").fetchone() == (10,)
+        # the unique indexes of migration 1 make repeated rows a no-op
+        con.execute(
+            "INSERT OR IGNORE INTO variable_data(solution_id,var_id,index_str,index_id,value) "
+            "SELECT solution_id,var_id,index_str,index_id,value FROM variable_data"
+        )
+        assert con.execute("SELECT COUNT(*) FROM variable_data").fetchone() == (10,)
+
+
+def test_newer_database_is_refused(database):
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+        with pytest.raises(RuntimeError, match="upgrade pyoptdb"):
+            _check_schema_version(con)
+
+
+def test_failing_migration_is_rolled_back(workspace, monkeypatch):
+    migrations = workspace / "migrations"
+    migrations.mkdir()
+    (migrations / "0001_good.sql").write_text("CREATE TABLE good(a INTEGER);\n")
+    (migrations / "0002_bad.sql").write_text(
+        "CREATE TABLE bad(a INTEGER);\nINSERT INTO missing VALUES (1);\n"
+    )
+    monkeypatch.setattr("pyoptdb.migrate.MIGRATIONS_DIR", migrations)
+
+    with contextlib.closing(sqlite3.connect(workspace / "test.sqlite3")) as con:
+        with pytest.raises(sqlite3.OperationalError):
+            _upgrade(con)
+        assert _schema_version(con) == 1
+        tables = {name for (name,) in con.execute("SELECT name FROM sqlite_master")}
+        assert "good" in tables and "bad" not in tables
+
+
+def _rows(con, table):
+    return sorted(con.execute(f"SELECT * FROM {table}").fetchall())
+
+
+def test_migrations_are_frozen():
+    # a migration keeps working when the package changes later on
+    for path in MIGRATIONS_DIR.glob("*.py"):
+        source = path.read_text()
+        assert not re.search(r"^(from|import) pyoptdb", source, re.M), path.name
+
+
+def test_index_components_migration(database, pyoptdb, solution):
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol0.yml", toy_values(0)))
+
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        components = _rows(con, "index_components")
+        arities = _rows(con, "indices")
+        con.execute("DELETE FROM index_components")
+        con.execute("UPDATE indices SET arity=NULL")
+
+        _load_migration(MIGRATIONS_DIR / "0005_indices.py").upgrade(con)
+        assert _rows(con, "index_components") == components
+        assert _rows(con, "indices") == arities
+
+
+@pytest.mark.parametrize("storage", ["rows", "columnar", "delta"])
+def test_summary_tables_migration(database, configure, pyoptdb, solution, storage):
+    configure(sqlite3_storage=storage)
+    files = [
+        solution(f"sol{k}.yml", toy_values(k), objective=k, status=status)
+        for k, status in enumerate(["optimal", "infeasible", "optimal"])
+    ]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+
+    tables = ["variable_stats", "model_stats", "status_counts"]
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        expected = [_rows(con, table) for table in tables]
+        for table in tables:
+            con.execute(f"DELETE FROM {table}")
+
+        _load_migration(MIGRATIONS_DIR / "0008_summary_tables.py").upgrade(con)
+        assert [_rows(con, table) for table in tables] == expected
@@ -0,0 +1,132 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+
+import pytest
+
+from pyoptdb.config import _get_config
+from pyoptdb.db import _connect
+from pyoptdb.init import _init
+from pyoptdb.prune import (
+    Criteria,
+    _enable_incremental_vacuum,
+    collect_archive,
+    prune,
+    vacuum,
+)
+from tests.conftest import TOY, TOY_DATA, TOY_LABELS, stored_values, toy_values
+
+DATABASE = ".pyoptdb/pyoptdb.sqlite3"
+
+
+def _insert(pyoptdb, solution, objectives: list, statuses: list = None):
+    statuses = statuses or ["optimal"] * len(objectives)
+    files = [
+        solution(f"sol{k}.yml", toy_values(k), objective=objective, status=status)
+        for k, (objective, status) in enumerate(zip(objectives, statuses))
+    ]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+
+
+@contextlib.contextmanager
+def _writer(database):
+    with contextlib.closing(
+        _connect(database, _get_config(), isolation_level="IMMEDIATE")
+    ) as con:
+        yield con
+
+
+def _solution_ids(con) -> list:
+    return [i for (i,) in con.execute("SELECT solution_id FROM solutions ORDER BY 1")]
+
+
+def test_criteria(database, pyoptdb, solution):
+    _insert(pyoptdb, solution, [2, 0, 1, 3], ["optimal", "optimal", "optimal", "infeasible"])
+    with pytest.raises(ValueError):
+        Criteria(keep_best=-1)
+    with pytest.raises(ValueError):
+        Criteria(rank_by="solver")
+
+    with _writer(database) as con:
+        assert prune(con, Criteria()) == 0
+        assert prune(con, Criteria(older_than=1)) == 0
+        assert prune(con, Criteria(status=["infeasible"])) == 1
+        assert prune(con, Criteria(keep_best=1), batch_size=1) == 2
+        assert _solution_ids(con) == [2]
+        # the summary tables follow
+        assert con.execute("SELECT n_solutions FROM model_stats").fetchall() == [(1,)]
+        assert con.execute("SELECT COUNT(*) FROM variable_data").fetchone() == (10,)
+
+
+def test_kept_delta_solutions_are_stored_in_full(database, configure, pyoptdb, solution):
+    configure(sqlite3_storage="delta")
+    base = toy_values(0)
+    values = [base, dict(base, y=10.0), dict(base, y=20.0)]
+    files = [solution(f"sol{k}.yml", v, objective=-k) for k, v in enumerate(values)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+
+    with _writer(database) as con:
+        assert prune(con, Criteria(keep_best=2)) == 1
+        assert con.execute(
+            "SELECT solution_id, base_solution_id FROM solutions ORDER BY 1"
+        ).fetchall() == [(2, None), (3, None)]
+        for solution_id in (2, 3):
+            expected = {TOY_LABELS[label]: v for label, v in values[solution_id - 1].items()}
+            assert stored_values(con, solution_id) == expected
+
+
+def test_collect_archive(database, pyoptdb, solution):
+    _insert(pyoptdb, solution, [0, 1])
+    config = _get_config()
+    assert collect_archive(config) == (0, 0)
+
+    with _writer(database) as con:
+        (n_files,) = con.execute(
+            "SELECT COUNT(*) FROM files WHERE file_location IS NOT NULL"
+        ).fetchone()
+        prune(con, Criteria(keep_best=1))
+        (n_kept,) = con.execute(
+            "SELECT COUNT(*) FROM files WHERE file_location IS NOT NULL"
+        ).fetchone()
+    # the solution file of the pruned solution
+    assert n_kept == n_files - 1
+    n_removed, n_bytes = collect_archive(config, grace=0)
+    assert n_removed == 1 and n_bytes > 0
+    assert collect_archive(config, grace=0) == (0, 0)
+
+
+def test_vacuum(database, pyoptdb, solution):
+    _insert(pyoptdb, solution, list(range(20)))
+    with _writer(database) as con:
+        # a database created before auto_vacuum was set
+        con.execute("PRAGMA auto_vacuum=NONE")
+        con.execute("VACUUM")
+        assert vacuum(con) == 0
+        _enable_incremental_vacuum(con)
+        prune(con, Criteria(keep_best=1))
+        (free,) = con.execute("PRAGMA freelist_count").fetchone()
+        assert free > 0
+        assert vacuum(con, slice_seconds=0.001) == free
+        assert con.execute("PRAGMA freelist_count").fetchone() == (0,)
+
+
+@pytest.mark.parametrize("journal_mode", ["delete", "wal"])
+def test_new_databases_use_incremental_vacuum(configure, journal_mode):
+    configure(sqlite3_journal_mode=journal_mode)
+    _init()
+    with contextlib.closing(_connect(DATABASE, _get_config())) as con:
+        assert con.execute("PRAGMA journal_mode").fetchone() == (journal_mode,)
+        assert con.execute("PRAGMA auto_vacuum").fetchone() == (2,)
@@ -0,0 +1,70 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+
+import pytest
+
+from tests.conftest import TOY, TOY_DATA, toy_values
+
+np = pytest.importorskip("numpy")
+
+from pyoptdb import query  # noqa: E402
+
+
+@pytest.fixture(params=["rows", "columnar"])
+def con(request, database, configure, pyoptdb, solution):
+    # three solutions of the toy model, objectives 2, 0 and 1
+    configure(sqlite3_storage=request.param)
+    files = [
+        solution(f"sol{k}.yml", toy_values(k), objective=(k + 2) % 3) for k in range(3)
+    ]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+    with contextlib.closing(query.connect()) as con:
+        yield con
+
+
+def test_solutions(con):
+    rows = query.solutions(con, model_name="toy")
+    assert [row.objective for row in rows] == [0.0, 1.0, 2.0]
+    assert [row.solution_id for row in query.solutions(con, objective_max=1)] == [2, 3]
+    assert query.solutions(con, status="infeasible") == []
+    with pytest.raises(ValueError):
+        query.solutions(con, order_by="model_name; DROP TABLE solutions")
+
+
+def test_var_matrix(con):
+    matrix, labels = query.var_matrix(con, "x", [1, 3])
+    assert matrix.shape == (2, 9)
+    assert labels[0] == ("a", 1) and labels[-1] == ("c d", 3)
+    assert np.array_equal(matrix[0], [0.0 + n / 2 for n in range(9)])
+    assert np.array_equal(matrix[1], [2.0 + n / 2 for n in range(9)])
+
+    matrix, labels = query.var_matrix(con, "x", [1], where={0: "b", 1: (2, None)})
+    assert labels == [("b", 2), ("b", 3)]
+    assert matrix.tolist() == [[2.0, 2.5]]
+
+
+def test_param_vector(con):
+    values, labels = query.param_vector(con, "c", 1)
+    assert dict(zip(labels, values.tolist())) == {"a": 1.0, "b": 2.5, "c d": 3.0}
+
+
+
+def test_index_ids(con):
+    # typed components: the integer 2 does not match the string "2"
+    ids = query.index_ids(con, {1: 2})
+    assert sorted(query.index_tuples(con, ids)) == [("a", 2), ("b", 2), ("c d", 2)]
+    assert query.index_ids(con, {1: "2"}) == []
@@ -0,0 +1,104 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+
+import pytest
+
+pyo = pytest.importorskip("pyomo.environ")
+
+from pyomo.opt import SolverResults, TerminationCondition  # noqa: E402
+
+from pyoptdb import query, warmstart  # noqa: E402
+from pyoptdb.recorder import Recorder  # noqa: E402
+from tests.conftest import TOY, TOY_DATA, stored_values  # noqa: E402
+from tests.models.toy import pyomo_create_model  # noqa: E402
+
+
+def _results(condition=TerminationCondition.optimal) -> SolverResults:
+    results = SolverResults()
+    results.solver.termination_condition = condition
+    results.solver.message = "ok"
+    results.solver.time = 0.5
+    return results
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_record(database, background):
+    instance = pyomo_create_model().create_instance(str(TOY_DATA))
+    recorded = []
+    with Recorder(TOY, TOY_DATA, background=background, batch_size=2) as recorder:
+        for k in range(3):
+            for n, v in enumerate(instance.x.values()):
+                v.value = k + n / 2
+            instance.y.value = None if k == 2 else k
+            uuid = recorder.record(instance, _results())
+            x = {("x", str(i)): v.value for i, v in instance.x.items()}
+            recorded.append((uuid, pyo.value(instance.obj, exception=False), x))
+        recorder.flush()
+    with pytest.raises(RuntimeError):
+        recorder.record(instance)
+
+    with contextlib.closing(query.connect()) as con:
+        (n,) = con.execute("SELECT COUNT(DISTINCT data_set_id) FROM solutions").fetchone()
+        assert n == 1
+        for uuid, objective, x in recorded:
+            row = warmstart.find_solution(con, uuid=uuid)
+            assert row.sol_status == "optimal" and row.time_seconds == 0.5
+            assert row.objective == objective
+            values = stored_values(con, row.solution_id)
+            assert {key: v for key, v in values.items() if key[0] == "x"} == x
+        # a missing value is recorded as 0
+        assert values[("y", "None")] == 0.0
+
+
+def test_record_is_matched_with_insert(database, pyoptdb, solution):
+    # solutions recorded and inserted from files share the model and data set
+    instance = pyomo_create_model().create_instance(str(TOY_DATA))
+    with Recorder(TOY, TOY_DATA, background=False) as recorder:
+        recorder.record(instance, _results(TerminationCondition.infeasible))
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol0.yml", {"y": 1.0}))
+
+    with contextlib.closing(query.connect()) as con:
+        assert con.execute(
+            "SELECT data_set_id, sol_status FROM solutions ORDER BY solution_id"
+        ).fetchall() == [(1, "infeasible"), (1, "optimal")]
+
+
+def test_settings(database, configure):
+    configure(record_batch_size=0)
+    with pytest.raises(ValueError):
+        Recorder()
+    with pytest.raises(ValueError):
+        Recorder(batch_size=10, max_pending=5)
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_data_changed_within_a_batch(database, background):
+    model = pyo.ConcreteModel(name="mutable")
+    model.I = pyo.Set(initialize=["a", "b"])
+    model.c = pyo.Param(model.I, initialize={"a": 1.0, "b": 2.0}, mutable=True)
+    model.x = pyo.Var(model.I, initialize=0.0)
+
+    with Recorder(background=background, batch_size=2) as recorder:
+        first = recorder.record(model)
+        model.c["a"] = 10.0
+        second = recorder.record(model, data_changed=True)
+
+    with contextlib.closing(query.connect()) as con:
+        for uuid, expected in ((first, [1.0, 2.0]), (second, [10.0, 2.0])):
+            data_set_id = warmstart.find_solution(con, uuid=uuid).data_set_id
+            values, _ = query.param_vector(con, "c", data_set_id)
+            assert values.tolist() == expected
@@ -0,0 +1,134 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import json
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pyoptdb import query  # noqa: E402
+from pyoptdb.config import _get_config  # noqa: E402
+from pyoptdb.db import _connect  # noqa: E402
+from pyoptdb.prune import Criteria, prune  # noqa: E402
+from pyoptdb.serve import Client, Service, _Cache, make_server  # noqa: E402
+from tests.conftest import TOY, TOY_DATA, toy_values  # noqa: E402
+
+
+@pytest.fixture
+def insert(database, pyoptdb, solution):
+    def insert(*ks):
+        files = [solution(f"sol{k}.yml", toy_values(k), objective=k) for k in ks]
+        pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+
+    return insert
+
+
+@pytest.fixture
+def service(database, insert):
+    insert(0, 1)
+    service = Service.from_config()
+    yield service
+    service.close()
+
+
+def _solution_ids(service) -> list:
+    _, body = service.get("/solutions", {})
+    return [row["solution_id"] for row in json.loads(body)]
+
+
+def _cache(service) -> dict:
+    _, body = service.get("/status", {})
+    return json.loads(body)["cache"]
+
+
+def test_cache_is_invalidated(service, insert, database):
+    var = {"name": ["x"], "solution": ["1,2"]}
+    assert _solution_ids(service) == [1, 2]
+    _, body = service.get("/var", var)
+    assert _solution_ids(service) == [1, 2]
+    assert service.get("/var", var)[1] == body
+    assert _cache(service)["hits"] == 2
+
+    # an insert drops the listings, the values of stored solutions stay
+    insert(2)
+    assert _solution_ids(service) == [1, 2, 3]
+    assert service.get("/var", var)[1] == body
+    assert _cache(service)["entries"] == 2
+
+    # a deletion drops everything
+    with contextlib.closing(
+        _connect(database, _get_config(), isolation_level="IMMEDIATE")
+    ) as con:
+        prune(con, Criteria(keep_best=2))
+    assert _solution_ids(service) == [1, 2]
+    assert _cache(service)["entries"] == 1
+    with pytest.raises(KeyError):
+        service.get("/var", {"name": ["x"], "solution": ["3"]})
+
+
+def test_errors(service):
+    with pytest.raises(KeyError):
+        service.get("/tables", {})
+    with pytest.raises(ValueError):
+        service.get("/var", {"name": ["x"]})
+    with pytest.raises(ValueError):
+        service.get("/param", {"name": ["d"], "data_set": ["one"]})
+
+
+def test_lru():
+    cache = _Cache(10)
+    cache.put("a", False, "text/plain", b"aaaa", 0)
+    cache.put("b", True, "text/plain", b"bbbb", 0)
+    cache.get("a")
+    cache.put("c", False, "text/plain", b"cccc", 0)
+    assert cache.get("b") is None and cache.get("a") is not None
+    # computed before an invalidation, not stored
+    cache.invalidate(volatile_only=True)
+    cache.put("d", False, "text/plain", b"d", 0)
+    assert cache.get("d") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_client(service, workspace):
+    socket_path = workspace / "serve.sock"
+    server = make_server(service, socket_path=socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with Client(socket_path=socket_path.as_posix()) as client, contextlib.closing(
+            query.connect()
+        ) as con:
+            assert client.solutions() == query.solutions(con)
+            assert client.model_stats() == query.model_stats(con)
+            assert client.status_counts("toy") == {"optimal": 2}
+
+            matrix, labels = client.var_matrix("x", [1, 2], where={0: "b"})
+            expected, expected_labels = query.var_matrix(con, "x", [1, 2], where={0: "b"})
+            assert np.array_equal(matrix, expected) and labels == expected_labels
+            values, labels = client.param_vector("d", 1)
+            assert values.tolist() == list(range(1, 10))
+            stats, _ = client.variable_stats("y", 1)
+            assert stats["max"].tolist() == [1 + 9 / 2]
+
+            with pytest.raises(KeyError):
+                client.var_matrix("z", [1])
+            with pytest.raises(ValueError):
+                client.solutions(order_by="nothing")
+    finally:
+        server.shutdown()
+        server.server_close()
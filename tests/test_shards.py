@@ -0,0 +1,83 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import pathlib
+
+import pytest
+
+from pyoptdb import shards
+from pyoptdb.config import _get_config
+from pyoptdb.init import _init
+from tests.conftest import CTOY, TOY, TOY_DATA, toy_values
+
+
+@pytest.fixture
+def sharded(configure):
+    configure(sqlite3_shard="model")
+    _init()
+    return _get_config()
+
+
+def test_inserts_are_routed_by_model(sharded, pyoptdb, solution, capsys):
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol0.yml", toy_values(0), objective=1))
+    pyoptdb("insert", "-m", CTOY, solution("sol1.yml", toy_values(1)))
+    pyoptdb("insert", "-m", CTOY, solution("sol2.yml", toy_values(2), objective=-1))
+
+    assert [key for key, _ in shards.shards()] == ["toy", "ctoy"]
+    assert shards.execute("SELECT COUNT(*) FROM solutions") == [("toy", 1), ("ctoy", 2)]
+    best = shards.solutions(limit=2)
+    assert [(key, row.objective) for key, row in best] == [("ctoy", -1.0), ("ctoy", 0.0)]
+    with pytest.raises(KeyError):
+        shards.connect("missing")
+
+    capsys.readouterr()
+    pyoptdb("shards")
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split("\t")[0] for line in lines] == ["toy", "ctoy"]
+    assert [line.split("\t")[-1] for line in lines] == ["1", "2"]
+
+    pyoptdb("shards", "--drop", "toy")
+    assert [key for key, _ in shards.shards()] == ["ctoy"]
+    assert not shards._shard_file(sharded, "toy").exists()
+
+
+def test_orphan_shard_is_adopted(sharded, pyoptdb, solution):
+    from pyoptdb.init import _create_database
+
+    # left behind by a process that died before its catalog row was committed
+    orphan = shards._shard_file(sharded, "toy")
+    orphan.parent.mkdir(parents=True, exist_ok=True)
+    _create_database(orphan, sharded)
+
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol0.yml", toy_values(0)))
+    assert shards.shards() == [("toy", pathlib.Path(orphan.as_posix()))]
+    assert shards.execute("SELECT COUNT(*) FROM solutions") == [("toy", 1)]
+
+
+def test_foreign_file_is_not_adopted(sharded, pyoptdb, solution):
+    orphan = shards._shard_file(sharded, "toy")
+    orphan.parent.mkdir(parents=True, exist_ok=True)
+    orphan.write_bytes(b"not a database" * 100)
+
+    with pytest.raises(FileExistsError):
+        shards._route(sharded, TOY)
+    assert shards.shards() == []
+    assert orphan.read_bytes() == b"not a database" * 100
+
+
+def test_without_sharding(database):
+    assert shards.shards() == [(None, database)]
+    with pytest.raises(ValueError):
+        shards._drop(_get_config(), None)
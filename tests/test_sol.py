@@ -0,0 +1,89 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import sqlite3
+
+import pytest
+
+from pyoptdb.sol import is_ampl_sol, read_ampl_sol, read_solution
+from tests.conftest import TOY, TOY_DATA, TOY_LABELS, stored_values, toy_values
+
+# 4 primal values, written for the variables in amp.col
+AMPL_SOL = """Ipopt 3.14: Optimal Solution Found
+
+Options
+3
+1
+1
+0
+2
+2
+4
+4
+0.5
+0.25
+1.0
+2.0
+3.0
+4.0
+objno 0 0
+"""
+AMPL_COL = "x[a,1]\nx[a,2]\nx[b,1]\ny\n"
+
+
+@pytest.fixture
+def ampl_sol(workspace):
+    path = workspace / "amp.sol"
+    path.write_text(AMPL_SOL)
+    (workspace / "amp.col").write_text(AMPL_COL)
+    return path
+
+
+def test_read_ampl_sol(ampl_sol):
+    assert is_ampl_sol(ampl_sol)
+    solution = read_ampl_sol(ampl_sol)
+    assert solution.status == "optimal"
+    assert solution.message == "Ipopt 3.14: Optimal Solution Found"
+    assert solution.values == {"x[a,1]": 1.0, "x[a,2]": 2.0, "x[b,1]": 3.0, "y": 4.0}
+
+
+def test_read_ampl_sol_needs_col_file(ampl_sol):
+    (ampl_sol.parent / "amp.col").unlink()
+    with pytest.raises(FileNotFoundError, match="symbolic_solver_labels"):
+        read_ampl_sol(ampl_sol)
+
+
+def test_read_results(solution):
+    path = solution("sol.yml", toy_values(2), objective=7.5)
+    assert not is_ampl_sol(path)
+    parsed = read_solution(path)
+    assert (parsed.status, parsed.objective) == ("optimal", 7.5)
+    assert parsed.values == toy_values(2)
+
+
+@pytest.mark.parametrize("rebuild", [False, True])
+def test_ampl_sol_with_and_without_model(database, pyoptdb, solution, ampl_sol, rebuild):
+    # the labelled path (no model) stores the same values as the model
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol.yml", toy_values(0)))
+    args = ["--rebuild"] if rebuild else []
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *args, ampl_sol)
+
+    expected = {key: 0.0 for key in TOY_LABELS.values()}
+    for label, value in read_ampl_sol(ampl_sol).values.items():
+        expected[TOY_LABELS[label]] = value
+    with sqlite3.connect(database) as con:
+        assert stored_values(con, 2) == expected
+        status = con.execute("SELECT sol_status FROM solutions WHERE solution_id=2")
+        assert status.fetchone() == ("optimal",)
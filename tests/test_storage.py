@@ -0,0 +1,84 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import sqlite3
+
+import pytest
+
+from pyoptdb.storage import pack, unpack
+from tests.conftest import TOY, TOY_DATA, TOY_LABELS, stored_values, toy_values
+
+
+def _expected(values: dict) -> dict:
+    return {TOY_LABELS[label]: value for label, value in values.items()}
+
+
+def _insert(pyoptdb, solution, values: list, rebuild: bool = False):
+    files = [solution(f"sol{k}.yml", v) for k, v in enumerate(values)]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *(["--rebuild"] if rebuild else []), *files)
+
+
+def test_pack_round_trip():
+    values = [0.0, -1.5, 2.25, 1e300]
+    assert list(unpack(pack(values))) == values
+    with pytest.raises(TypeError):
+        pack(["a"])
+
+
+@pytest.mark.parametrize("rebuild", [False, True])
+def test_columnar(database, configure, pyoptdb, solution, rebuild):
+    configure(sqlite3_storage="columnar")
+    values = [toy_values(k) for k in range(3)]
+    _insert(pyoptdb, solution, values[:1])
+    _insert(pyoptdb, solution, values[1:], rebuild=rebuild)
+
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert con.execute("SELECT COUNT(*) FROM variable_data").fetchone() == (0,)
+        # one array per variable and solution; x shares its index dictionary
+        # with the parameter d
+        assert con.execute("SELECT COUNT(*) FROM variable_arrays").fetchone() == (6,)
+        assert con.execute("SELECT COUNT(*) FROM index_dicts").fetchone() == (3,)
+        assert con.execute("SELECT COUNT(*) FROM parameter_arrays").fetchone() == (2,)
+        for k in range(3):
+            assert stored_values(con, k + 1) == _expected(values[k])
+
+
+def test_delta(database, configure, pyoptdb, solution):
+    configure(sqlite3_storage="delta", sqlite3_delta_tolerance=0.01)
+    base = toy_values(0)
+    small = dict(base, y=100.0)
+    within_tolerance = dict(base, y=base["y"] + 0.001)
+    full = toy_values(1)
+    after_full = dict(full, **{"x[a,1]": -1.0})
+    values = [base, small, within_tolerance, full, after_full]
+    _insert(pyoptdb, solution, values)
+
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert con.execute(
+            "SELECT s.solution_id, s.base_solution_id, COUNT(d.solution_id) "
+            "FROM solutions s LEFT JOIN variable_data d USING (solution_id) "
+            "GROUP BY s.solution_id ORDER BY s.solution_id"
+        ).fetchall() == [(1, None, 10), (2, 1, 1), (3, 1, 0), (4, None, 10), (5, 4, 1)]
+        for k, v in enumerate(values):
+            if v is within_tolerance:
+                v = base
+            assert stored_values(con, k + 1) == _expected(v)
+
+
+def test_delta_settings(database, configure, pyoptdb, solution):
+    configure(sqlite3_storage="delta", sqlite3_delta_max_changes=2)
+    with pytest.raises(ValueError):
+        _insert(pyoptdb, solution, [toy_values(0)])
@@ -0,0 +1,154 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import os
+import pickle
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+from pyoptdb.structure import StructureCache, _extract_structure
+from tests.conftest import MODELS, TOY, TOY_DATA, TOY_LABELS, stored_values, toy_values
+
+
+def _instance(data_file):
+    sys.path.append(str(MODELS))
+    import toy
+
+    return toy.pyomo_create_model().create_instance(str(data_file))
+
+
+@pytest.fixture
+def instance():
+    return _instance(TOY_DATA)
+
+
+def test_extract_structure(instance, workspace):
+    structure = _extract_structure(instance)
+    assert structure.name == "toy"
+    assert [p.name for p in structure.params] == ["c", "d"]
+    assert {"I", "T"} <= {s.name for s in structure.sets}
+    assert [v.name for v in structure.vars] == ["x", "y"]
+
+    # the same values give the same checksum, other values another one
+    data = workspace / "toy.dat"
+    data.write_text("# same values\n" + TOY_DATA.read_text())
+    assert _extract_structure(_instance(data)).data_checksum == structure.data_checksum
+    data.write_text(TOY_DATA.read_text().replace("a 1.0", "a 2.0"))
+    assert _extract_structure(_instance(data)).data_checksum != structure.data_checksum
+
+
+def test_cache(workspace, instance):
+    cache = StructureCache(workspace / "cache", max_size=2**20)
+    structure = _extract_structure(instance)
+    assert cache.get("m", "d") is None
+    cache.put("m", "d", structure, instance)
+    cached = cache.get("m", "d")
+    assert cached.structure == structure
+    assert {"c", "d", "I", "T", "x", "y"} <= set(cached.components)
+    assert cached.components["c"] == {"a": 1.0, "b": 2.5, "c d": 3}
+    assert list(cached.components["T"]) == [1, 2, 3]
+    assert cached.components["x"].name == "x"
+    assert cached.components["x"][("c d", 3)].name == "x[c d,3]"
+
+
+def test_corrupt_entries_are_removed(workspace, instance):
+    cache = StructureCache(workspace / "cache", max_size=2**20)
+    for content in (b"not a pickle", pickle.dumps(_extract_structure(instance))):
+        cache.put("m", "d", _extract_structure(instance), instance)
+        # garbage, or an entry without its end
+        cache._path("m", "d").write_bytes(content)
+        assert cache.get("m", "d") is None
+        assert not cache._path("m", "d").exists()
+
+
+def test_eviction(workspace, instance):
+    structure = _extract_structure(instance)
+    cache = StructureCache(workspace / "cache", max_size=2**20)
+    cache.put("m", "old", structure, instance)
+    size = cache._path("m", "old").stat().st_size
+    os.utime(cache._path("m", "old"), (0, 0))
+
+    # room for one entry: the least recently used one goes
+    cache.max_size = size
+    cache.put("m", "new", structure, instance)
+    assert cache.get("m", "old") is None
+    assert cache.get("m", "new").structure == structure
+
+
+def _fail(*args, **kwargs):
+    raise AssertionError("the model was built")
+
+
+@pytest.mark.parametrize("storage", ["rows", "columnar", "delta"])
+def test_insert_uses_the_cache(database, configure, pyoptdb, solution, monkeypatch, storage):
+    from pyoptdb.init import _init
+
+    configure(sqlite3_storage=storage)
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol0.yml", toy_values(0)))
+    with sqlite3.connect(database) as con:
+        expected = _data_rows(con)
+
+    # a new database: the data set is inserted from the cached copy and the
+    # solution file matched against its labels, the model is not built
+    database.unlink()
+    shutil.rmtree(".pyoptdb/.files")
+    _init()
+    monkeypatch.setattr("pyoptdb.insert._get_model", _fail)
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol1.yml", toy_values(1)))
+
+    with sqlite3.connect(database) as con:
+        assert _data_rows(con) == expected
+        assert stored_values(con, 1) == {
+            TOY_LABELS[label]: value for label, value in toy_values(1).items()
+        }
+
+
+def test_rebuild_bypasses_the_cache(database, pyoptdb, solution, monkeypatch):
+    from pyoptdb import insert
+
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol0.yml", toy_values(0)))
+    calls = []
+
+    def get_model(**kwargs):
+        calls.append(kwargs)
+        return _get_model(**kwargs)
+
+    _get_model = insert._get_model
+    monkeypatch.setattr("pyoptdb.insert._get_model", get_model)
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol1.yml", toy_values(1)))
+    assert calls == []
+    pyoptdb(
+        "insert", "-m", TOY, "-d", TOY_DATA, "--rebuild", solution("sol2.yml", toy_values(2))
+    )
+    assert len(calls) == 1
+
+
+def _data_rows(con) -> list:
+    # the rows of the data set, without ids
+    return [
+        sorted(con.execute(sql).fetchall())
+        for sql in (
+            "SELECT param_name, index_dict_id, value_array FROM parameter_arrays "
+            "JOIN parameters USING (param_id)",
+            "SELECT param_name, index_str, value FROM parameter_data "
+            "JOIN parameters USING (param_id)",
+            "SELECT set_name, value FROM set_data JOIN sets USING (set_id)",
+            "SELECT var_name, index_str, label FROM variable_labels "
+            "JOIN variables USING (var_id)",
+        )
+    ]
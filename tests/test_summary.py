@@ -0,0 +1,69 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import sqlite3
+
+import pytest
+
+from pyoptdb import query
+from pyoptdb.query import ModelStats
+from tests.conftest import TOY, TOY_DATA, toy_values
+
+TABLES = ("variable_stats", "model_stats", "status_counts")
+
+
+def _tables(database) -> dict:
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        return {
+            table: sorted(con.execute(f"SELECT * FROM {table}").fetchall())
+            for table in TABLES
+        }
+
+
+@pytest.mark.parametrize("storage", ["rows", "columnar", "delta"])
+def test_incremental_equals_rebuild(database, configure, pyoptdb, solution, storage):
+    configure(sqlite3_storage=storage)
+    statuses = ["optimal", "optimal", "infeasible", "optimal"]
+    files = [
+        solution(f"sol{k}.yml", toy_values(k), objective=3 - k, status=status)
+        for k, status in enumerate(statuses)
+    ]
+    # two batches, the second one adds to the rows of the first
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files[:2])
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files[2:])
+
+    incremental = _tables(database)
+    pyoptdb("summary", "--rebuild")
+    assert _tables(database) == incremental
+
+    with contextlib.closing(query.connect()) as con:
+        assert query.model_stats(con) == [ModelStats("toy", 4, 0.0, 4, 3.0, 1)]
+        assert query.status_counts(con) == {"optimal": 3, "infeasible": 1}
+        pytest.importorskip("numpy")
+        stats, labels = query.variable_stats(con, "x", 1)
+        assert labels[0] == ("a", 1)
+        assert stats["n"].tolist() == [4] * 9
+        assert stats["min"][0] == 0.0 and stats["max"][0] == 3.0
+        assert stats["mean"][0] == pytest.approx(1.5)
+
+
+def test_summary_output(database, pyoptdb, solution, capsys):
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, solution("sol0.yml", toy_values(0)))
+    capsys.readouterr()
+    pyoptdb("summary")
+    out = capsys.readouterr().out
+    assert out.startswith("toy: 1 solution(s)")
+    assert "\toptimal: 1" in out
@@ -0,0 +1,90 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+
+import pytest
+
+pyo = pytest.importorskip("pyomo.environ")
+pytest.importorskip("numpy")
+
+from pyoptdb import query, warmstart  # noqa: E402
+from tests.conftest import TOY, TOY_DATA, toy_values  # noqa: E402
+from tests.models.toy import pyomo_create_model  # noqa: E402
+
+
+@pytest.fixture
+def con(database, pyoptdb, solution):
+    # objectives 1, 0 and 2
+    files = [
+        solution(f"sol{k}.yml", toy_values(k), objective=objective)
+        for k, objective in enumerate([1, 0, 2])
+    ]
+    pyoptdb("insert", "-m", TOY, "-d", TOY_DATA, *files)
+    with contextlib.closing(query.connect()) as con:
+        yield con
+
+
+def _instance():
+    return pyomo_create_model().create_instance(str(TOY_DATA))
+
+
+def test_find_solution(con):
+    assert warmstart.find_solution(con, model_name="toy").solution_id == 2
+    assert warmstart.find_solution(con, maximize=True).solution_id == 3
+    assert warmstart.find_solution(con, select="latest").solution_id == 3
+    uuid = warmstart.find_solution(con, solution_id=1).solution_uuid1
+    assert warmstart.find_solution(con, uuid=uuid).solution_id == 1
+    with pytest.raises(KeyError):
+        warmstart.find_solution(con, model_name="toy", status="infeasible")
+    with pytest.raises(ValueError):
+        warmstart.find_solution(con, select="first")
+
+
+def test_load_solution(con):
+    instance = _instance()
+    loader = warmstart.Loader(instance)
+    assert loader.load_solution(con, 1) == 10
+    assert instance.x["c d", 3].value == 0.0 + 8 / 2
+    assert instance.y.value == 0.0 + 9 / 2
+
+    assert loader.load_solution(con, 3, variables=["y"], fix=True) == 1
+    assert instance.y.value == 2.0 + 9 / 2 and instance.y.fixed
+    assert not instance.x["a", 1].fixed
+    with pytest.raises(KeyError):
+        loader.load_solution(con, 3, variables=["z"])
+
+
+def test_warm_start(con):
+    instance = _instance()
+    assert warmstart.warm_start(instance, con, same_data=True).solution_id == 2
+    assert instance.x["a", 1].value == 1.0
+
+    other = pyomo_create_model().create_instance(
+        data={None: {"I": {None: ["a"]}, "T": {None: [1]}, "c": {"a": 1}, "d": {("a", 1): 1}}}
+    )
+    with pytest.raises(KeyError):
+        warmstart.warm_start(other, con, same_data=True)
+
+
+def test_load_params(con):
+    model = pyo.ConcreteModel(name="toy")
+    model.I = pyo.Set(initialize=["a", "b", "c d"])
+    model.c = pyo.Param(model.I, initialize=0, mutable=True)
+    model.fixed = pyo.Param(initialize=1)
+    assert warmstart.load_params(model, con, 1) == 3
+    assert [pyo.value(model.c[i]) for i in model.I] == [1.0, 2.5, 3.0]
+    with pytest.raises(ValueError):
+        warmstart.load_params(model, con, 1, params=["fixed"])
@@ -0,0 +1,151 @@
+"""Copyright 2024 Technical University Darmstadt
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import contextlib
+import os
+import sqlite3
+
+import pytest
+
+from pyoptdb.config import _get_config
+from pyoptdb.watch import _INOTIFY_EVENT, _Inotify, _Settings, _Watcher, watch
+from tests.conftest import CTOY, TOY, TOY_DATA, toy_values
+
+
+@pytest.fixture
+def run(database, configure):
+    # one pass over the directory "in", like `pyoptdb watch --once`
+    configure(watch_settle=0, watch_pattern="*.yml")
+
+    def run(**kwargs):
+        watch(["in"], TOY, TOY_DATA, config=_get_config(), once=True, **kwargs)
+        with contextlib.closing(sqlite3.connect(database)) as con:
+            return con.execute(
+                "SELECT path, status FROM ingested_files ORDER BY path"
+            ).fetchall()
+
+    return run
+
+
+def test_files_are_inserted_once(run, solution, workspace, database):
+    solution("in/sol0.yml", toy_values(0))
+    solution("in/sub/sol1.yml", toy_values(1))
+    (workspace / "in" / "notes.txt").write_text("ignored")
+    first = run()
+    assert first == [
+        ((workspace / "in" / name).as_posix(), "ingested")
+        for name in ("sol0.yml", "sub/sol1.yml")
+    ]
+
+    assert run() == first
+    solution("in/sub/sub/sol2.yml", toy_values(2))
+    (workspace / "in" / "broken.yml").write_text("Solution: [")
+    assert len(run()) == 4
+    assert len(run()) == 4
+
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert con.execute("SELECT COUNT(*) FROM solutions").fetchone() == (3,)
+        (error,) = con.execute(
+            "SELECT error FROM ingested_files WHERE status='failed'"
+        ).fetchone()
+    assert error
+
+
+def test_modified_file_is_inserted_again(run, solution, workspace):
+    path = solution("in/sol0.yml", toy_values(0))
+    run()
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - 10**9))
+    assert [status for _, status in run()] == ["ingested", "ingested"]
+
+
+def test_missing_directory(run):
+    with pytest.raises(FileNotFoundError):
+        run()
+
+
+class _Directories:
+    # records the directories the watcher asks to watch
+    def __init__(self):
+        self.watched = {}
+
+    def add(self, directory: str):
+        self.watched[directory] = len(self.watched)
+
+
+def test_only_changed_directories_are_scanned(workspace, solution):
+    settings = _Settings("*.yml", 0.0, 1.0, 10, 10.0, 100, True)
+    looked_up = []
+    directories = _Directories()
+    a, b = (workspace / "a").as_posix(), (workspace / "b").as_posix()
+    solution("a/sol0.yml", toy_values(0))
+    solution("b/sol1.yml", toy_values(1))
+
+    def is_done(path, size, mtime_ns):
+        looked_up.append(os.path.relpath(path, workspace))
+        return False
+
+    watcher = _Watcher([a, b], settings, is_done, directories)
+    watcher.scan()
+    assert set(directories.watched) == {a, b}
+    watcher.mark_done(watcher.take(10))
+
+    solution("a/sol2.yml", toy_values(2))
+    solution("b/sol3.yml", toy_values(3))
+    solution("a/new/sol4.yml", toy_values(4))
+    looked_up.clear()
+    watcher.scan({a})
+    # b has no event, the new subdirectory of a is walked and watched
+    assert sorted(looked_up) == ["a/new/sol4.yml", "a/sol2.yml"]
+    assert f"{a}/new" in directories.watched
+
+
+def test_inotify_events():
+    data = b"".join(
+        _INOTIFY_EVENT.pack(wd, mask, 0, len(name)) + name
+        for wd, mask, name in [(1, 0x100, b"sol0.yml\0\0\0\0"), (2, 0x08, b"")]
+    )
+    assert list(_Inotify._events(data)) == [(1, 0x100), (2, 0x08)]
+
+
+def test_concrete_model_without_data_file(database, configure, pyoptdb, solution):
+    configure(watch_settle=0, watch_pattern="*.yml")
+    solution("in/sol0.yml", toy_values(0))
+    pyoptdb("watch", "-m", CTOY, "--once", "in")
+    with contextlib.closing(sqlite3.connect(database)) as con:
+        assert con.execute("SELECT model_name FROM models").fetchall() == [("ctoy",)]
+        assert con.execute("SELECT COUNT(*) FROM solutions").fetchone() == (1,)
+
+
+def test_model_is_built_without_the_write_lock(run, solution, database, monkeypatch):
+    from pyoptdb import insert
+
+    solution("in/sol0.yml", toy_values(0))
+    get_model = insert._get_model
+    locked = []
+
+    def check_lock(**kwargs):
+        # another writer gets the lock while the model is built
+        with contextlib.closing(sqlite3.connect(database, timeout=0)) as other:
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                other.rollback()
+            except sqlite3.OperationalError:
+                locked.append(True)
+        return get_model(**kwargs)
+
+    monkeypatch.setattr("pyoptdb.insert._get_model", check_lock)
+    assert len(run()) == 1
+    assert locked == []